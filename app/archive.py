@@ -0,0 +1,266 @@
+"""Arquivamento (hot/cold) dos casos encerrados e exclusão em lote.
+
+Quase todo o tráfego mexe em casos abertos, mas aprovados e rejeitados se
+acumulam para sempre em `cases`/`documents` e deixam índices e listagens mais
+lentos. `ArchiveMover` move, em lotes de ARCHIVE_BATCH_SIZE, os casos encerrados
+sem alteração há mais de ARCHIVE_AFTER_DAYS (e todos os seus documentos) para
+`cases_archive`/`documents_archive`: INSERT ... SELECT + DELETE na mesma
+transação, então cada lote é atômico e uma rodada interrompida continua de onde
+parou. Casos com PDF ainda na fila (queued/rendering) esperam a próxima rodada.
+
+Leitura transparente:
+- Listagens do histórico (paciente e casos revisados do médico, em ordem
+  decrescente): enquanto a página inteira é mais recente que o caso arquivado
+  mais novo daquela listagem (um MAX pelo índice), o arquivo não é lido; só
+  quando o usuário volta para o histórico antigo as duas tabelas são lidas com o
+  mesmo cursor e intercaladas (ver `paginate_cases`). O MAX, e não o
+  `archive_horizon()`, porque o horizonte muda com ARCHIVE_AFTER_DAYS.
+- `find_case`/`latest_document`: busca no arquivo só se o caso não está em `cases`.
+- Relatórios (`all_cases`): UNION ALL das duas tabelas.
+
+Administração: `python -m app.archive report` (linhas e bytes quentes/frios),
+`python -m app.archive run` (arquiva agora) e `python -m app.archive reset --yes`
+(apaga tudo em lotes, igual ao POST /admin/reset).
+"""
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Union
+
+from sqlalchemy import and_, delete, func, insert, literal, select, text, union_all
+from sqlalchemy.types import DateTime
+
+from .config import ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL, ARCHIVE_BATCH_SIZE, DELETE_BATCH_SIZE
+from .database import Case, CaseArchive, Document, DocumentArchive, Notification, User, open_session
+from .metrics import archived_cases
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ('approved', 'rejected')
+PENDING_JOBS = ('queued', 'rendering')  # PDF ainda sendo gerado: o caso fica no quente
+
+CASE_COLUMNS = [column.name for column in Case.__table__.columns]
+DOCUMENT_COLUMNS = [column.name for column in Document.__table__.columns]
+
+
+def archive_horizon(now: Optional[datetime] = None) -> datetime:
+    """Corte do arquivamento: casos encerrados com updated_at anterior a isso vão para o arquivo."""
+    return (now or datetime.utcnow()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+def archivable(cutoff: datetime):
+    busy = select(Document.id).where(Document.case_id == Case.id, Document.job_status.in_(PENDING_JOBS)).exists()
+    return and_(Case.status.in_(CLOSED_STATUSES), Case.updated_at < cutoff, ~busy)
+
+
+# ---------- Movimentação ----------
+
+async def archive_batch(db, cutoff: datetime, limit: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move até `limit` casos (e documentos) para o arquivo e faz commit. Devolve quantos moveu."""
+    stmt = select(Case.id).where(archivable(cutoff)).order_by(Case.id).limit(limit)
+    if db.bind.dialect.name == 'postgresql':
+        # Trava as linhas: uma revisão concorrente não se perde entre a cópia e o DELETE
+        stmt = stmt.with_for_update(of=Case, skip_locked=True)
+    ids = list((await db.scalars(stmt)).all())
+    if not ids:
+        await db.rollback()
+        return 0
+    now = literal(datetime.utcnow(), DateTime)
+    await db.execute(
+        insert(CaseArchive).from_select(
+            CASE_COLUMNS + ['archived_at'],
+            select(*Case.__table__.columns, now).where(Case.id.in_(ids)),
+        )
+    )
+    await db.execute(
+        insert(DocumentArchive).from_select(
+            DOCUMENT_COLUMNS + ['archived_at'],
+            select(*Document.__table__.columns, now).where(Document.case_id.in_(ids)),
+        )
+    )
+    await db.execute(delete(Document).where(Document.case_id.in_(ids)))
+    await db.execute(delete(Case).where(Case.id.in_(ids)))
+    await db.commit()
+    archived_cases.inc(len(ids))
+    return len(ids)
+
+
+async def archive_closed_cases(cutoff: Optional[datetime] = None, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Arquiva tudo o que passou do prazo, um lote (e uma sessão curta) por vez."""
+    cutoff = cutoff or archive_horizon()
+    moved = 0
+    while True:
+        async with open_session() as db:
+            count = await archive_batch(db, cutoff, batch_size)
+        moved += count
+        if count < batch_size:
+            return moved
+
+
+class ArchiveMover:
+    """Tarefa de fundo que arquiva os casos encerrados a cada ARCHIVE_INTERVAL segundos."""
+
+    def __init__(self, interval: float = ARCHIVE_INTERVAL, batch_size: int = ARCHIVE_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is not None or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                moved = await archive_closed_cases(batch_size=self.batch_size)
+                if moved:
+                    logger.info('%d casos arquivados', moved)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Erro arquivando casos')
+            await asyncio.sleep(self.interval)
+
+
+archive_mover = ArchiveMover()
+
+
+# ---------- Leitura ----------
+
+async def find_case(db, **filters) -> Optional[Union[Case, CaseArchive]]:
+    """Caso em `cases` ou, se não estiver lá, em `cases_archive` (ex.: find_case(db, id=1, patient_id=2))."""
+    case = await db.scalar(select(Case).filter_by(**filters))
+    if case is None:
+        case = await db.scalar(select(CaseArchive).filter_by(**filters))
+    return case
+
+
+async def latest_document(db, case: Union[Case, CaseArchive]):
+    model = DocumentArchive if isinstance(case, CaseArchive) else Document
+    return await db.scalar(select(model).where(model.case_id == case.id).order_by(model.id.desc()))
+
+
+def all_cases(*columns: str):
+    """Subquery com `columns` de cases UNION ALL cases_archive, para relatórios e reconciliação."""
+    return union_all(
+        select(*(Case.__table__.c[name] for name in columns)),
+        select(*(CaseArchive.__table__.c[name] for name in columns)),
+    ).subquery('all_cases')
+
+
+# ---------- Tamanhos ----------
+
+SIZE_TABLES = {
+    'cases': ('hot', Case),
+    'documents': ('hot', Document),
+    'cases_archive': ('cold', CaseArchive),
+    'documents_archive': ('cold', DocumentArchive),
+}
+
+
+async def _table_bytes(db, table: str) -> Optional[int]:
+    dialect = db.bind.dialect.name
+    if dialect == 'postgresql':
+        return await db.scalar(select(func.pg_total_relation_size(table)))
+    if dialect == 'sqlite':
+        try:
+            # Tabela + índices; dbstat depende de como o SQLite foi compilado
+            return await db.scalar(
+                text("SELECT SUM(pgsize) FROM dbstat WHERE name = :t OR name IN "
+                     "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t)"),
+                {'t': table},
+            )
+        except Exception:
+            await db.rollback()
+    return None
+
+
+async def size_report(db) -> dict:
+    """Linhas e bytes (tabela + índices, quando o banco informa) das tabelas quentes e frias."""
+    tables = {}
+    totals: Dict[str, Dict[str, int]] = {'hot': {'rows': 0, 'bytes': 0}, 'cold': {'rows': 0, 'bytes': 0}}
+    for table, (tier, model) in SIZE_TABLES.items():
+        rows = await db.scalar(select(func.count()).select_from(model))
+        size = await _table_bytes(db, table)
+        tables[table] = {'tier': tier, 'rows': rows, 'bytes': size}
+        totals[tier]['rows'] += rows
+        totals[tier]['bytes'] += size or 0
+    pending = await db.scalar(select(func.count()).select_from(Case).where(archivable(archive_horizon())))
+    return {
+        'archive_after_days': ARCHIVE_AFTER_DAYS,
+        'horizon': archive_horizon().isoformat(timespec='seconds'),
+        'archivable_now': pending,
+        'tables': tables,
+        'totals': totals,
+    }
+
+
+# ---------- Exclusão em lote ----------
+
+async def delete_in_batches(db, model, batch_size: int = DELETE_BATCH_SIZE) -> int:
+    """Apaga a tabela inteira em lotes de `batch_size` linhas, com commit por lote.
+
+    Transações curtas (sem travar a tabela nem inchar o WAL de uma vez) e
+    retomável: se parar no meio, rodar de novo apaga o que sobrou.
+    """
+    deleted = 0
+    while True:
+        ids = select(model.id).order_by(model.id).limit(batch_size).scalar_subquery()
+        result = await db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+        await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+# Ordem das chaves estrangeiras: documentos antes dos casos, casos e avisos antes dos usuários
+RESET_ORDER = (DocumentArchive, Document, CaseArchive, Case, Notification, User)
+
+
+async def reset_all(db, batch_size: int = DELETE_BATCH_SIZE) -> Dict[str, int]:
+    """Apaga casos, documentos (quentes e arquivados), avisos e usuários, e zera as estatísticas."""
+    from .stats import reset_stats
+
+    deleted = {}
+    for model in RESET_ORDER:
+        deleted[model.__tablename__] = await delete_in_batches(db, model, batch_size)
+    await reset_stats(db)
+    await db.commit()
+    return deleted
+
+
+# ---------- Linha de comando ----------
+
+async def _command(name: str) -> dict:
+    if name == 'run':
+        return {'archived': await archive_closed_cases()}
+    async with open_session() as db:
+        if name == 'reset':
+            return {'deleted': await reset_all(db)}
+        return await size_report(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Arquivamento dos casos encerrados')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('report', help='linhas e bytes das tabelas quentes e frias')
+    sub.add_parser('run', help='arquiva agora os casos que passaram do prazo')
+    reset = sub.add_parser('reset', help='apaga todos os cadastros, em lotes')
+    reset.add_argument('--yes', action='store_true', help='confirma a exclusão')
+    args = parser.parse_args()
+    if args.command == 'reset' and not args.yes:
+        parser.error('reset apaga todos os cadastros; confirme com --yes')
+    print(json.dumps(asyncio.run(_command(args.command)), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,38 @@
+import asyncio
+import hmac
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .database import get_db, User
-from .config import SECRET_KEY, ALGORITHM
+from .cache import TTLCache
+from .ratelimit import ConcurrencyLimit
+from .config import (
+    SECRET_KEY, ALGORITHM, USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS,
+    BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_MAX_WAITING, ADMIN_TOKEN,
+)
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__rounds=BCRYPT_ROUNDS)
+
+# O bcrypt leva ~100-300 ms por chamada e libera o GIL, então roda num pool de threads
+# limitado. No máximo PASSWORD_HASH_CONCURRENCY hashes em andamento e
+# PASSWORD_HASH_MAX_WAITING esperando; além disso a requisição recebe 503 na hora.
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='bcrypt')
+_hash_slots = ConcurrencyLimit('password_hash', PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_MAX_WAITING)
+
+# Cache de tokens já verificados (token -> (email, exp)) e de usuários (email -> colunas).
+# Evita decodificar o JWT e fazer um SELECT em users a cada requisição protegida.
+# O cache é do processo: invalidate_user_cache só limpa o worker atual, então nos
+# demais uma troca de senha/perfil ou conta apagada vale só depois de
+# USER_CACHE_TTL_SECONDS (curto de propósito; 0 desliga o cache de usuários).
+token_cache = TTLCache(maxsize=USER_CACHE_MAX_ENTRIES)
+user_cache = TTLCache(maxsize=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL_SECONDS)
+
+_USER_COLUMNS = [c.key for c in User.__table__.columns]
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -15,6 +40,22 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def _run_hasher(func, *args):
+    async with _hash_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hasher(pwd_context.hash, password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica a senha fora do event loop.
+
+    Retorna (válida, novo_hash). `novo_hash` vem preenchido quando o hash armazenado
+    precisa ser refeito (pwd_context.needs_update, ex.: BCRYPT_ROUNDS mudou).
+    """
+    return await _run_hasher(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
@@ -22,7 +63,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+def invalidate_user_cache(email: Optional[str] = None) -> None:
+    """Remove um usuário do cache deste processo (ou tudo, se `email` for None).
+
+    Deve ser chamada sempre que uma linha de `users` for alterada ou apagada.
+    """
+    if email is None:
+        token_cache.clear()
+        user_cache.clear()
+    else:
+        user_cache.pop(email)
+
+def user_cache_stats() -> dict:
+    return {'tokens': token_cache.stats(), 'users': user_cache.stats()}
+
+def _cache_user(user: User, expires_at: float) -> None:
+    user_cache.set(user.email, {k: getattr(user, k) for k in _USER_COLUMNS}, expires_at=expires_at)
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Não autenticado',
@@ -41,15 +99,36 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)) -> U
 
     token = parts[1]
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get('sub')
-        if email is None:
+    cached_token = token_cache.get(token)
+    if cached_token is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get('sub')
+            if email is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        # O cache expira junto com o token
+        expires_at = float(payload.get('exp') or 0) or None
+        token_cache.set(token, (email, expires_at), expires_at=expires_at)
+    else:
+        email, expires_at = cached_token
+
+    # Reconstrói um User (transiente, fora da sessão) a partir das colunas em cache, sem ir ao banco
+    cached_user = user_cache.get(email)
+    if cached_user is not None:
+        return User(**cached_user)
 
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
     if user is None:
         raise credentials_exception
+    if USER_CACHE_TTL_SECONDS > 0:
+        _cache_user(user, expires_at)
     return user
+
+def require_admin(request: Request) -> None:
+    """Dependência das rotas /admin: "Authorization: Bearer <ADMIN_TOKEN>"; sem ADMIN_TOKEN, 403."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Rotas de admin desabilitadas')
+    if not hmac.compare_digest(request.headers.get('authorization', ''), f'Bearer {ADMIN_TOKEN}'):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Não autorizado')
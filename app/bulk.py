@@ -0,0 +1,492 @@
+"""Importação e exportação em lote de usuários e casos (/admin/import, /admin/export).
+
+Importação: o corpo da requisição (CSV com cabeçalho, ou JSONL com um objeto por
+linha) é lido em streaming, sem carregar o arquivo inteiro. As linhas são
+validadas e gravadas em lotes de BULK_BATCH_SIZE:
+- duplicatas (no arquivo e no banco) saem com um SELECT ... IN por lote;
+- os hashes bcrypt do lote são divididos entre BULK_HASH_PROCESSES processos;
+- as linhas válidas entram num INSERT executemany (no Postgres o SQLAlchemy
+  agrupa em INSERTs de vários VALUES), com um commit por lote.
+O relatório traz, por número de linha do arquivo, os erros de cada linha recusada.
+
+Exportação: gerador que lê páginas por id (keyset), cada uma numa sessão curta,
+e emite CSV ou JSONL. A memória é constante e nenhuma conexão fica presa
+enquanto o cliente baixa. No CSV, textos que começam com =, +, -, @ (ou tab/CR)
+ganham um ' na frente, para o Excel/Sheets não os executar como fórmula.
+"""
+import asyncio
+import codecs
+import csv
+import io
+import json
+import math
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from .auth import invalidate_user_cache
+from .config import (
+    BCRYPT_ROUNDS, BULK_BATCH_SIZE, BULK_HASH_PROCESSES, BULK_MAX_REPORTED_ERRORS, BULK_EXPORT_BATCH_SIZE,
+)
+from .database import Case, CaseArchive, User, open_session
+from .stats import StatsDelta
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+USER_TYPES = ('patient', 'doctor')
+REQUEST_TYPES = ('receita', 'relatorio')
+# Casos importados entram aguardando pagamento ou já pagos (fila dos médicos)
+IMPORT_CASE_STATUSES = ('pending_payment', 'pending_review')
+
+USER_FIELDS = ('email', 'password', 'full_name', 'user_type', 'cpf', 'phone', 'crm', 'crm_uf')
+USER_REQUIRED = ('email', 'password', 'full_name', 'user_type')
+CASE_FIELDS = ('patient_email', 'request_type', 'status', 'created_at')
+CASE_REQUIRED = ('patient_email', 'request_type')
+
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+$')
+
+
+class BulkError(Exception):
+    """Arquivo inválido como um todo (formato, cabeçalho): vira 400."""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def detect_format(content_type: str, explicit: Optional[str] = None) -> str:
+    if explicit:
+        if explicit not in FORMATS:
+            raise BulkError(f'Formato desconhecido: {explicit} (use csv ou jsonl)')
+        return explicit
+    media_type = content_type.split(';')[0].strip().lower()
+    if media_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if media_type in ('application/x-ndjson', 'application/jsonl', 'application/json-lines', 'application/ndjson'):
+        return 'jsonl'
+    raise BulkError('Informe o formato: Content-Type text/csv ou application/x-ndjson, ou ?format=csv|jsonl')
+
+
+# ---------- Leitura em streaming ----------
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # utf-8-sig: aceita o BOM das planilhas exportadas pelo Excel
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer.rstrip('\r')
+
+
+async def iter_records(
+    chunks: AsyncIterator[bytes], fmt: str, required: Sequence[str] = ()
+) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """(número da linha, campos, erro de leitura). Linhas em branco são ignoradas."""
+    line_no = 0
+    if fmt == 'jsonl':
+        async for line in iter_lines(chunks):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f'JSON inválido: {e}'
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, 'esperado um objeto JSON'
+                continue
+            yield line_no, record, None
+        return
+
+    header = None
+    pending, start = '', 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not pending:
+            start = line_no
+        pending = f'{pending}\n{line}' if pending else line
+        if pending.count('"') % 2:
+            continue  # aspas abertas: o campo continua na próxima linha
+        record, pending = pending, ''
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            missing = [name for name in required if name not in header]
+            if missing:
+                raise BulkError(f'Colunas obrigatórias ausentes no cabeçalho: {", ".join(missing)}')
+            continue
+        if len(values) != len(header):
+            yield start, None, f'esperadas {len(header)} colunas, encontradas {len(values)}'
+            continue
+        yield start, dict(zip(header, values)), None
+    if pending:
+        yield start, None, 'aspas não fechadas'
+
+
+def _clean(record: dict, fields: Sequence[str]) -> dict:
+    data = {}
+    for field in fields:
+        value = record.get(field)
+        value = '' if value is None else str(value).strip()
+        data[field] = value or None
+    return data
+
+
+# ---------- Relatório ----------
+
+class ImportReport:
+    def __init__(self, dry_run: bool, max_errors: int = BULK_MAX_REPORTED_ERRORS):
+        self.dry_run = dry_run
+        self.max_errors = max_errors
+        self.rows = 0
+        self.valid = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, messages: List[str]):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': messages})
+
+    def as_dict(self) -> dict:
+        return {
+            'dry_run': self.dry_run,
+            'rows': self.rows,
+            'valid': self.valid,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda e: e['line']),
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+async def _run_import(chunks, fmt: str, required: Sequence[str], validate: Callable, flush: Callable,
+                      report: ImportReport, batch_size: int = BULK_BATCH_SIZE):
+    batch: List[Tuple[int, dict]] = []
+    async for line, record, error in iter_records(chunks, fmt, required):
+        report.rows += 1
+        if error is not None:
+            report.error(line, [error])
+            continue
+        data, errors = validate(record)
+        if errors:
+            report.error(line, errors)
+            continue
+        batch.append((line, data))
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+
+# ---------- Usuários ----------
+
+def validate_user(record: dict) -> Tuple[dict, List[str]]:
+    data = _clean(record, USER_FIELDS)
+    errors = [f'{field} obrigatório' for field in USER_REQUIRED if not data[field]]
+    if data['email'] and not EMAIL_RE.match(data['email']):
+        errors.append('email inválido')
+    if data['user_type'] and data['user_type'] not in USER_TYPES:
+        errors.append(f'user_type deve ser {" ou ".join(USER_TYPES)}')
+    if data['user_type'] == 'doctor':
+        if not data['crm'] or not data['crm_uf']:
+            errors.append('crm e crm_uf obrigatórios para médicos')
+        elif len(data['crm_uf']) != 2:
+            errors.append('crm_uf deve ter 2 letras')
+        else:
+            data['crm_uf'] = data['crm_uf'].upper()
+    else:
+        data['crm'] = data['crm_uf'] = None
+    return data, errors
+
+
+def _hash_chunk(passwords: List[str], rounds: int) -> List[str]:
+    """Roda nos processos do pool. Mesmo formato do pwd_context de app/auth.py."""
+    from passlib.hash import bcrypt
+    hasher = bcrypt.using(rounds=rounds)
+    return [hasher.hash(password) for password in passwords]
+
+
+async def hash_passwords(executor: ProcessPoolExecutor, passwords: List[str], processes: int) -> List[str]:
+    loop = asyncio.get_running_loop()
+    size = max(1, math.ceil(len(passwords) / processes))
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(*(
+        loop.run_in_executor(executor, _hash_chunk, chunk, BCRYPT_ROUNDS) for chunk in chunks
+    ))
+    return [hashed for chunk in results for hashed in chunk]
+
+
+async def _insert_rows(db, model, rows: List[dict], lines: List[int], report: ImportReport, conflict: str,
+                       on_insert: Optional[Callable[[List[dict]], Awaitable[None]]] = None):
+    """Insere o lote num commit; `on_insert(rows)` roda antes de cada commit, na mesma transação."""
+    try:
+        await db.execute(insert(model), rows)
+        if on_insert is not None:
+            await on_insert(rows)
+        await db.commit()
+        report.inserted += len(rows)
+        return rows
+    except IntegrityError:
+        await db.rollback()
+    # Conflito com uma escrita concorrente (ex.: /register): refaz linha a linha para achar qual
+    inserted = []
+    for line, row in zip(lines, rows):
+        try:
+            await db.execute(insert(model), [row])
+            if on_insert is not None:
+                await on_insert([row])
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            report.error(line, [conflict])
+        else:
+            report.inserted += 1
+            inserted.append(row)
+    return inserted
+
+
+async def import_users(db, chunks: AsyncIterator[bytes], fmt: str, dry_run: bool = False,
+                       processes: int = BULK_HASH_PROCESSES) -> ImportReport:
+    report = ImportReport(dry_run)
+    seen_emails, seen_cpfs = set(), set()
+    executor: Optional[ProcessPoolExecutor] = None
+
+    async def flush(batch: List[Tuple[int, dict]]):
+        nonlocal executor
+        emails = [data['email'] for _, data in batch]
+        cpfs = [data['cpf'] for _, data in batch if data['cpf']]
+        existing_emails = set((await db.scalars(select(User.email).where(User.email.in_(emails)))).all())
+        existing_cpfs = set((await db.scalars(select(User.cpf).where(User.cpf.in_(cpfs)))).all()) if cpfs else set()
+        # Devolve a conexão ao pool durante o bcrypt
+        await db.close()
+
+        valid = []
+        for line, data in batch:
+            errors = []
+            if data['email'] in existing_emails:
+                errors.append('email já cadastrado')
+            elif data['email'] in seen_emails:
+                errors.append('email repetido no arquivo')
+            if data['cpf'] in existing_cpfs:
+                errors.append('cpf já cadastrado')
+            elif data['cpf'] and data['cpf'] in seen_cpfs:
+                errors.append('cpf repetido no arquivo')
+            if errors:
+                report.error(line, errors)
+                continue
+            seen_emails.add(data['email'])
+            if data['cpf']:
+                seen_cpfs.add(data['cpf'])
+            valid.append((line, data))
+        report.valid += len(valid)
+        if dry_run or not valid:
+            return
+
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=processes)
+        hashes = await hash_passwords(executor, [data['password'] for _, data in valid], processes)
+        rows = []
+        for (_, data), hashed in zip(valid, hashes):
+            row = {field: data[field] for field in USER_FIELDS if field != 'password'}
+            row['hashed_password'] = hashed
+            rows.append(row)
+        inserted = await _insert_rows(
+            db, User, rows, [line for line, _ in valid], report, 'email ou cpf já cadastrado'
+        )
+        for row in inserted:
+            invalidate_user_cache(row['email'])
+
+    try:
+        await _run_import(chunks, fmt, USER_REQUIRED, validate_user, flush, report)
+    finally:
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown)
+    return report
+
+
+# ---------- Casos ----------
+
+def _parse_datetime(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # As colunas guardam UTC sem fuso (datetime.utcnow)
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def validate_case(record: dict) -> Tuple[dict, List[str]]:
+    data = _clean(record, CASE_FIELDS)
+    errors = [f'{field} obrigatório' for field in CASE_REQUIRED if not data[field]]
+    if data['request_type'] and data['request_type'] not in REQUEST_TYPES:
+        errors.append(f'request_type deve ser {" ou ".join(REQUEST_TYPES)}')
+    data['status'] = data['status'] or 'pending_payment'
+    if data['status'] not in IMPORT_CASE_STATUSES:
+        errors.append(f'status deve ser {" ou ".join(IMPORT_CASE_STATUSES)}')
+    if data['created_at']:
+        try:
+            data['created_at'] = _parse_datetime(data['created_at'])
+        except ValueError:
+            errors.append('created_at inválido (use ISO 8601)')
+    return data, errors
+
+
+async def import_cases(db, chunks: AsyncIterator[bytes], fmt: str, dry_run: bool = False) -> ImportReport:
+    report = ImportReport(dry_run)
+
+    async def record_stats(rows: List[dict]):
+        delta = StatsDelta()
+        for row in rows:
+            delta.created(row['request_type'], row['created_at'])
+            if row['paid_at'] is not None:
+                delta.paid(row['request_type'], row['created_at'], row['paid_at'])
+        await delta.apply(db)
+
+    async def flush(batch: List[Tuple[int, dict]]):
+        emails = {data['patient_email'] for _, data in batch}
+        patients = dict((await db.execute(
+            select(User.email, User.id).where(User.email.in_(emails), User.user_type == 'patient')
+        )).all())
+
+        rows, lines = [], []
+        now = datetime.utcnow()
+        for line, data in batch:
+            patient_id = patients.get(data['patient_email'])
+            if patient_id is None:
+                report.error(line, ['paciente não encontrado'])
+                continue
+            created_at = data['created_at'] or now
+            rows.append({
+                'patient_id': patient_id,
+                'request_type': data['request_type'],
+                'status': data['status'],
+                'payment_status': 'paid' if data['status'] == 'pending_review' else 'pending',
+                'created_at': created_at,
+                'updated_at': created_at,
+                'paid_at': created_at if data['status'] == 'pending_review' else None,
+            })
+            lines.append(line)
+        report.valid += len(rows)
+        if dry_run or not rows:
+            await db.rollback()
+            return
+        await _insert_rows(db, Case, rows, lines, report, 'conflito ao inserir o caso', on_insert=record_stats)
+
+    await _run_import(chunks, fmt, CASE_REQUIRED, validate_case, flush, report)
+    return report
+
+
+IMPORTERS = {'users': import_users, 'cases': import_cases}
+
+
+# ---------- Exportação ----------
+
+USER_EXPORT_COLUMNS = ('id', 'email', 'full_name', 'user_type', 'cpf', 'phone', 'crm', 'crm_uf')
+CASE_EXPORT_COLUMNS = (
+    'id', 'patient_id', 'patient_email', 'doctor_id', 'doctor_email', 'request_type', 'status',
+    'payment_status', 'created_at', 'updated_at', 'rejection_reason',
+)
+
+
+def users_query(user_type: Optional[str] = None):
+    def query(after_id: int):
+        stmt = select(*(User.__table__.c[name] for name in USER_EXPORT_COLUMNS)).where(User.id > after_id)
+        if user_type:
+            stmt = stmt.where(User.user_type == user_type)
+        return stmt.order_by(User.id)
+    return query
+
+
+def cases_query(status: Optional[str] = None, created_from: Optional[datetime] = None,
+                created_to: Optional[datetime] = None):
+    """Casos quentes e arquivados (app/archive.py), intercalados por id."""
+    patient, doctor = aliased(User), aliased(User)
+
+    def select_from(model, after_id: int):
+        stmt = (
+            select(
+                model.id, model.patient_id, patient.email.label('patient_email'),
+                model.doctor_id, doctor.email.label('doctor_email'), model.request_type, model.status,
+                model.payment_status, model.created_at, model.updated_at, model.rejection_reason,
+            )
+            .outerjoin(patient, model.patient_id == patient.id)
+            .outerjoin(doctor, model.doctor_id == doctor.id)
+            .where(model.id > after_id)
+        )
+        if status:
+            stmt = stmt.where(model.status == status)
+        if created_from:
+            stmt = stmt.where(model.created_at >= created_from)
+        if created_to:
+            stmt = stmt.where(model.created_at < created_to)
+        return stmt
+
+    def query(after_id: int):
+        cases = union_all(select_from(Case, after_id), select_from(CaseArchive, after_id)).subquery()
+        return select(cases).order_by(cases.c.id)
+    return query
+
+
+EXPORTS: Dict[str, Tuple[Sequence[str], Callable]] = {
+    'users': (USER_EXPORT_COLUMNS, users_query),
+    'cases': (CASE_EXPORT_COLUMNS, cases_query),
+}
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# Caracteres que fazem a planilha interpretar a célula como fórmula (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def export_rows(query: Callable, columns: Sequence[str], fmt: str,
+                      batch_size: int = BULK_EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if fmt == 'csv':
+        writer.writerow(columns)
+        yield buffer.getvalue().encode()
+
+    after_id = 0
+    while True:
+        async with open_session() as db:
+            rows = (await db.execute(query(after_id).limit(batch_size))).all()
+        if not rows:
+            return
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            values = [_export_value(getattr(row, name)) for name in columns]
+            if fmt == 'csv':
+                writer.writerow([_csv_cell(v) for v in values])
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + '\n')
+        yield buffer.getvalue().encode()
+        if len(rows) < batch_size:
+            return
+        after_id = rows[-1].id
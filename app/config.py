@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,3 +12,178 @@ ACCESS_TOKEN_EXPIRE_MINUTES=60
 
 MERCADOPAGO_PUBLIC_KEY=os.getenv('MERCADOPAGO_PUBLIC_KEY','')
 MERCADOPAGO_ACCESS_TOKEN=os.getenv('MERCADOPAGO_ACCESS_TOKEN','')
+
+# Cache de tokens/usuários autenticados (get_current_user)
+USER_CACHE_MAX_ENTRIES=int(os.getenv('USER_CACHE_MAX_ENTRIES','2048'))
+USER_CACHE_TTL_SECONDS=int(os.getenv('USER_CACHE_TTL_SECONDS','30'))  # cache por processo: é o atraso máximo para outros workers verem troca de senha/perfil
+
+# Hash de senhas (bcrypt) fora do event loop
+BCRYPT_ROUNDS=int(os.getenv('BCRYPT_ROUNDS','12'))
+PASSWORD_HASH_WORKERS=int(os.getenv('PASSWORD_HASH_WORKERS','4'))
+PASSWORD_HASH_CONCURRENCY=int(os.getenv('PASSWORD_HASH_CONCURRENCY','8'))
+
+# Banco de dados: modo assíncrono e pool de conexões
+# DB_ASYNC: 'auto' (assíncrono, exceto SQLite), 'true' ou 'false'
+DB_ASYNC=os.getenv('DB_ASYNC','auto').lower()
+DB_POOL_SIZE=int(os.getenv('DB_POOL_SIZE','10'))
+DB_MAX_OVERFLOW=int(os.getenv('DB_MAX_OVERFLOW','20'))
+DB_POOL_TIMEOUT=int(os.getenv('DB_POOL_TIMEOUT','30'))
+DB_POOL_RECYCLE=int(os.getenv('DB_POOL_RECYCLE','1800'))
+DB_POOL_PRE_PING=os.getenv('DB_POOL_PRE_PING','true').lower() == 'true'
+# Conexões abertas (SELECT 1) na subida da app, antes da primeira requisição; 0 desliga
+DB_WARMUP_CONNECTIONS=int(os.getenv('DB_WARMUP_CONNECTIONS','1'))
+
+# Paginação das listagens de casos
+CASE_PAGE_SIZE=int(os.getenv('CASE_PAGE_SIZE','20'))
+CASE_PAGE_SIZE_MAX=int(os.getenv('CASE_PAGE_SIZE_MAX','100'))
+
+# Fila de trabalho dos médicos (claim/lease de casos pending_review)
+CASE_LEASE_SECONDS=int(os.getenv('CASE_LEASE_SECONDS','900'))
+CASE_CLAIM_BATCH_MAX=int(os.getenv('CASE_CLAIM_BATCH_MAX','10'))
+
+# Cliente HTTP do Mercado Pago
+MERCADOPAGO_API_URL=os.getenv('MERCADOPAGO_API_URL','https://api.mercadopago.com')
+APP_BASE_URL=os.getenv('APP_BASE_URL','https://app-medico-hfb0.onrender.com')
+MP_CONNECT_TIMEOUT=float(os.getenv('MP_CONNECT_TIMEOUT','3'))
+MP_READ_TIMEOUT=float(os.getenv('MP_READ_TIMEOUT','10'))
+MP_MAX_CONNECTIONS=int(os.getenv('MP_MAX_CONNECTIONS','20'))
+MP_MAX_RETRIES=int(os.getenv('MP_MAX_RETRIES','2'))
+MP_RETRY_BACKOFF=float(os.getenv('MP_RETRY_BACKOFF','0.2'))
+MP_BREAKER_FAILURES=int(os.getenv('MP_BREAKER_FAILURES','5'))
+MP_BREAKER_RESET_SECONDS=float(os.getenv('MP_BREAKER_RESET_SECONDS','30'))
+
+# Validade do checkout gerado para um caso (reutilizado até expirar)
+CHECKOUT_TTL_MINUTES=int(os.getenv('CHECKOUT_TTL_MINUTES','1440'))
+
+# Webhook de pagamentos do Mercado Pago e workers que processam a fila
+MERCADOPAGO_WEBHOOK_SECRET=os.getenv('MERCADOPAGO_WEBHOOK_SECRET','')
+MERCADOPAGO_WEBHOOK_TOLERANCE=int(os.getenv('MERCADOPAGO_WEBHOOK_TOLERANCE','300'))  # segundos de diferença aceitos no ts assinado; 0 desliga
+PAYMENT_WORKERS=int(os.getenv('PAYMENT_WORKERS','2'))
+PAYMENT_BATCH_SIZE=int(os.getenv('PAYMENT_BATCH_SIZE','50'))
+PAYMENT_POLL_INTERVAL=float(os.getenv('PAYMENT_POLL_INTERVAL','1.0'))
+PAYMENT_MAX_ATTEMPTS=int(os.getenv('PAYMENT_MAX_ATTEMPTS','5'))
+PAYMENT_RETRY_BACKOFF=float(os.getenv('PAYMENT_RETRY_BACKOFF','5'))  # segundos até a 1ª nova tentativa; dobra a cada falha
+
+# Geração de documentos (PDF assinado) em pool de processos
+DOCUMENT_DIR=os.getenv('DOCUMENT_DIR','documents')
+DOCUMENT_SIGNING_KEY_PATH=os.getenv('DOCUMENT_SIGNING_KEY_PATH','')
+DOCUMENT_WORKERS=int(os.getenv('DOCUMENT_WORKERS','2'))
+DOCUMENT_POLL_INTERVAL=float(os.getenv('DOCUMENT_POLL_INTERVAL','2.0'))
+DOCUMENT_MAX_ATTEMPTS=int(os.getenv('DOCUMENT_MAX_ATTEMPTS','3'))
+DOCUMENT_RETRY_BACKOFF=float(os.getenv('DOCUMENT_RETRY_BACKOFF','30'))  # segundos até a 1ª nova tentativa; dobra a cada falha
+
+# Armazenamento dos documentos: 'local' (DOCUMENT_DIR) ou 's3'
+STORAGE_BACKEND=os.getenv('STORAGE_BACKEND','local')
+S3_BUCKET=os.getenv('S3_BUCKET','')
+S3_PREFIX=os.getenv('S3_PREFIX','documents/')
+S3_REGION=os.getenv('S3_REGION','us-east-1')
+S3_ENDPOINT_URL=os.getenv('S3_ENDPOINT_URL') or None  # ex.: servidor moto/minio local
+STORAGE_CHUNK_SIZE=int(os.getenv('STORAGE_CHUNK_SIZE','65536'))
+STORAGE_PRESIGNED_REDIRECT=os.getenv('STORAGE_PRESIGNED_REDIRECT','true').lower() == 'true'
+STORAGE_PRESIGN_SECONDS=int(os.getenv('STORAGE_PRESIGN_SECONDS','300'))
+
+# Rascunho do texto dos documentos (IA)
+# DRAFT_BACKEND: 'stub' (modelo local determinístico, para dev/testes) ou 'openai'
+DRAFT_BACKEND=os.getenv('DRAFT_BACKEND','stub')
+DRAFT_MODEL=os.getenv('DRAFT_MODEL','gpt-4o-mini')
+DRAFT_CONCURRENCY=int(os.getenv('DRAFT_CONCURRENCY','4'))
+DRAFT_BATCH_SIZE=int(os.getenv('DRAFT_BATCH_SIZE','8'))
+DRAFT_BATCH_WAIT_MS=int(os.getenv('DRAFT_BATCH_WAIT_MS','50'))
+DRAFT_CACHE_MAX_ENTRIES=int(os.getenv('DRAFT_CACHE_MAX_ENTRIES','1024'))
+DRAFT_PREFETCH_INTERVAL=float(os.getenv('DRAFT_PREFETCH_INTERVAL','5.0'))
+DRAFT_PREFETCH_BATCH=int(os.getenv('DRAFT_PREFETCH_BATCH','32'))
+
+# Eventos dos casos (SSE no dashboard do médico)
+# EVENTS_BACKEND: 'memory' (um processo só) ou 'postgres' (LISTEN/NOTIFY entre workers)
+EVENTS_BACKEND=os.getenv('EVENTS_BACKEND','memory')
+SSE_QUEUE_SIZE=int(os.getenv('SSE_QUEUE_SIZE','100'))
+SSE_KEEPALIVE_SECONDS=float(os.getenv('SSE_KEEPALIVE_SECONDS','15'))
+
+# Métricas (/metrics) e log de requisições lentas
+METRICS_TOKEN=os.getenv('METRICS_TOKEN')  # se definido, /metrics exige "Authorization: Bearer <token>"
+SLOW_REQUEST_SECONDS=float(os.getenv('SLOW_REQUEST_SECONDS','0'))  # 0 desliga o log
+
+# Templates
+# Bytecode compilado dos templates (compartilhado entre processos); vazio desliga
+TEMPLATE_BYTECODE_CACHE_DIR=os.getenv('TEMPLATE_BYTECODE_CACHE_DIR',os.path.join(tempfile.gettempdir(),'app-medico-jinja'))
+TEMPLATE_AUTO_RELOAD=os.getenv('TEMPLATE_AUTO_RELOAD','false').lower()=='true'  # true em desenvolvimento
+FRAGMENT_CACHE_MAX_ENTRIES=int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES','5000'))
+
+# Compressão das respostas HTML/JSON (brotli se o pacote estiver instalado, senão gzip)
+COMPRESSION_MIN_SIZE=int(os.getenv('COMPRESSION_MIN_SIZE','1024'))  # bytes
+GZIP_LEVEL=int(os.getenv('GZIP_LEVEL','6'))
+BROTLI_QUALITY=int(os.getenv('BROTLI_QUALITY','4'))
+
+# Importação/exportação em lote (/admin/import, /admin/export)
+ADMIN_TOKEN=os.getenv('ADMIN_TOKEN','')  # rotas de admin exigem "Authorization: Bearer <token>"; vazio desliga
+BULK_BATCH_SIZE=int(os.getenv('BULK_BATCH_SIZE','500'))  # linhas por INSERT/commit
+BULK_HASH_PROCESSES=int(os.getenv('BULK_HASH_PROCESSES',str(os.cpu_count() or 2)))  # processos de bcrypt
+BULK_MAX_REPORTED_ERRORS=int(os.getenv('BULK_MAX_REPORTED_ERRORS','1000'))
+BULK_EXPORT_BATCH_SIZE=int(os.getenv('BULK_EXPORT_BATCH_SIZE','1000'))
+
+# Limite de requisições (token bucket) e descarte de carga
+# RATE_LIMIT_BACKEND: 'memory' (por processo) ou 'postgres' (compartilhado entre workers/instâncias)
+RATE_LIMIT_ENABLED=os.getenv('RATE_LIMIT_ENABLED','true').lower()=='true'
+RATE_LIMIT_BACKEND=os.getenv('RATE_LIMIT_BACKEND','memory')
+RATE_LIMIT_MAX_KEYS=int(os.getenv('RATE_LIMIT_MAX_KEYS','100000'))  # baldes em memória (LRU)
+TRUSTED_PROXY_HOPS=int(os.getenv('TRUSTED_PROXY_HOPS','1'))  # proxies na frente do app (X-Forwarded-For); o Render é 1
+# Regras "N/period" (second, minute, hour, day); vazio desliga a regra
+RATE_LIMIT_LOGIN_IP=os.getenv('RATE_LIMIT_LOGIN_IP','20/minute')
+RATE_LIMIT_LOGIN_USER=os.getenv('RATE_LIMIT_LOGIN_USER','5/minute')  # por email tentado
+RATE_LIMIT_LOGIN_ROUTE=os.getenv('RATE_LIMIT_LOGIN_ROUTE','100/second')
+RATE_LIMIT_REGISTER_IP=os.getenv('RATE_LIMIT_REGISTER_IP','10/hour')
+RATE_LIMIT_REGISTER_ROUTE=os.getenv('RATE_LIMIT_REGISTER_ROUTE','20/second')
+RATE_LIMIT_PIX_IP=os.getenv('RATE_LIMIT_PIX_IP','30/minute')
+RATE_LIMIT_PIX_USER=os.getenv('RATE_LIMIT_PIX_USER','10/minute')
+RATE_LIMIT_PIX_ROUTE=os.getenv('RATE_LIMIT_PIX_ROUTE','20/second')
+# Concorrência por processo: além de N em andamento e M na fila, responde 503 na hora (0 desliga)
+MAX_CONCURRENT_REQUESTS=int(os.getenv('MAX_CONCURRENT_REQUESTS','0'))
+MAX_QUEUED_REQUESTS=int(os.getenv('MAX_QUEUED_REQUESTS','100'))
+QUEUE_TIMEOUT_SECONDS=float(os.getenv('QUEUE_TIMEOUT_SECONDS','5'))
+PASSWORD_HASH_MAX_WAITING=int(os.getenv('PASSWORD_HASH_MAX_WAITING','32'))  # bcrypt (login/registro)
+CHECKOUT_CONCURRENCY=int(os.getenv('CHECKOUT_CONCURRENCY',str(MP_MAX_CONNECTIONS)))  # chamadas ao MP na geração do PIX
+CHECKOUT_MAX_WAITING=int(os.getenv('CHECKOUT_MAX_WAITING','50'))
+
+# Estatísticas dos casos (/api/stats, app/stats.py)
+STATS_RECONCILE_INTERVAL=float(os.getenv('STATS_RECONCILE_INTERVAL','600'))  # segundos; 0 desliga a reconciliação
+STATS_RECONCILE_DAYS=int(os.getenv('STATS_RECONCILE_DAYS','7'))  # dias recalculados a cada rodada (hoje incluso)
+STATS_MAX_RANGE_DAYS=int(os.getenv('STATS_MAX_RANGE_DAYS','366'))
+
+# Arquivamento (hot/cold) dos casos encerrados (app/archive.py)
+ARCHIVE_AFTER_DAYS=int(os.getenv('ARCHIVE_AFTER_DAYS','180'))  # aprovados/rejeitados sem alteração há mais que isso
+ARCHIVE_INTERVAL=float(os.getenv('ARCHIVE_INTERVAL','3600'))  # segundos entre rodadas; 0 desliga o arquivamento
+ARCHIVE_BATCH_SIZE=int(os.getenv('ARCHIVE_BATCH_SIZE','500'))  # casos movidos por transação
+DELETE_BATCH_SIZE=int(os.getenv('DELETE_BATCH_SIZE','1000'))  # linhas por transação no /admin/reset
+
+# Réplicas de leitura (app/replicas.py): dashboards e listagens leem delas
+DATABASE_REPLICA_URLS=[url.strip() for url in os.getenv('DATABASE_REPLICA_URLS','').split(',') if url.strip()]  # vazio: tudo no primário
+DATABASE_REPLICA_WEIGHTS=[int(w) for w in os.getenv('DATABASE_REPLICA_WEIGHTS','').split(',') if w.strip()]  # mesma ordem; padrão 1
+REPLICA_HEALTH_INTERVAL=float(os.getenv('REPLICA_HEALTH_INTERVAL','5'))  # segundos entre verificações
+REPLICA_HEALTH_TIMEOUT=float(os.getenv('REPLICA_HEALTH_TIMEOUT','2'))
+REPLICA_MAX_LAG_SECONDS=float(os.getenv('REPLICA_MAX_LAG_SECONDS','5'))  # atraso maior tira a réplica da rotação
+# Depois de uma escrita, as leituras do mesmo navegador ficam no primário por este tempo
+READ_YOUR_WRITES_SECONDS=int(os.getenv('READ_YOUR_WRITES_SECONDS',str(max(1, int(REPLICA_MAX_LAG_SECONDS * 2)))))
+
+# Avisos de mudança de status aos pacientes (outbox, app/notifications.py)
+# EMAIL_BACKEND: 'smtp' ou 'fake'; SMS_BACKEND: 'http' ou 'fake'. 'fake' não entrega nada
+# (só guarda as últimas mensagens em memória): use só em dev/testes, escolhendo-o explicitamente.
+NOTIFICATION_CHANNELS=[c.strip() for c in os.getenv('NOTIFICATION_CHANNELS','').split(',') if c.strip()]  # ex.: 'email,sms'; vazio desliga
+NOTIFICATION_WORKERS=int(os.getenv('NOTIFICATION_WORKERS','2'))
+NOTIFICATION_BATCH_SIZE=int(os.getenv('NOTIFICATION_BATCH_SIZE','50'))
+NOTIFICATION_POLL_INTERVAL=float(os.getenv('NOTIFICATION_POLL_INTERVAL','2.0'))
+NOTIFICATION_MAX_ATTEMPTS=int(os.getenv('NOTIFICATION_MAX_ATTEMPTS','6'))
+NOTIFICATION_RETRY_BACKOFF=float(os.getenv('NOTIFICATION_RETRY_BACKOFF','30'))  # segundos; dobra a cada tentativa
+EMAIL_BACKEND=os.getenv('EMAIL_BACKEND','smtp')
+EMAIL_CONCURRENCY=int(os.getenv('EMAIL_CONCURRENCY','4'))  # envios simultâneos = conexões SMTP no pool
+EMAIL_FROM=os.getenv('EMAIL_FROM','nao-responda@localhost')
+SMTP_HOST=os.getenv('SMTP_HOST','localhost')
+SMTP_PORT=int(os.getenv('SMTP_PORT','587'))
+SMTP_USER=os.getenv('SMTP_USER','')
+SMTP_PASSWORD=os.getenv('SMTP_PASSWORD','')
+SMTP_STARTTLS=os.getenv('SMTP_STARTTLS','true').lower() == 'true'
+SMTP_TIMEOUT=float(os.getenv('SMTP_TIMEOUT','10'))
+SMS_BACKEND=os.getenv('SMS_BACKEND','http')
+SMS_CONCURRENCY=int(os.getenv('SMS_CONCURRENCY','8'))
+SMS_API_URL=os.getenv('SMS_API_URL','')  # POST JSON {to, message}
+SMS_API_TOKEN=os.getenv('SMS_API_TOKEN','')
+SMS_TIMEOUT=float(os.getenv('SMS_TIMEOUT','5'))
@@ -1,7 +1,16 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text, Boolean
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+import asyncio
+import logging
+from sqlalchemy import create_engine, event, text, Column, Integer, String, Date, DateTime, ForeignKey, Text, Boolean, Float, Index
+from sqlalchemy.orm import Session, sessionmaker, relationship, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from datetime import datetime
-from .config import DATABASE_URL
+from starlette.requests import Request
+from .config import (
+    DATABASE_URL, DB_ASYNC, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_WARMUP_CONNECTIONS,
+)
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -42,7 +51,14 @@ class Case(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     payment_status = Column(String, default='pending')  # pending, paid, failed
     payment_id = Column(String, nullable=True)  # ID do pagamento no MP
+    payment_init_point = Column(String, nullable=True)  # URL do checkout da preferência (reutilizada)
+    payment_expires_at = Column(DateTime, nullable=True)  # Validade da preferência no MP
     rejection_reason = Column(Text, nullable=True)  # Motivo da rejeição pelo médico
+    claimed_by_id = Column(Integer, ForeignKey('users.id'), nullable=True)  # Médico com o caso reservado
+    lease_expires_at = Column(DateTime, nullable=True)  # Fim da reserva; depois disso volta para a fila
+    version = Column(Integer, nullable=False, default=0, server_default='0')  # Controle otimista de concorrência
+    paid_at = Column(DateTime, nullable=True)  # Confirmação do pagamento (entrada na fila)
+    reviewed_at = Column(DateTime, nullable=True)  # Aprovação/rejeição pelo médico
 
     # Relacionamentos
     patient = relationship(
@@ -61,6 +77,15 @@ class Case(Base):
         uselist=False  # Um caso tem um documento
     )
 
+    __mapper_args__ = {'version_id_col': version}
+
+    # Índices das listagens paginadas (filtro + ordenação + id, na ordem do keyset)
+    __table_args__ = (
+        Index('ix_cases_status_created_at', 'status', 'created_at', 'id'),        # fila pending_review
+        Index('ix_cases_patient_created_at', 'patient_id', 'created_at', 'id'),   # dashboard do paciente
+        Index('ix_cases_doctor_updated_at', 'doctor_id', 'updated_at', 'id'),     # casos revisados do médico
+    )
+
 
 class Document(Base):
     __tablename__ = 'documents'
@@ -70,16 +95,375 @@ class Document(Base):
     signed_by_doctor = Column(Boolean, default=False)
     signed_at = Column(DateTime, nullable=True)
     generated_text = Column(Text, nullable=True)  # Texto base gerado pela IA (se for o caso)
+    signature = Column(Text, nullable=True)  # Assinatura Ed25519 (base64) do PDF
+    job_status = Column(String, default='queued')  # draft, queued, rendering, done, failed
+    job_error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    queued_at = Column(DateTime, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)  # após uma falha: não volta a renderizar antes disso
 
     case = relationship('Case', back_populates='document')
 
+    __table_args__ = (
+        Index('ix_documents_case_id', 'case_id'),
+        Index('ix_documents_job_status_id', 'job_status', 'id'),
+    )
+
+
+# Casos encerrados há mais de ARCHIVE_AFTER_DAYS saem de cases/documents para as
+# tabelas de arquivo (app/archive.py), com o mesmo id e as mesmas colunas.
+# Coluna nova em Case/Document também entra aqui (e na migração do arquivo).
+
+class CaseArchive(Base):
+    __tablename__ = 'cases_archive'
+    id = Column(Integer, primary_key=True)
+    patient_id = Column(Integer, ForeignKey('users.id'))
+    doctor_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    request_type = Column(String)
+    status = Column(String)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    payment_status = Column(String)
+    payment_id = Column(String, nullable=True)
+    payment_init_point = Column(String, nullable=True)
+    payment_expires_at = Column(DateTime, nullable=True)
+    rejection_reason = Column(Text, nullable=True)
+    claimed_by_id = Column(Integer, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False)
+    paid_at = Column(DateTime, nullable=True)
+    reviewed_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+    patient = relationship('User', foreign_keys=[patient_id], viewonly=True)
+    doctor = relationship('User', foreign_keys=[doctor_id], viewonly=True)
+
+    # Mesmos índices das listagens paginadas de cases (só histórico: sem a fila)
+    __table_args__ = (
+        Index('ix_cases_archive_patient_created_at', 'patient_id', 'created_at', 'id'),
+        Index('ix_cases_archive_doctor_updated_at', 'doctor_id', 'updated_at', 'id'),
+    )
+
+
+class DocumentArchive(Base):
+    __tablename__ = 'documents_archive'
+    id = Column(Integer, primary_key=True)
+    case_id = Column(Integer, ForeignKey('cases_archive.id'))
+    file_path = Column(String, nullable=True)
+    signed_by_doctor = Column(Boolean)
+    signed_at = Column(DateTime, nullable=True)
+    generated_text = Column(Text, nullable=True)
+    signature = Column(Text, nullable=True)
+    job_status = Column(String)
+    job_error = Column(Text, nullable=True)
+    attempts = Column(Integer)
+    queued_at = Column(DateTime)
+    locked_at = Column(DateTime, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_documents_archive_case_id', 'case_id'),
+    )
+
+
+class DraftCache(Base):
+    """Textos gerados pela IA, endereçados pelo hash do prompt (reutilizados entre casos)."""
+    __tablename__ = 'draft_cache'
+    key = Column(String(64), primary_key=True)  # sha256 do modelo + prompt
+    model = Column(String)
+    text = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Agregados dos casos, mantidos incrementalmente (app/stats.py). doctor_id 0 = sem médico.
+
+class CaseStatusCount(Base):
+    """Casos em cada status, pelo dia de criação."""
+    __tablename__ = 'case_status_counts'
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    request_type = Column(String, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True)
+    cases = Column(Integer, nullable=False, default=0)
+
+
+class CaseDailyStats(Base):
+    """Eventos por dia (criação, pagamento, revisão), tipo de pedido e médico."""
+    __tablename__ = 'case_daily_stats'
+    day = Column(Date, primary_key=True)
+    request_type = Column(String, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True)
+    created = Column(Integer, nullable=False, default=0)
+    paid = Column(Integer, nullable=False, default=0)
+    revenue_cents = Column(Integer, nullable=False, default=0)
+    reviewed = Column(Integer, nullable=False, default=0)
+    approved = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    review_timed = Column(Integer, nullable=False, default=0)  # revisões com paid_at conhecido
+    review_seconds = Column(Float, nullable=False, default=0)  # soma de (reviewed_at - paid_at)
+
+
+class CaseReviewTimeBucket(Base):
+    """Histograma do tempo pagamento → revisão por dia da revisão (para a mediana)."""
+    __tablename__ = 'case_review_time_buckets'
+    day = Column(Date, primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # limite superior da faixa, em segundos
+    cases = Column(Integer, nullable=False, default=0)
+
+
+class RateLimitBucket(Base):
+    """Token bucket do limite de requisições, compartilhado entre processos (app/ratelimit.py)."""
+    __tablename__ = 'rate_limit_buckets'
+    key = Column(String, primary_key=True)  # regra:identidade, ex. 'login:ip:203.0.113.7'
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # epoch (relógio do banco)
+
+    __table_args__ = (
+        Index('ix_rate_limit_buckets_updated_at', 'updated_at'),
+    )
+
+
+class PaymentNotification(Base):
+    """Fila durável das notificações (webhooks) do Mercado Pago."""
+    __tablename__ = 'payment_notifications'
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String)  # 'payment', 'merchant_order', ...
+    resource_id = Column(String)  # data.id da notificação
+    request_id = Column(String, nullable=True)  # x-request-id enviado pelo MP
+    payload = Column(Text, nullable=True)
+    status = Column(String, default='pending')  # pending, processing, done, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)  # após uma falha: não reprocessa antes disso
+
+    __table_args__ = (
+        Index('ix_payment_notifications_status_id', 'status', 'id'),
+    )
+
+
+class Notification(Base):
+    """Outbox dos avisos a pacientes (app/notifications.py), gravado na transação da mudança do caso."""
+    __tablename__ = 'notifications'
+    id = Column(Integer, primary_key=True, index=True)
+    dedupe_key = Column(String, nullable=False, unique=True)  # evento:caso:canal (um aviso por transição)
+    event = Column(String, nullable=False)  # case.paid, case.approved, case.rejected
+    channel = Column(String, nullable=False)  # email, sms
+    case_id = Column(Integer, nullable=False)  # sem FK: o caso pode ir para cases_archive
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    payload = Column(Text, nullable=True)  # JSON com os dados do texto (tipo do pedido, motivo...)
+    status = Column(String, default='pending')  # pending, processing, sent, failed, skipped
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_notifications_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
 
 # Configuração do banco de dados
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def _engine_kwargs(url: str) -> dict:
+    if _is_sqlite(url):
+        # O SQLite não usa pool de rede; a sessão pode mudar de thread (threadpool do FastAPI)
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+
+def _async_url(url: str) -> str:
+    """Converte a URL síncrona para o driver assíncrono equivalente."""
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    if url.startswith('postgresql://') or url.startswith('postgresql+psycopg2://'):
+        return 'postgresql+asyncpg://' + url.split('://', 1)[1]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url.split('://', 1)[1]
+    return url
+
+
+def _sync_url(url: str) -> str:
+    # O Render entrega "postgres://", que o SQLAlchemy 2 não aceita mais
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+USE_ASYNC_DB = DB_ASYNC == 'true' or (DB_ASYNC == 'auto' and not _is_sqlite(DATABASE_URL))
+
+# Os engines são criados em init_engines() (lifespan da app), não no import: importar
+# o módulo não carrega o driver nem monta o pool. As fábricas de sessão existem desde
+# já e recebem o bind quando o engine é criado.
+engine = None
+async_engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False) if USE_ASYNC_DB else None
+
+
+def make_engine(url: str, use_async: bool = USE_ASYNC_DB):
+    """Engine com as opções de pool do app; assíncrono se `use_async` (ex.: réplicas de leitura)."""
+    if use_async:
+        return create_async_engine(_async_url(url), **_engine_kwargs(url))
+    return create_engine(_sync_url(url), **_engine_kwargs(url))
+
+
+def init_engines():
+    """Cria os engines e liga as fábricas de sessão (idempotente). Devolve o engine síncrono."""
+    global engine, async_engine
+    if engine is None:
+        engine = make_engine(DATABASE_URL, use_async=False)
+        SessionLocal.configure(bind=engine)
+        if USE_ASYNC_DB:
+            async_engine = make_engine(DATABASE_URL)
+            AsyncSessionLocal.configure(bind=async_engine)
+    return engine
+
+
+async def warm_up(connections: int = DB_WARMUP_CONNECTIONS):
+    """Abre `connections` conexões do pool em paralelo (SELECT 1).
+
+    Tira o handshake (TCP/TLS/autenticação) da primeira requisição. Uma falha só é
+    registrada: o banco pode voltar antes da primeira requisição.
+    """
+    init_engines()
+
+    async def ping_async():
+        async with async_engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+
+    def ping_sync():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+
+    ping = ping_async if async_engine is not None else (lambda: asyncio.to_thread(ping_sync))
+    results = await asyncio.gather(*(ping() for _ in range(connections)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.warning('Aquecimento do pool falhou em %d de %d conexões: %s', len(errors), connections, errors[0])
+
+
+async def dispose_engines():
+    """Fecha as conexões do pool (shutdown da app)."""
+    if async_engine is not None:
+        await async_engine.dispose()
+    if engine is not None:
+        engine.dispose()
+
+
+class SyncSessionAdapter:
+    """Expõe uma Session síncrona com a mesma interface (awaitable) da AsyncSession.
+
+    Usado no fallback síncrono (SQLite local), para que as rotas tenham um único
+    caminho de código. As chamadas rodam direto, bloqueando o event loop: serve
+    para testes locais, não para produção.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, *args, **kwargs):
+        return self.sync_session.execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return self.sync_session.scalar(statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return self.sync_session.scalars(statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return self.sync_session.get(entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        self.sync_session.delete(instance)
+
+    async def flush(self, objects=None):
+        self.sync_session.flush(objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        self.sync_session.refresh(instance, attribute_names)
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def close(self):
+        self.sync_session.close()
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+
+async def get_db(request: Request):
+    """Dependência das rotas: AsyncSession (no primário), ou o adaptador síncrono no fallback."""
+    async with open_session() as db:
+        track_commits(db, request)
+        yield db
+
+
+def open_session(bind=None):
+    """Abre uma sessão fora de uma requisição (workers em background), igual à de get_db.
+
+    `bind` troca o engine (ex.: uma réplica de leitura, app/replicas.py).
+    """
+    init_engines()
+    if AsyncSessionLocal is not None:
+        return AsyncSessionLocal(bind=bind) if bind is not None else AsyncSessionLocal()
+    return _SyncSessionContext(bind)
+
+
+class _SyncSessionContext:
+    def __init__(self, bind=None):
+        self._bind = bind
+
+    async def __aenter__(self):
+        self._session = SessionLocal(bind=self._bind) if self._bind is not None else SessionLocal()
+        return SyncSessionAdapter(self._session)
+
+    async def __aexit__(self, *exc):
+        self._session.close()
+
+
+def track_commits(db, request: Request):
+    """Marca `request.state.db_committed` quando a sessão faz commit (leitura das próprias escritas)."""
+    db.sync_session.info['request_state'] = request.state
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_commit(session):
+    state = session.info.get('request_state')
+    if state is not None:
+        state.db_committed = True
 
 
-def get_db():
+def get_sync_db():
+    """Sessão síncrona, para scripts e workers fora do event loop."""
+    init_engines()
     db = SessionLocal()
     try:
         yield db
@@ -88,4 +472,5 @@ def get_db():
 
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """create_all direto (bancos descartáveis: benchmarks e testes). Em produção: `alembic upgrade head`."""
+    Base.metadata.create_all(bind=init_engines())
@@ -0,0 +1,334 @@
+"""Geração dos documentos (receita/relatório) dos casos aprovados.
+
+Ao aprovar, a rota só cria um `Document` com job_status='queued'. O
+`DocumentWorker` reserva esses jobs em lotes e manda cada um para um pool de
+processos, que renderiza o PDF, grava o arquivo e assina os bytes com a chave
+Ed25519 da aplicação (`cryptography`). O resultado volta para o `Document`
+(file_path, signature, signed_by_doctor, signed_at, job_status='done').
+O arquivo é gravado em DOCUMENT_DIR e depois enviado ao storage configurado
+(app/storage.py); `file_path` guarda a chave no storage. Falha na renderização
+ou no envio devolve o job à fila com backoff (DOCUMENT_RETRY_BACKOFF, dobrando),
+até DOCUMENT_MAX_ATTEMPTS.
+
+A assinatura é destacada (base64 em `Document.signature`), verificável com a
+chave pública servida em /documents/public-key.
+"""
+import asyncio
+import base64
+import logging
+import os
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from sqlalchemy import or_, select
+from sqlalchemy.orm import joinedload
+
+from .config import (
+    DOCUMENT_DIR, DOCUMENT_SIGNING_KEY_PATH, DOCUMENT_WORKERS,
+    DOCUMENT_POLL_INTERVAL, DOCUMENT_MAX_ATTEMPTS, DOCUMENT_RETRY_BACKOFF,
+)
+from .database import Case, Document, open_session
+from .jobqueue import claim_rows, retry_delay
+from .storage import storage, LocalStorage
+
+logger = logging.getLogger(__name__)
+
+# Jobs "rendering" há mais tempo que isso voltam para a fila (processo morreu)
+RENDER_TIMEOUT = timedelta(minutes=5)
+
+DEFAULT_TEXTS = {
+    'receita': (
+        'Declaro, para os devidos fins, que avaliei a solicitação de renovação de receita '
+        'do(a) paciente acima identificado(a) e autorizo a continuidade do tratamento em uso, '
+        'conforme prescrição anterior.'
+    ),
+    'relatorio': (
+        'Declaro, para os devidos fins, que o(a) paciente acima identificado(a) encontra-se '
+        'em acompanhamento médico, conforme informações apresentadas nesta solicitação.'
+    ),
+}
+
+
+# ---------- PDF (roda nos processos do pool) ----------
+
+def _pdf_escape(text: str) -> bytes:
+    raw = text.encode('cp1252', errors='replace')
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def render_pdf(title: str, lines: List[str]) -> bytes:
+    """PDF mínimo (A4, Helvetica), sem dependências externas. Quebra em páginas de 50 linhas."""
+    wrapped = []
+    for line in lines:
+        wrapped.extend(textwrap.wrap(line, 90) or [''])
+    pages = [wrapped[i:i + 50] for i in range(0, len(wrapped), 50)] or [[]]
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # /Pages, preenchido depois que os ids das páginas são conhecidos
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    page_ids = []
+    for number, page_lines in enumerate(pages):
+        content = [b'BT', b'/F1 16 Tf', b'50 790 Td']
+        if number == 0:
+            content += [b'(' + _pdf_escape(title) + b') Tj', b'/F1 11 Tf', b'0 -30 Td']
+        else:
+            content += [b'/F1 11 Tf']
+        for line in page_lines:
+            content += [b'(' + _pdf_escape(line) + b') Tj', b'0 -14 Td']
+        content.append(b'ET')
+        stream = b'\n'.join(content)
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        content_id = len(objects)
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b' '.join(b'%d 0 R' % i for i in page_ids)
+    objects[1] = b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(page_ids)
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+_worker_key: Optional[Ed25519PrivateKey] = None
+
+
+def _init_render_process(key_pem: bytes):
+    global _worker_key
+    _worker_key = serialization.load_pem_private_key(key_pem, password=None)
+
+
+def render_and_sign(fields: dict, output_path: str) -> dict:
+    """Renderiza, grava e assina um documento. Executa dentro do pool de processos."""
+    lines = [
+        f"Pedido #{fields['case_id']} - {fields['request_type']}",
+        '',
+        f"Paciente: {fields['patient_name']}",
+        f"CPF: {fields['patient_cpf'] or '-'}",
+        '',
+        *fields['text'].splitlines(),
+        '',
+        f"Médico(a): {fields['doctor_name']}",
+        f"CRM: {fields['doctor_crm'] or '-'}/{fields['doctor_crm_uf'] or '-'}",
+        f"Data: {fields['date']}",
+        'Documento assinado digitalmente.',
+    ]
+    pdf = render_pdf(fields['title'], lines)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, output_path)
+    signature = _worker_key.sign(pdf)
+    return {'path': output_path, 'signature': base64.b64encode(signature).decode(), 'size': len(pdf)}
+
+
+# ---------- Chave de assinatura ----------
+
+def load_signing_key_pem() -> bytes:
+    """Lê a chave privada; se não houver, gera uma em DOCUMENT_DIR (apenas para ambiente local)."""
+    path = DOCUMENT_SIGNING_KEY_PATH or os.path.join(DOCUMENT_DIR, 'signing_key.pem')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    pem = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pem)
+    return pem
+
+
+def public_key_pem() -> bytes:
+    key = serialization.load_pem_private_key(load_signing_key_pem(), password=None)
+    return key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+# ---------- Fila e worker ----------
+
+def document_key(case_id: int) -> str:
+    return f'case-{case_id}.pdf'
+
+
+def document_fields(document: Document, case: Case, now: datetime) -> dict:
+    title = 'Renovação de Receita' if case.request_type == 'receita' else 'Relatório Médico'
+    return {
+        'case_id': case.id,
+        'request_type': case.request_type,
+        'title': title,
+        'patient_name': case.patient.full_name if case.patient else '',
+        'patient_cpf': case.patient.cpf if case.patient else None,
+        'doctor_name': case.doctor.full_name if case.doctor else '',
+        'doctor_crm': case.doctor.crm if case.doctor else None,
+        'doctor_crm_uf': case.doctor.crm_uf if case.doctor else None,
+        'text': document.generated_text or DEFAULT_TEXTS.get(case.request_type, ''),
+        'date': now.strftime('%d/%m/%Y'),
+    }
+
+
+async def claim_documents(db, limit: int) -> List[Document]:
+    now = datetime.utcnow()
+    ready = or_(
+        (Document.job_status == 'queued')
+        & or_(Document.next_attempt_at.is_(None), Document.next_attempt_at <= now),
+        (Document.job_status == 'rendering') & (Document.locked_at < now - RENDER_TIMEOUT),
+    )
+    return await claim_rows(db, Document, ready, {'job_status': 'rendering', 'locked_at': now}, limit)
+
+
+class DocumentWorker:
+    """Despacha os jobs de documento para um pool de processos com concorrência limitada."""
+
+    def __init__(self, processes: int = DOCUMENT_WORKERS, poll_interval: float = DOCUMENT_POLL_INTERVAL):
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            os.makedirs(DOCUMENT_DIR, exist_ok=True)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                initializer=_init_render_process,
+                initargs=(load_signing_key_pem(),),
+            )
+        return self._executor
+
+    def start(self):
+        if self._task is not None or self.processes <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def drain(self) -> int:
+        processed = 0
+        while True:
+            async with open_session() as db:
+                # Lote do tamanho do pool: cada processo recebe no máximo um job por vez
+                batch = await claim_documents(db, self.processes)
+                if not batch:
+                    return processed
+                await self._render_batch(db, batch)
+                processed += len(batch)
+
+    async def _render_batch(self, db, documents: List[Document]):
+        cases = {
+            case.id: case for case in (await db.scalars(
+                select(Case).options(joinedload(Case.patient), joinedload(Case.doctor))
+                .where(Case.id.in_([d.case_id for d in documents]))
+            )).all()
+        }
+        now = datetime.utcnow()
+        renderable = []
+        for document in documents:
+            case = cases.get(document.case_id)
+            if case is None:
+                # Caso apagado (reset) ou arquivado depois de entrar na fila: tentar de novo não adianta
+                logger.error('Documento %s sem o caso %s', document.id, document.case_id)
+                document.attempts = (document.attempts or 0) + 1
+                document.job_status = 'failed'
+                document.job_error = f'Caso {document.case_id} não encontrado'
+                continue
+            try:
+                renderable.append((document, document_fields(document, case, now)))
+            except Exception as e:
+                logger.error('Falha ao preparar documento %s: %r', document.id, e)
+                self._fail(document, e, now)
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor() if renderable else None
+        futures = [
+            loop.run_in_executor(
+                executor, render_and_sign, fields,
+                os.path.join(DOCUMENT_DIR, document_key(document.case_id)),
+            )
+            for document, fields in renderable
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        for (document, _), result in zip(renderable, results):
+            if isinstance(result, Exception):
+                logger.error('Falha ao gerar documento %s: %r', document.id, result)
+                self._fail(document, result, now)
+                continue
+            try:
+                await self._store(document_key(document.case_id), result['path'])
+            except Exception as e:
+                logger.error('Falha ao enviar documento %s ao storage: %r', document.id, e)
+                self._fail(document, e, now)
+                continue
+            document.file_path = document_key(document.case_id)
+            document.signature = result['signature']
+            document.signed_by_doctor = True
+            document.signed_at = datetime.utcnow()
+            document.job_status = 'done'
+            document.job_error = None
+            document.next_attempt_at = None
+        await db.commit()
+
+    @staticmethod
+    def _fail(document: Document, error: Exception, now: datetime):
+        """Conta a tentativa; volta para a fila só depois do backoff (ex.: S3 fora do ar por alguns minutos)."""
+        document.attempts = (document.attempts or 0) + 1
+        document.job_error = repr(error)
+        if document.attempts >= DOCUMENT_MAX_ATTEMPTS:
+            document.job_status = 'failed'
+            return
+        document.job_status = 'queued'
+        document.next_attempt_at = now + retry_delay(document.attempts, DOCUMENT_RETRY_BACKOFF)
+
+    async def _store(self, key: str, local_path: str):
+        await storage.save_file(key, local_path)
+        if not isinstance(storage, LocalStorage):
+            os.remove(local_path)  # já está no S3; o disco local é só área de trabalho
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Erro processando fila de documentos')
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+document_worker = DocumentWorker()
@@ -0,0 +1,357 @@
+"""Rascunho (IA) do texto dos documentos, gerado antes de o médico abrir o caso.
+
+Quando um caso entra em 'pending_review' o `DraftPrefetcher` é acordado, busca os
+casos pagos ainda sem rascunho e grava um `Document(job_status='draft')` com o
+texto sugerido. A tela de revisão só lê esse texto; nunca espera o modelo.
+
+- Cache endereçado por conteúdo: a chave é o sha256 de (modelo, versão do prompt,
+  prompt). Primeiro um LRU em memória, depois a tabela `draft_cache`, que é
+  compartilhada entre processos e sobrevive a restart.
+- `DraftService` agrupa os pedidos que chegam juntos (até DRAFT_BATCH_SIZE ou
+  DRAFT_BATCH_WAIT_MS) e junta prompts idênticos. As chamadas simultâneas ao
+  modelo são limitadas a DRAFT_CONCURRENCY: o semáforo é do modelo e vale por
+  chamada (o lote do 'openai' vira uma chamada por prompt, cada uma com sua vaga).
+- O rascunho só é gravado se o caso ainda estiver 'pending_review' e sem Document,
+  conferido no próprio INSERT: o médico pode aprovar enquanto o modelo trabalha.
+- O modelo é plugável (DRAFT_BACKEND): 'stub' gera um texto determinístico a
+  partir dos modelos padrão, sem rede; 'openai' usa o SDK oficial (import tardio).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload
+
+from .cache import TTLCache
+from .config import (
+    DRAFT_BACKEND, DRAFT_MODEL, DRAFT_CONCURRENCY, DRAFT_BATCH_SIZE, DRAFT_BATCH_WAIT_MS,
+    DRAFT_CACHE_MAX_ENTRIES, DRAFT_PREFETCH_INTERVAL, DRAFT_PREFETCH_BATCH,
+)
+from .database import Case, Document, DraftCache, User, open_session
+
+logger = logging.getLogger(__name__)
+
+# Mudou o texto do prompt? Incrementa a versão para não reaproveitar rascunhos antigos
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = (
+    'Você é um assistente que redige o corpo de documentos médicos simples, em português, '
+    'para revisão de um(a) médico(a). Responda só com o texto do documento, em um ou dois '
+    'parágrafos, sem título, assinatura ou dados que não foram informados.'
+)
+
+REQUEST_LABELS = {
+    'receita': 'declaração de renovação de receita de uso contínuo',
+    'relatorio': 'relatório médico de acompanhamento',
+}
+
+
+GENERIC_TEXT = (
+    'Declaro, para os devidos fins, que avaliei a solicitação do(a) paciente acima identificado(a).'
+)
+
+
+def build_prompt(request_type: str, patient_name: str) -> str:
+    label = REQUEST_LABELS.get(request_type, request_type)
+    return f'Tipo de documento: {label}.\nPaciente: {patient_name}.'
+
+
+def draft_key(model: str, prompt: str) -> str:
+    raw = json.dumps([model, PROMPT_VERSION, prompt], ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# ---------- Modelos ----------
+
+class StubDraftModel:
+    """Modelo local: monta o texto a partir dos modelos padrão de app/documents.py."""
+    name = 'stub'
+
+    async def generate(self, prompts: Sequence[str], limiter: asyncio.Semaphore = None) -> List[str]:
+        if limiter is None:
+            return self._texts(prompts)
+        async with limiter:  # o lote inteiro é uma chamada só
+            return self._texts(prompts)
+
+    @staticmethod
+    def _texts(prompts: Sequence[str]) -> List[str]:
+        from .documents import DEFAULT_TEXTS
+
+        texts = []
+        for prompt in prompts:
+            request_type = next(
+                (key for key, label in REQUEST_LABELS.items() if label in prompt), None
+            )
+            texts.append(DEFAULT_TEXTS.get(request_type, GENERIC_TEXT))
+        return texts
+
+
+class OpenAIDraftModel:
+    """Chat Completions da OpenAI. O SDK só é importado quando usado."""
+
+    def __init__(self, model: str = DRAFT_MODEL):
+        self.name = f'openai:{model}'
+        self.model = model
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI  # OPENAI_API_KEY vem do ambiente
+            self._client = AsyncOpenAI()
+        return self._client
+
+    async def _complete(self, prompt: str, limiter: Optional[asyncio.Semaphore]) -> str:
+        if limiter is not None:
+            async with limiter:
+                return await self._complete(prompt, None)
+        response = await self._get_client().chat.completions.create(
+            model=self.model,
+            temperature=0,
+            messages=[
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': prompt},
+            ],
+        )
+        return response.choices[0].message.content.strip()
+
+    async def generate(self, prompts: Sequence[str], limiter: asyncio.Semaphore = None) -> List[str]:
+        # A API não tem lote síncrono; o lote vira chamadas paralelas, cada uma ocupando uma vaga do limiter
+        return list(await asyncio.gather(*(self._complete(prompt, limiter) for prompt in prompts)))
+
+
+def get_draft_model():
+    if DRAFT_BACKEND == 'openai':
+        return OpenAIDraftModel()
+    if DRAFT_BACKEND == 'stub':
+        return StubDraftModel()
+    raise RuntimeError(f'DRAFT_BACKEND desconhecido: {DRAFT_BACKEND}')
+
+
+# ---------- Serviço (cache + lotes) ----------
+
+class DraftService:
+    def __init__(self, model, concurrency: int = DRAFT_CONCURRENCY, batch_size: int = DRAFT_BATCH_SIZE,
+                 batch_wait_ms: int = DRAFT_BATCH_WAIT_MS, cache_size: int = DRAFT_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000
+        self.cache = TTLCache(cache_size, ttl=None)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._concurrency = concurrency
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._queue: List[tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def key_for(self, prompt: str) -> str:
+        return draft_key(self.model.name, prompt)
+
+    async def lookup(self, db, keys: Sequence[str]) -> Dict[str, str]:
+        """Busca no LRU e, para o que faltar, na tabela draft_cache (um SELECT só)."""
+        found = {}
+        missing = []
+        for key in keys:
+            text = self.cache.get(key)
+            if text is None:
+                missing.append(key)
+            else:
+                found[key] = text
+        if missing:
+            rows = (await db.execute(
+                select(DraftCache.key, DraftCache.text).where(DraftCache.key.in_(missing))
+            )).all()
+            for key, text in rows:
+                self.cache.set(key, text)
+                found[key] = text
+        return found
+
+    async def store(self, db, texts: Dict[str, str]):
+        """Grava no draft_cache ignorando chaves que outro processo já gravou. Não faz commit."""
+        if not texts:
+            return
+        rows = [
+            {'key': key, 'model': self.model.name, 'text': text, 'created_at': datetime.utcnow()}
+            for key, text in texts.items()
+        ]
+        dialect = db.bind.dialect.name
+        if dialect == 'postgresql':
+            stmt = postgresql.insert(DraftCache).values(rows).on_conflict_do_nothing()
+        elif dialect == 'sqlite':
+            stmt = sqlite.insert(DraftCache).values(rows).on_conflict_do_nothing()
+        else:
+            existing = set((await db.scalars(select(DraftCache.key).where(DraftCache.key.in_(texts)))).all())
+            rows = [row for row in rows if row['key'] not in existing]
+            if not rows:
+                return
+            stmt = DraftCache.__table__.insert().values(rows)
+        await db.execute(stmt)
+        for key, text in texts.items():
+            self.cache.set(key, text)
+
+    async def generate(self, prompt: str) -> str:
+        """Gera o texto de um prompt; pedidos próximos no tempo vão juntos para o modelo."""
+        key = self.key_for(prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._queue.append((key, prompt))
+            if len(self._queue) >= self.batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.batch_wait, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._queue = self._queue, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[tuple]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        try:
+            # O semáforo vai para o modelo, que o ocupa uma vez por chamada à API (não por lote)
+            texts = await self.model.generate([prompt for _, prompt in batch], limiter=self._semaphore)
+        except Exception as e:
+            for key, _ in batch:
+                future = self._inflight.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (key, _), text in zip(batch, texts):
+            self.cache.set(key, text)
+            future = self._inflight.pop(key)
+            if not future.done():
+                future.set_result(text)
+
+
+draft_service = DraftService(get_draft_model())
+
+
+# ---------- Pré-geração ----------
+
+async def cases_without_draft(db, limit: int) -> List[Case]:
+    has_document = select(Document.id).where(Document.case_id == Case.id).exists()
+    return list((await db.scalars(
+        select(Case)
+        .options(joinedload(Case.patient).load_only(User.id, User.full_name))
+        .where(Case.status == 'pending_review', ~has_document)
+        .order_by(Case.created_at, Case.id)
+        .limit(limit)
+    )).all())
+
+
+async def prefetch_drafts(db, cases: Sequence[Case], service: DraftService = None) -> int:
+    """Gera (ou busca no cache) o rascunho de cada caso e grava os `Document` 'draft'."""
+    service = service or draft_service
+    prompts = {
+        case.id: build_prompt(case.request_type, case.patient.full_name if case.patient else '')
+        for case in cases
+    }
+    keys = {case_id: service.key_for(prompt) for case_id, prompt in prompts.items()}
+    texts = await service.lookup(db, list(set(keys.values())))
+
+    missing = {keys[case_id]: prompt for case_id, prompt in prompts.items() if keys[case_id] not in texts}
+    results = await asyncio.gather(
+        *(service.generate(prompt) for prompt in missing.values()), return_exceptions=True
+    )
+    generated = {}
+    for key, result in zip(missing, results):
+        if isinstance(result, Exception):
+            logger.error('Falha ao gerar rascunho: %r', result)
+            continue
+        generated[key] = result
+    await service.store(db, generated)
+    texts.update(generated)
+
+    created = 0
+    for case_id, key in keys.items():
+        if key in texts:
+            result = await db.execute(insert_draft(db, case_id, texts[key]))
+            created += result.rowcount
+    await db.commit()
+    return created
+
+
+def insert_draft(db, case_id: int, text: str):
+    """INSERT ... SELECT do rascunho, só se o caso ainda está pending_review e sem Document.
+
+    Os casos foram lidos antes de o modelo rodar; se nesse meio tempo o médico
+    aprovou (e criou o Document 'queued'), nada é gravado, senão o rascunho sem
+    arquivo passaria a ser o `latest_document` do caso. No Postgres o FOR UPDATE
+    espera o UPDATE de `complete_review` na mesma linha e reavalia o status.
+    """
+    has_document = select(Document.id).where(Document.case_id == Case.id).exists()
+    source = select(
+        Case.id, literal('draft'), literal(text), literal(datetime.utcnow()),
+    ).where(Case.id == case_id, Case.status == 'pending_review', ~has_document)
+    if db.bind.dialect.name == 'postgresql':
+        source = source.with_for_update(of=Case)
+    return insert(Document).from_select(['case_id', 'job_status', 'generated_text', 'queued_at'], source)
+
+
+class DraftPrefetcher:
+    """Tarefa de fundo que prepara os rascunhos dos casos recém-pagos."""
+
+    def __init__(self, batch_size: int = DRAFT_PREFETCH_BATCH, poll_interval: float = DRAFT_PREFETCH_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        if self._task is not None or self.batch_size <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self):
+        """Chamado quando um caso entra em 'pending_review'."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def drain(self) -> int:
+        created = 0
+        while True:
+            async with open_session() as db:
+                cases = await cases_without_draft(db, self.batch_size)
+                if not cases:
+                    return created
+                count = await prefetch_drafts(db, cases)
+                created += count
+                if count < len(cases):
+                    return created  # modelo falhando; tenta de novo no próximo ciclo
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Erro pré-gerando rascunhos')
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+draft_prefetcher = DraftPrefetcher()
@@ -0,0 +1,162 @@
+"""Eventos de mudança de estado dos casos, entregues aos médicos por SSE.
+
+As rotas e os workers publicam depois do commit (`publish_case_event`) e cada
+conexão aberta em /doctor/events assina o `case_events`. O evento leva o resumo
+do caso (o mesmo que o dashboard mostra), então a página se atualiza sem
+consultar o servidor de novo.
+
+- 'memory' (padrão): pub/sub dentro do processo; serve para um worker só.
+- 'postgres': publica com NOTIFY e cada processo escuta com LISTEN (asyncpg),
+  repassando para os assinantes locais. Necessário com vários workers/instâncias.
+
+Cada assinante tem uma fila limitada; se ela encher (cliente lento) o assinante
+recebe um evento 'reset' e a página se recarrega por inteiro.
+"""
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional, Sequence, Set
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import joinedload
+
+from .config import DATABASE_URL, EVENTS_BACKEND, SSE_QUEUE_SIZE
+from .database import Case, User
+
+logger = logging.getLogger(__name__)
+
+PG_CHANNEL = 'case_events'
+RESET = {'type': 'reset'}
+
+
+class InProcessBroker:
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @asynccontextmanager
+    async def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    def deliver(self, event: dict):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente não acompanhou: descarta o atraso e manda recarregar
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESET)
+
+    async def publish(self, event: dict):
+        self.deliver(event)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+
+class PostgresBroker(InProcessBroker):
+    """Mesmo contrato, mas o evento passa pelo Postgres (NOTIFY/LISTEN)."""
+
+    def __init__(self, url: str, queue_size: int = SSE_QUEUE_SIZE):
+        super().__init__(queue_size)
+        # asyncpg não entende o "+driver" da URL do SQLAlchemy
+        self.dsn = make_url(url).set(drivername='postgresql').render_as_string(hide_password=False)
+        self._listen_conn = None
+        self._notify_conn = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        import asyncpg
+
+        self._listen_conn = await asyncpg.connect(self.dsn)
+        await self._listen_conn.add_listener(PG_CHANNEL, self._on_notify)
+
+    async def stop(self):
+        for conn in (self._listen_conn, self._notify_conn):
+            if conn is not None:
+                await conn.close()
+        self._listen_conn = self._notify_conn = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.deliver(json.loads(payload))
+
+    async def publish(self, event: dict):
+        import asyncpg
+
+        async with self._lock:
+            if self._notify_conn is None or self._notify_conn.is_closed():
+                self._notify_conn = await asyncpg.connect(self.dsn)
+            await self._notify_conn.execute('SELECT pg_notify($1, $2)', PG_CHANNEL, json.dumps(event))
+
+
+def get_broker():
+    if EVENTS_BACKEND == 'postgres':
+        return PostgresBroker(DATABASE_URL)
+    if EVENTS_BACKEND == 'memory':
+        return InProcessBroker()
+    raise RuntimeError(f'EVENTS_BACKEND desconhecido: {EVENTS_BACKEND}')
+
+
+case_events = get_broker()
+
+
+# ---------- Publicação ----------
+
+def case_summary(case: Case) -> dict:
+    return {
+        'id': case.id,
+        'request_type': case.request_type,
+        'status': case.status,
+        'patient_name': case.patient.full_name if case.patient else '',
+        'created_at': case.created_at.isoformat() if case.created_at else None,
+        'updated_at': case.updated_at.isoformat() if case.updated_at else None,
+        'claimed_by_id': case.claimed_by_id,
+        'lease_expires_at': case.lease_expires_at.isoformat() if case.lease_expires_at else None,
+        'doctor_id': case.doctor_id,
+    }
+
+
+async def publish_case_event(db, event_type: str, case_ids: Sequence[int]):
+    """Publica `event_type` para cada caso (chamar depois do commit).
+
+    Tipos: case.paid, case.claimed, case.released, case.approved, case.rejected.
+    Falha na publicação é só registrada: o dashboard ainda funciona recarregando.
+    """
+    if not case_ids:
+        return
+    try:
+        cases = (await db.scalars(
+            select(Case).options(joinedload(Case.patient).load_only(User.id, User.full_name))
+            .where(Case.id.in_(list(case_ids)))
+            .execution_options(populate_existing=True)
+        )).all()
+        at = datetime.utcnow().isoformat()
+        for case in cases:
+            await case_events.publish({'type': event_type, 'at': at, 'case': case_summary(case)})
+    except Exception:
+        logger.exception('Falha ao publicar %s', event_type)
+
+
+def format_sse(event: dict, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"event: {event['type']}")
+    lines.append('data: ' + json.dumps(event, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
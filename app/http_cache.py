@@ -0,0 +1,208 @@
+"""GET condicional (ETag/Last-Modified) e compressão das respostas HTML/JSON.
+
+Validadores: antes de montar a página, a rota calcula um ETag barato a partir de
+agregados dos casos que o usuário enxerga (max(updated_at) e contagens) mais a
+URL e a versão dos templates. Se bater com o If-None-Match, responde 304 sem
+consultar a página nem renderizar. `Cache-Control: private, no-cache` faz o
+navegador revalidar sempre, e a resposta nunca fica num cache compartilhado.
+
+Compressão (`CompressionMiddleware`): brotli quando o cliente aceita e o pacote
+`brotli` está instalado, senão gzip. Só comprime respostas completas (não
+streaming: SSE e download de documentos passam direto), de tipos texto/JSON e
+acima de COMPRESSION_MIN_SIZE bytes.
+"""
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+import anyio
+from sqlalchemy import func, select
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import COMPRESSION_MIN_SIZE, GZIP_LEVEL, BROTLI_QUALITY
+from .database import Case
+from .templating import TEMPLATE_DIR, STATIC_DIR
+from .work_queue import claimable
+
+try:
+    import brotli
+except ImportError:  # opcional: sem o pacote, só gzip
+    brotli = None
+
+CACHE_CONTROL = 'private, no-cache'
+
+# Acima disso a compressão sai do event loop
+THREAD_THRESHOLD = 256 * 1024
+
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript', 'text/javascript',
+)
+
+
+def _templates_version() -> str:
+    """Hash dos templates e estáticos: um deploy que muda o HTML invalida os ETags antigos."""
+    digest = hashlib.sha256()
+    for directory in (TEMPLATE_DIR, STATIC_DIR):
+        for root, _, files in sorted(os.walk(directory)):
+            for name in sorted(files):
+                with open(os.path.join(root, name), 'rb') as f:
+                    digest.update(name.encode() + f.read())
+    return digest.hexdigest()[:12]
+
+
+TEMPLATES_VERSION = _templates_version()
+
+
+# ---------- Validadores ----------
+
+@dataclass
+class Validator:
+    etag: str
+    last_modified: Optional[datetime] = None
+
+    def headers(self) -> dict:
+        headers = {'ETag': self.etag, 'Cache-Control': CACHE_CONTROL}
+        if self.last_modified is not None:
+            # updated_at é gravado em UTC sem fuso (datetime.utcnow)
+            headers['Last-Modified'] = format_datetime(
+                self.last_modified.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True
+            )
+        return headers
+
+    def matches(self, request: Request) -> bool:
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            # Comparação fraca: o gzip/brotli não invalida o ETag
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or self.etag.removeprefix('W/') in tags
+        if_modified_since = request.headers.get('if-modified-since')
+        if if_modified_since and self.last_modified is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).astimezone(timezone.utc).replace(tzinfo=None)
+            except (TypeError, ValueError):
+                return False
+            return self.last_modified.replace(microsecond=0) <= since
+        return False
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self.headers())
+
+    def apply(self, response: Response) -> Response:
+        response.headers.update(self.headers())
+        return response
+
+
+def make_validator(request: Request, user_id: int, *parts, last_modified: Optional[datetime] = None) -> Validator:
+    raw = '|'.join(str(p) for p in (TEMPLATES_VERSION, request.url.path, request.url.query, user_id, *parts))
+    return Validator('W/"%s"' % hashlib.sha256(raw.encode()).hexdigest()[:20], last_modified)
+
+
+async def patient_cases_validator(db, request: Request, patient) -> Validator:
+    newest, total = (await db.execute(
+        select(func.max(Case.updated_at), func.count(Case.id)).where(Case.patient_id == patient.id)
+    )).one()
+    return make_validator(request, patient.id, newest, total, last_modified=newest)
+
+
+async def doctor_cases_validator(db, request: Request, doctor) -> Validator:
+    """Fila visível (claimable agora, então reservas expiradas mudam a contagem) + casos revisados.
+
+    Sem Last-Modified: uma reserva que expira muda a página sem mudar nenhum updated_at.
+    """
+    pending_newest, pending_total = (await db.execute(
+        select(func.max(Case.updated_at), func.count(Case.id)).where(claimable(datetime.utcnow(), doctor.id))
+    )).one()
+    reviewed_newest, reviewed_total = (await db.execute(
+        select(func.max(Case.updated_at), func.count(Case.id)).where(Case.doctor_id == doctor.id)
+    )).one()
+    return make_validator(request, doctor.id, pending_newest, pending_total, reviewed_newest, reviewed_total)
+
+
+def case_validator(request: Request, user_id: int, case: Case, *parts) -> Validator:
+    return make_validator(request, user_id, case.id, case.updated_at, case.status, *parts,
+                          last_modified=case.updated_at)
+
+
+# ---------- Compressão ----------
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = set()
+    for item in accept_encoding.split(','):
+        token, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(token.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        encoding = _accepted_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                content_type = headers.get('content-type', '').split(';')[0].strip()
+                if (
+                    message['status'] not in (200, 201, 202, 203) or 'content-encoding' in headers
+                    or content_type not in COMPRESSIBLE_TYPES
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message  # espera o corpo para decidir
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            headers = MutableHeaders(raw=start_message['headers'])
+            headers.add_vary_header('Accept-Encoding')
+            if message.get('more_body', False) or len(body) < self.minimum_size:
+                # Streaming ou pequeno demais: segue sem compressão
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            if len(body) > THREAD_THRESHOLD:
+                compressed = await anyio.to_thread.run_sync(_compress, body, encoding)
+            else:
+                compressed = _compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(compressed))
+            await send(start_message)
+            await send({'type': 'http.response.body', 'body': compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,47 @@
+"""Reserva de lotes em tabelas usadas como fila (notificações, documentos, ...).
+
+No Postgres usa SELECT ... FOR UPDATE SKIP LOCKED; nos demais bancos, um UPDATE
+condicional por linha (só a primeira instância que mudar a linha fica com ela).
+
+Linha que falhou volta para a fila com `next_attempt_at` no futuro (`retry_delay`):
+sem isso o próprio worker a pegaria de novo na hora e gastaria todas as
+tentativas em milissegundos durante uma queda do serviço externo.
+"""
+import random
+from datetime import timedelta
+from typing import List
+
+from sqlalchemy import select, update
+
+
+async def claim_rows(db, model, ready, values: dict, limit: int) -> List:
+    """Marca até `limit` linhas que satisfazem `ready` com `values` e as devolve."""
+    stmt = select(model.id).where(ready).order_by(model.id).limit(limit)
+    if db.bind.dialect.name == 'postgresql':
+        ids = [row.id for row in (await db.execute(stmt.with_for_update(skip_locked=True))).all()]
+        if ids:
+            await db.execute(
+                update(model).where(model.id.in_(ids)).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+    else:
+        ids = []
+        for (row_id,) in (await db.execute(stmt)).all():
+            result = await db.execute(
+                update(model).where(model.id == row_id, ready).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                ids.append(row_id)
+    await db.commit()
+    if not ids:
+        return []
+    return list((await db.scalars(
+        select(model).where(model.id.in_(ids)).order_by(model.id)
+        .execution_options(populate_existing=True)
+    )).all())
+
+
+def retry_delay(attempts: int, backoff: float) -> timedelta:
+    """Backoff exponencial com jitter: ~backoff, 2x, 4x, ... (±25%) após a 1ª, 2ª, 3ª falha."""
+    return timedelta(seconds=backoff * 2 ** (max(attempts, 1) - 1) * random.uniform(0.75, 1.25))
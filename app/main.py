@@ -1,17 +1,84 @@
 from fastapi import FastAPI,Depends,HTTPException,Request,Form
-from fastapi.responses import HTMLResponse,RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from datetime import timedelta
-import mercadopago
-from .database import get_db,init_db,User,Case,Document
-from .auth import get_password_hash,verify_password,create_access_token,get_current_user
+import asyncio
+from fastapi.responses import HTMLResponse,JSONResponse,RedirectResponse,Response,StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from datetime import date, datetime, timedelta
+from sqlalchemy.engine import Engine
+from contextlib import asynccontextmanager
+from .database import get_db,init_engines,warm_up,dispose_engines,User,Case,CaseArchive,Document,PaymentNotification
+from .auth import get_password_hash_async,verify_and_update_password_async,create_access_token,get_current_user,invalidate_user_cache,require_admin
+from .pagination import Page,paginate_cases,filter_cases
+from .work_queue import claimable,claim_next_cases,claim_case,release_case,complete_review
+from .payments import mercadopago_client,build_preference,checkout_flight,checkout_slots,checkout_attempt,MercadoPagoError,CircuitOpenError
+from .webhooks import payment_worker,verify_signature,apply_payment
+from .documents import document_worker,public_key_pem
+from .storage import storage,parse_range,StorageError
+from .drafts import draft_prefetcher
+from .events import case_events,publish_case_event,format_sse
+from .metrics import MetricsMiddleware,instrument_engine,render_metrics
+from .templating import templates,static_assets
+from .http_cache import CompressionMiddleware,patient_cases_validator,doctor_cases_validator,case_validator
+from .ratelimit import rate_limiter,LoadShedMiddleware
+from .bulk import IMPORTERS,EXPORTS,FORMATS,BulkError,detect_format,export_rows
+from .stats import StatsDelta,stats_reconciler,case_stats,stats_range
+from .archive import archive_mover,find_case,latest_document,reset_all,size_report
+from .replicas import replica_pool,replica_health,get_read_db,ReadYourWritesMiddleware
+from .notifications import enqueue_case_notification,notification_dispatcher
 from .config import *
 import os
-import requests, json # Importar requests e json aqui
-
-app = FastAPI(title='App Médico')
-templates = Jinja2Templates(directory='app/templates')
+import json
+from typing import Optional
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Engine e pool nascem aqui, não no import; o aquecimento abre as primeiras
+    # conexões antes de o uvicorn aceitar requisições
+    init_engines()
+    await warm_up()
+    await replica_pool.check()
+    replica_health.start()
+    await case_events.start()
+    if MERCADOPAGO_WEBHOOK_SECRET:
+        payment_worker.start()
+    document_worker.start()
+    draft_prefetcher.start()
+    stats_reconciler.start()
+    archive_mover.start()
+    notification_dispatcher.start()
+    yield
+    await notification_dispatcher.stop()
+    await payment_worker.stop()
+    await document_worker.stop()
+    await draft_prefetcher.stop()
+    await stats_reconciler.stop()
+    await archive_mover.stop()
+    await replica_health.stop()
+    await case_events.stop()
+    await mercadopago_client.aclose()
+    await replica_pool.dispose()
+    await dispose_engines()
+
+
+app = FastAPI(title='App Médico', lifespan=lifespan)
+app.add_middleware(LoadShedMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Na classe: vale para os engines criados depois (init_engines) e para o sync_engine do async
+instrument_engine(Engine)
+
+
+# Carrega o paciente no mesmo SELECT do caso (sem N+1) e só com as colunas que os
+# templates exibem, para não trazer a linha inteira de users (ex.: hashed_password).
+CASE_PATIENT_NAME = joinedload(Case.patient).load_only(User.id, User.full_name)
+ARCHIVED_CASE_PATIENT_NAME = joinedload(CaseArchive.patient).load_only(User.id, User.full_name)
+CASE_PATIENT_CONTACT = joinedload(Case.patient).load_only(
+    User.id, User.full_name, User.email, User.cpf, User.phone
+)
 
 # ---------- PÁGINA INICIAL (protegida por login) ----------
 
@@ -28,15 +95,22 @@ async def home(request: Request, current_user: User = Depends(get_current_user))
     )
 
 
-# ---------- SETUP DB ----------
+# ---------- ARQUIVOS ESTÁTICOS ----------
+
+@app.get('/static/{filename}')
+async def static_file(request: Request, filename: str):
+    # /static/app.<hash>.css: cache de um ano (a URL muda junto com o conteúdo)
+    return static_assets.response(request, filename)
 
-@app.get('/setup-db')
-async def setup_database():
-    try:
-        init_db()
-        return {'message': 'Database initialized'}
-    except Exception as e:
-        return {'error': str(e)}
+
+# ---------- MÉTRICAS ----------
+
+@app.get('/metrics')
+async def metrics(request: Request):
+    # Formato texto do Prometheus; com METRICS_TOKEN definido, exige o token
+    if METRICS_TOKEN and request.headers.get('authorization') != f'Bearer {METRICS_TOKEN}':
+        raise HTTPException(status_code=401, detail='Não autorizado')
+    return Response(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 # ---------- LOGIN / LOGOUT / REGISTRO ----------
@@ -48,13 +122,28 @@ async def login_page(request: Request):
 
 @app.post('/login')
 async def login(
+    request: Request,
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+    # Antes de qualquer SELECT/bcrypt: por IP, por email tentado e da rota inteira
+    await rate_limiter.check(request, 'login', user=email.strip().lower())
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user:
         return RedirectResponse(url='/login?error=1', status_code=303)
+    # Devolve a conexão ao pool enquanto o bcrypt roda (o objeto continua utilizável)
+    await db.close()
+    valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not valid:
+        return RedirectResponse(url='/login?error=1', status_code=303)
+
+    # Refaz o hash de forma transparente se o fator de custo mudou
+    if new_hash:
+        user.hashed_password = new_hash
+        db.add(user)
+        await db.commit()
+        invalidate_user_cache(user.email)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -94,6 +183,7 @@ async def register_page(request: Request):
 
 @app.post('/register')
 async def register(
+    request: Request,
     email: str = Form(...),
     password: str = Form(...),
     full_name: str = Form(...),
@@ -102,15 +192,17 @@ async def register(
     phone: str = Form(...),
     crm: str = Form(None),
     crm_uf: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    existing_user = db.query(User).filter(User.email == email).first()
+    await rate_limiter.check(request, 'register')
+    existing_user = await db.scalar(select(User).where(User.email == email))
     if existing_user:
         raise HTTPException(status_code=400, detail='Email já cadastrado')
+    await db.close()  # não segura a conexão durante o hash
 
     user = User(
         email=email,
-        hashed_password=get_password_hash(password),
+        hashed_password=await get_password_hash_async(password),
         full_name=full_name,
         user_type=user_type,
         cpf=cpf,
@@ -119,103 +211,107 @@ async def register(
         crm_uf=crm_uf if user_type == 'doctor' else None
     )
     db.add(user)
-    db.commit()
+    await db.commit()
     return RedirectResponse(url='/login', status_code=303)
 
 
-# ---------- RESET CADASTROS (temporário, SEM proteção) ----------
+# ---------- RESET CADASTROS (admin, apaga em lotes) ----------
+
+@app.post('/admin/reset', dependencies=[Depends(require_admin)])
+async def reset_database(db: AsyncSession = Depends(get_db)):
+    # Apaga em lotes (commit por lote); se cair no meio, chamar de novo termina o serviço
+    deleted = await reset_all(db)
+    invalidate_user_cache()
+    return {'message': 'Todos os cadastros foram apagados com sucesso', 'deleted': deleted}
+
+
+@app.get('/admin/archive', dependencies=[Depends(require_admin)])
+async def archive_report(db: AsyncSession = Depends(get_db)):
+    # Linhas e bytes das tabelas quentes (cases/documents) e frias (*_archive)
+    return await size_report(db)
 
-@app.get('/admin/reset')
-async def reset_database(db: Session = Depends(get_db)):
+
+# ---------- IMPORTAÇÃO / EXPORTAÇÃO EM LOTE (admin) ----------
+
+@app.post('/admin/import/{kind}', dependencies=[Depends(require_admin)])
+async def bulk_import(
+    kind: str,
+    request: Request,
+    format: Optional[str] = None,
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    # Corpo CSV (com cabeçalho) ou JSONL, lido em streaming; ex.:
+    # curl --data-binary @medicos.csv -H 'Content-Type: text/csv' -H 'Authorization: Bearer ...' /admin/import/users
+    importer = IMPORTERS.get(kind)
+    if importer is None:
+        raise HTTPException(status_code=404, detail='Use /admin/import/users ou /admin/import/cases')
     try:
-        db.query(Document).delete() # Apaga documentos primeiro
-        db.query(Case).delete()     # Apaga casos
-        db.query(User).delete()     # Apaga usuários
-        db.commit()
-        return {'message': 'Todos os cadastros foram apagados com sucesso'}
-    except Exception as e:
-        db.rollback()
-        return {'error': str(e)}
+        fmt = detect_format(request.headers.get('content-type', ''), format)
+        report = await importer(db, request.stream(), fmt, dry_run=dry_run)
+    except BulkError as e:
+        raise HTTPException(status_code=400, detail=e.detail)
+    return report.as_dict()
+
+
+@app.get('/admin/export/{kind}', dependencies=[Depends(require_admin)])
+async def bulk_export(
+    kind: str,
+    format: str = 'csv',
+    user_type: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    if kind not in EXPORTS or format not in FORMATS:
+        raise HTTPException(status_code=404, detail='Use /admin/export/users|cases?format=csv|jsonl')
+    columns, make_query = EXPORTS[kind]
+    query = make_query(user_type) if kind == 'users' else make_query(status, created_from, created_to)
+    filename = f'{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}'
+    return StreamingResponse(
+        export_rows(query, columns, format),
+        media_type=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+# ---------- ESTATÍSTICAS (admin) ----------
+
+@app.get('/api/stats', dependencies=[Depends(require_admin)])
+async def get_case_stats(days: int = 30, end: Optional[date] = None, db: AsyncSession = Depends(get_read_db)):
+    # Lê só as tabelas de agregados (app/stats.py): o custo não cresce com o número de casos
+    start, end = stats_range(days, end)
+    return await case_stats(db, start, end)
 
 
 # ---------- PIX (TESTE) ----------
 
+def mercadopago_http_error(e: MercadoPagoError) -> HTTPException:
+    # Circuito aberto: 503 para o cliente tentar de novo mais tarde
+    return HTTPException(status_code=503 if isinstance(e, CircuitOpenError) else 500, detail=e.detail)
+
+
 @app.post('/pagamento/pix')
 async def criar_pagamento_pix(
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    if not MERCADOPAGO_ACCESS_TOKEN:
+    if not mercadopago_client.configured:
         raise HTTPException(
             status_code=500,
             detail='Mercado Pago não configurado (ACCESS_TOKEN ausente).'
         )
 
-    amount = 50.0
-
-    preference_data = {
-        "items": [
-            {
-                "title": "Renovação de receita / relatório médico",
-                "quantity": 1,
-                "unit_price": amount,
-                "currency_id": "BRL"
-            }
-        ],
-        "payer": {
-            "email": current_user.email
-        },
-        "payment_methods": {
-            "excluded_payment_types": [
-                {"id": "credit_card"},
-                {"id": "debit_card"}
-            ]
-        },
-        "back_urls": {
-            "success": "https://app-medico-hfb0.onrender.com/",
-            "failure": "https://app-medico-hfb0.onrender.com/",
-            "pending": "https://app-medico-hfb0.onrender.com/"
-        },
-        "auto_return": "approved"
-    }
-
-    headers = {
-        "Authorization": f"Bearer {MERCADOPAGO_ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
+    preference_data = build_preference(
+        title='Renovação de receita / relatório médico',
+        payer_email=current_user.email
+    )
 
     try:
-        response = requests.post(
-            "https://api.mercadopago.com/checkout/preferences",
-            json=preference_data,
-            headers=headers,
-            timeout=15
-        )
-
-        if response.status_code != 201:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Erro do Mercado Pago: {response.status_code} - {response.text}"
-            )
-
-        data = response.json()
+        data = await mercadopago_client.create_preference(preference_data)
+    except MercadoPagoError as e:
+        raise mercadopago_http_error(e)
 
-        init_point = data.get("init_point")
-        if not init_point:
-            raise HTTPException(
-                status_code=500,
-                detail=f"init_point não encontrado. Resposta: {data}"
-            )
-
-        return {"checkout_url": init_point}
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erro ao criar pagamento PIX (exceção): {repr(e)}"
-        )
+    return {"checkout_url": data['init_point']}
 
 
 @app.get('/teste-pix', response_class=HTMLResponse)
@@ -263,23 +359,87 @@ async def teste_pix_page(request: Request, current_user: User = Depends(get_curr
     return HTMLResponse(html)
 
 
+# ---------- LISTAGENS PAGINADAS (keyset) ----------
+
+async def patient_cases_page(db, patient, cursor, limit, status=None, request_type=None) -> Page:
+    stmt = filter_cases(select(Case).where(Case.patient_id == patient.id), status, request_type)
+    archived = filter_cases(
+        select(CaseArchive).where(CaseArchive.patient_id == patient.id), status, request_type, model=CaseArchive
+    )
+    return await paginate_cases(db, stmt, Case.created_at, descending=True, cursor=cursor, limit=limit,
+                                archived=archived)
+
+async def pending_cases_page(db, doctor, cursor, limit, request_type=None) -> Page:
+    # Mais antigos primeiro: fila de revisão, sem os casos reservados por outros médicos
+    stmt = filter_cases(
+        select(Case).options(CASE_PATIENT_NAME).where(claimable(datetime.utcnow(), doctor.id)),
+        request_type=request_type
+    )
+    return await paginate_cases(db, stmt, Case.created_at, descending=False, cursor=cursor, limit=limit)
+
+async def reviewed_cases_page(db, doctor, cursor, limit, status=None, request_type=None) -> Page:
+    stmt = filter_cases(
+        select(Case).options(CASE_PATIENT_NAME).where(Case.doctor_id == doctor.id),
+        status, request_type
+    )
+    archived = filter_cases(
+        select(CaseArchive).options(ARCHIVED_CASE_PATIENT_NAME).where(CaseArchive.doctor_id == doctor.id),
+        status, request_type, model=CaseArchive
+    )
+    return await paginate_cases(db, stmt, Case.updated_at, descending=True, cursor=cursor, limit=limit,
+                                archived=archived)
+
+def next_page_url(request: Request, param: str, page: Page):
+    if not page.next_cursor:
+        return None
+    return str(request.url.include_query_params(**{param: page.next_cursor}))
+
+def case_to_dict(case: Case, with_patient: bool = False) -> dict:
+    data = {
+        'id': case.id,
+        'request_type': case.request_type,
+        'status': case.status,
+        'payment_status': case.payment_status,
+        'created_at': case.created_at.isoformat() if case.created_at else None,
+        'updated_at': case.updated_at.isoformat() if case.updated_at else None,
+    }
+    if with_patient:
+        data['patient_name'] = case.patient.full_name if case.patient else None
+    return data
+
+
 # ---------- ROTAS DE PACIENTE ----------
 
 @app.get('/patient/dashboard', response_class=HTMLResponse)
-async def patient_dashboard(request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def patient_dashboard(
+    request: Request,
+    cursor: str = None,
+    status: str = None,
+    request_type: str = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
     if current_user.user_type != 'patient':
         raise HTTPException(status_code=403, detail='Acesso negado')
+
+    # Nada mudou desde a última visita: 304 sem buscar a página nem renderizar
+    validator = await patient_cases_validator(db, request, current_user)
+    if validator.matches(request):
+        return validator.not_modified()
     
-    cases = db.query(Case).filter(Case.patient_id == current_user.id).order_by(Case.created_at.desc()).all()
+    page = await patient_cases_page(db, current_user, cursor, None, status, request_type)
     
-    return templates.TemplateResponse(
+    return validator.apply(templates.TemplateResponse(
         'patient_dashboard.html',
         {
             'request': request,
             'user': current_user,
-            'cases': cases
+            'cases': page.items,
+            'next_url': next_page_url(request, 'cursor', page),
+            'status_filter': status,
+            'request_type_filter': request_type
         }
-    )
+    ))
 
 @app.get('/patient/new-case', response_class=HTMLResponse)
 async def new_case_page(request: Request, current_user: User = Depends(get_current_user)):
@@ -290,27 +450,29 @@ async def new_case_page(request: Request, current_user: User = Depends(get_curre
 @app.post('/patient/new-case')
 async def create_new_case(
     request_type: str = Form(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.user_type != 'patient':
         raise HTTPException(status_code=403, detail='Acesso negado')
     
-    new_case = Case(patient_id=current_user.id, request_type=request_type, status='pending_payment')
+    new_case = Case(patient_id=current_user.id, request_type=request_type, status='pending_payment',
+                    created_at=datetime.utcnow())
     db.add(new_case)
-    db.commit()
-    db.refresh(new_case)
+    await StatsDelta().created(new_case.request_type, new_case.created_at).apply(db)
+    await db.commit()
+    await db.refresh(new_case)
     
     # Redireciona para a página de pagamento do caso
     return RedirectResponse(url=f'/patient/pay-case/{new_case.id}', status_code=303)
 
 
 @app.get('/patient/pay-case/{case_id}', response_class=HTMLResponse)
-async def pay_case_page(request: Request, case_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def pay_case_page(request: Request, case_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
     if current_user.user_type != 'patient':
         raise HTTPException(status_code=403, detail='Acesso negado')
     
-    case = db.query(Case).filter(Case.id == case_id, Case.patient_id == current_user.id).first()
+    case = await db.scalar(select(Case).where(Case.id == case_id, Case.patient_id == current_user.id))
     if not case:
         raise HTTPException(status_code=404, detail='Caso não encontrado')
     if case.status != 'pending_payment':
@@ -328,93 +490,66 @@ async def pay_case_page(request: Request, case_id: int, current_user: User = Dep
 @app.post('/patient/pay-case/{case_id}/generate-pix')
 async def generate_pix_for_case(
     case_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.user_type != 'patient':
         raise HTTPException(status_code=403, detail='Acesso negado')
     
-    case = db.query(Case).filter(Case.id == case_id, Case.patient_id == current_user.id).first()
+    case = await db.scalar(select(Case).where(Case.id == case_id, Case.patient_id == current_user.id))
     if not case:
         raise HTTPException(status_code=404, detail='Caso não encontrado')
     if case.status != 'pending_payment':
         raise HTTPException(status_code=400, detail='Caso já pago ou em revisão')
 
-    if not MERCADOPAGO_ACCESS_TOKEN:
+    # Preferência ainda válida: devolve o mesmo checkout sem chamar o MP de novo
+    now = datetime.utcnow()
+    if case.payment_init_point and case.payment_expires_at and case.payment_expires_at > now + timedelta(minutes=5):
+        return {"checkout_url": case.payment_init_point}
+
+    if not mercadopago_client.configured:
         raise HTTPException(
             status_code=500,
             detail='Mercado Pago não configurado (ACCESS_TOKEN ausente).'
         )
 
-    amount = 50.0 # Valor fixo por enquanto
-
-    preference_data = {
-        "items": [
-            {
-                "title": f"Pagamento Caso #{case.id} - {case.request_type}",
-                "quantity": 1,
-                "unit_price": amount,
-                "currency_id": "BRL"
-            }
-        ],
-        "payer": {
-            "email": current_user.email
-        },
-        "payment_methods": {
-            "excluded_payment_types": [
-                {"id": "credit_card"},
-                {"id": "debit_card"}
-            ]
-        },
-        "back_urls": {
-            "success": f"https://app-medico-hfb0.onrender.com/patient/case/{case.id}/status?payment_status=success",
-            "failure": f"https://app-medico-hfb0.onrender.com/patient/case/{case.id}/status?payment_status=failure",
-            "pending": f"https://app-medico-hfb0.onrender.com/patient/case/{case.id}/status?payment_status=pending"
-        },
-        "auto_return": "approved",
-        "external_reference": str(case.id) # Usar o ID do caso como referência externa
-    }
-
-    headers = {
-        "Authorization": f"Bearer {MERCADOPAGO_ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
+    # Só o que chama o MP gasta ficha (reabrir um checkout em cache não conta)
+    await rate_limiter.check(request, 'pix', user=str(current_user.id))
+
+    # Chave e validade fixas na janela atual: o mesmo payload sempre acompanha a mesma chave
+    idempotency_key, expires_at = checkout_attempt(case.id, case.created_at, now)
+    preference_data = build_preference(
+        title=f"Pagamento Caso #{case.id} - {case.request_type}",
+        payer_email=current_user.email,
+        return_path=f"/patient/case/{case.id}/status?payment_status={{status}}",
+        external_reference=str(case.id), # Usar o ID do caso como referência externa
+        expires_at=expires_at
+    )
+    await db.close() # não segura a conexão durante a chamada ao MP
 
     try:
-        response = requests.post(
-            "https://api.mercadopago.com/checkout/preferences",
-            json=preference_data,
-            headers=headers,
-            timeout=15
-        )
-
-        if response.status_code != 201:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Erro do Mercado Pago: {response.status_code} - {response.text}"
+        # Cliques simultâneos no mesmo caso viram uma única chamada ao MP
+        async with checkout_slots:
+            data = await checkout_flight.do(
+                idempotency_key,
+                lambda: mercadopago_client.create_preference(preference_data, idempotency_key=idempotency_key)
             )
+    except MercadoPagoError as e:
+        raise mercadopago_http_error(e)
+
+    # Guarda a preferência no caso (idempotente: quem chegar por último grava o mesmo valor)
+    await db.execute(
+        update(Case).where(Case.id == case.id).values(
+            payment_id=data.get('id'), # ID da preferência do MP
+            payment_init_point=data['init_point'],
+            payment_expires_at=expires_at,
+            version=Case.version + 1
+        ).execution_options(synchronize_session=False)
+    )
+    await db.commit()
 
-        data = response.json()
-        init_point = data.get("init_point")
-        if not init_point:
-            raise HTTPException(
-                status_code=500,
-                detail=f"init_point não encontrado. Resposta: {data}"
-            )
-        
-        # Atualiza o payment_id no caso
-        case.payment_id = data.get('id') # ID da preferência do MP
-        db.add(case)
-        db.commit()
-        db.refresh(case)
-
-        return {"checkout_url": init_point}
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erro ao criar pagamento PIX: {repr(e)}"
-        )
+    return {"checkout_url": data['init_point']}
 
 @app.get('/patient/case/{case_id}/status', response_class=HTMLResponse)
 async def case_payment_status(
@@ -422,24 +557,39 @@ async def case_payment_status(
     case_id: int,
     payment_status: str, # success, failure, pending
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.user_type != 'patient':
         raise HTTPException(status_code=403, detail='Acesso negado')
     
-    case = db.query(Case).filter(Case.id == case_id, Case.patient_id == current_user.id).first()
+    case = await find_case(db, id=case_id, patient_id=current_user.id)
     if not case:
         raise HTTPException(status_code=404, detail='Caso não encontrado')
     
-    # Atualiza o status do pagamento no caso
-    case.payment_status = payment_status
-    if payment_status == 'success':
-        case.status = 'pending_review' # Se pagou, vai para revisão
-    db.add(case)
-    db.commit()
-    db.refresh(case)
-
-    return templates.TemplateResponse(
+    if MERCADOPAGO_WEBHOOK_SECRET:
+        # A confirmação vem do webhook; o retorno do navegador (query string) não é confiável
+        if case.payment_status == 'paid':
+            payment_status = 'success'
+        elif payment_status == 'success':
+            payment_status = 'pending' # Aguardando a notificação do MP
+    elif case.status == 'pending_payment':
+        # Sem webhook configurado (ambiente local): confia no retorno do checkout.
+        # Mesmo UPDATE condicional do webhook (só casos ainda em pending_payment), então
+        # recarregar a página, o worker ou o generate-pix ao mesmo tempo não dão conflito de versão.
+        mp_status = {'success': 'approved', 'failure': 'rejected'}.get(payment_status, 'pending')
+        updated = await apply_payment(db, {'external_reference': str(case.id), 'status': mp_status})
+        await db.commit()
+        await db.refresh(case)
+        if updated and mp_status == 'approved':
+            draft_prefetcher.notify()
+            notification_dispatcher.notify()
+            await publish_case_event(db, 'case.paid', [case.id])
+
+    validator = case_validator(request, current_user.id, case, case.payment_status, payment_status)
+    if validator.matches(request):
+        return validator.not_modified()
+
+    return validator.apply(templates.TemplateResponse(
         'case_status.html',
         {
             'request': request,
@@ -447,42 +597,175 @@ async def case_payment_status(
             'case': case,
             'payment_status': payment_status
         }
-    )
+    ))
+
+
+# ---------- WEBHOOK MERCADO PAGO ----------
+
+@app.post('/webhooks/mercadopago')
+async def mercadopago_webhook(request: Request, db: AsyncSession = Depends(get_db)):
+    if not MERCADOPAGO_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail='Webhook não configurado')
+
+    body = await request.body()
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError:
+        payload = {}
+    params = request.query_params
+    topic = params.get('type') or params.get('topic') or payload.get('type')
+    data_id = params.get('data.id') or params.get('id') or (payload.get('data') or {}).get('id')
+    request_id = request.headers.get('x-request-id')
+
+    if not verify_signature(request.headers.get('x-signature'), request_id, str(data_id) if data_id else None):
+        raise HTTPException(status_code=401, detail='Assinatura inválida')
+
+    # Só enfileira; o processamento é feito pelos workers (app/webhooks.py)
+    db.add(PaymentNotification(
+        topic=topic,
+        resource_id=str(data_id),
+        request_id=request_id,
+        payload=body.decode('utf-8', errors='replace')
+    ))
+    await db.commit()
+    payment_worker.notify()
+    return {'status': 'ok'}
 
 
 # ---------- ROTAS DE MÉDICO ----------
 
 @app.get('/doctor/dashboard', response_class=HTMLResponse)
-async def doctor_dashboard(request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def doctor_dashboard(
+    request: Request,
+    pending_cursor: str = None,
+    reviewed_cursor: str = None,
+    status: str = None,
+    request_type: str = None,
+    queue: str = None, # 'empty' ou 'claimed' (mensagens da fila)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
     if current_user.user_type != 'doctor':
         raise HTTPException(status_code=403, detail='Acesso negado')
+
+    validator = await doctor_cases_validator(db, request, current_user)
+    if validator.matches(request):
+        return validator.not_modified()
     
     # Casos pendentes de revisão (já pagos)
-    pending_cases = db.query(Case).filter(Case.status == 'pending_review').order_by(Case.created_at.asc()).all()
+    pending = await pending_cases_page(db, current_user, pending_cursor, None, request_type)
     
     # Casos que o médico já revisou
-    my_reviewed_cases = db.query(Case).filter(Case.doctor_id == current_user.id).order_by(Case.updated_at.desc()).all()
+    reviewed = await reviewed_cases_page(db, current_user, reviewed_cursor, None, status, request_type)
 
-    return templates.TemplateResponse(
+    return validator.apply(templates.TemplateResponse(
         'doctor_dashboard.html',
         {
             'request': request,
             'user': current_user,
-            'pending_cases': pending_cases,
-            'my_reviewed_cases': my_reviewed_cases
+            'pending_cases': pending.items,
+            'my_reviewed_cases': reviewed.items,
+            'next_pending_url': next_page_url(request, 'pending_cursor', pending),
+            'next_reviewed_url': next_page_url(request, 'reviewed_cursor', reviewed),
+            'status_filter': status,
+            'request_type_filter': request_type,
+            'queue_message': queue
         }
+    ))
+
+@app.get('/doctor/events')
+async def doctor_events(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Server-sent events com as mudanças de estado dos casos (app/events.py)."""
+    if current_user.user_type != 'doctor':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+    await db.close()  # conexão longa: não segura conexão do pool
+
+    async def stream():
+        event_id = 0
+        async with case_events.subscribe() as queue:
+            yield 'retry: 5000\n\n'
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n' # mantém a conexão viva em proxies
+                    continue
+                event_id += 1
+                yield format_sse(event, event_id)
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
 
+@app.post('/doctor/queue/next')
+async def claim_next_case(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.user_type != 'doctor':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+
+    cases = await claim_next_cases(db, current_user.id)
+    if not cases:
+        return RedirectResponse(url='/doctor/dashboard?queue=empty', status_code=303)
+    await publish_case_event(db, 'case.claimed', [cases[0].id])
+    return RedirectResponse(url=f'/doctor/review-case/{cases[0].id}', status_code=303)
+
+@app.post('/doctor/queue/{case_id}/release')
+async def release_claimed_case(
+    case_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.user_type != 'doctor':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+
+    if await release_case(db, current_user.id, case_id):
+        await publish_case_event(db, 'case.released', [case_id])
+    return RedirectResponse(url='/doctor/dashboard', status_code=303)
+
 @app.get('/doctor/review-case/{case_id}', response_class=HTMLResponse)
-async def review_case_page(request: Request, case_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def review_case_page(
+    request: Request,
+    case_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
+):
     if current_user.user_type != 'doctor':
         raise HTTPException(status_code=403, detail='Acesso negado')
     
-    case = db.query(Case).filter(Case.id == case_id).first()
+    # Abrir a revisão reserva o caso para este médico (ou renova a reserva)
+    claimed = await claim_case(db, current_user.id, case_id)
+    if claimed:
+        await publish_case_event(db, 'case.claimed', [case_id])
+
+    # Reserva no primário; o resto da página pode vir de uma réplica
+    case = await read_db.scalar(select(Case).options(CASE_PATIENT_CONTACT).where(Case.id == case_id))
+    if claimed and (case is None or case.status != 'pending_review'):
+        # Réplica atrasada (ex.: pagamento recém-confirmado): o primário é quem sabe
+        case = await db.scalar(select(Case).options(CASE_PATIENT_CONTACT).where(Case.id == case_id))
     if not case:
         raise HTTPException(status_code=404, detail='Caso não encontrado')
     if case.status != 'pending_review':
         return RedirectResponse(url='/doctor/dashboard', status_code=303) # Já revisado ou não pago
+    if not claimed:
+        return RedirectResponse(url='/doctor/dashboard?queue=claimed', status_code=303) # Em revisão por outro médico
+
+    # Rascunho pré-gerado em background (app/drafts.py); a página nunca espera o modelo
+    draft = await read_db.scalar(
+        select(Document.generated_text)
+        .where(Document.case_id == case_id, Document.job_status == 'draft')
+        .order_by(Document.id.desc())
+    )
+    if draft is None:
+        draft_prefetcher.notify()
     
     return templates.TemplateResponse(
         'review_case.html',
@@ -490,7 +773,8 @@ async def review_case_page(request: Request, case_id: int, current_user: User =
             'request': request,
             'user': current_user,
             'case': case,
-            'patient': case.patient # Acesso aos dados do paciente
+            'patient': case.patient, # Acesso aos dados do paciente
+            'draft': draft
         }
     )
 
@@ -499,32 +783,225 @@ async def submit_review_case(
     case_id: int,
     action: str = Form(...), # 'approve' ou 'reject'
     rejection_reason: str = Form(None),
-    db: Session = Depends(get_db),
+    generated_text: str = Form(None), # Texto do documento (rascunho revisado pelo médico)
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.user_type != 'doctor':
         raise HTTPException(status_code=403, detail='Acesso negado')
     
-    case = db.query(Case).filter(Case.id == case_id).first()
-    if not case:
-        raise HTTPException(status_code=404, detail='Caso não encontrado')
-    if case.status != 'pending_review':
-        raise HTTPException(status_code=400, detail='Caso já revisado ou não pago')
-    
-    case.doctor_id = current_user.id
-    case.updated_at = datetime.utcnow()
-
     if action == 'approve':
-        case.status = 'approved'
-        # TODO: Gerar e assinar o documento aqui na Etapa 2
+        new_status = 'approved'
     elif action == 'reject':
-        case.status = 'rejected'
-        case.rejection_reason = rejection_reason
+        new_status = 'rejected'
     else:
         raise HTTPException(status_code=400, detail='Ação inválida')
-    
-    db.add(case)
-    db.commit()
-    db.refresh(case)
+
+    # UPDATE condicional: falha se o caso já foi revisado ou está reservado por outro médico
+    if not await complete_review(db, current_user.id, case_id, new_status, rejection_reason):
+        await db.rollback()
+        case = await db.scalar(select(Case).where(Case.id == case_id))
+        if not case:
+            raise HTTPException(status_code=404, detail='Caso não encontrado')
+        if case.status != 'pending_review':
+            raise HTTPException(status_code=400, detail='Caso já revisado ou não pago')
+        raise HTTPException(status_code=409, detail='Caso em revisão por outro médico')
+    if new_status == 'approved':
+        # O PDF é gerado e assinado em background (app/documents.py); a resposta não espera.
+        # Reaproveita o Document do rascunho, se houver.
+        document = await db.scalar(
+            select(Document)
+            .where(Document.case_id == case_id, Document.job_status == 'draft')
+            .order_by(Document.id.desc())
+        )
+        if document is None:
+            document = Document(case_id=case_id)
+            db.add(document)
+        document.job_status = 'queued'
+        document.queued_at = datetime.utcnow()
+        if generated_text and generated_text.strip():
+            document.generated_text = generated_text.strip()
+    await db.commit()
+    if new_status == 'approved':
+        document_worker.notify()
+    notification_dispatcher.notify()
+    await publish_case_event(db, f'case.{new_status}', [case_id])
     
     return RedirectResponse(url='/doctor/dashboard', status_code=303)
+
+
+
+# ---------- DOCUMENTOS ----------
+
+@app.get('/api/cases/{case_id}/document')
+async def case_document_status(
+    case_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    case = await find_case(db, id=case_id)
+    if not case or current_user.id not in (case.patient_id, case.doctor_id):
+        raise HTTPException(status_code=404, detail='Caso não encontrado')
+
+    document = await latest_document(db, case)
+    if not document:
+        raise HTTPException(status_code=404, detail='Documento não encontrado')
+    return {
+        'case_id': case_id,
+        'job_status': document.job_status,
+        'signed_by_doctor': bool(document.signed_by_doctor),
+        'signed_at': document.signed_at.isoformat() if document.signed_at else None,
+        'signature': document.signature,
+        'error': document.job_error if document.job_status == 'failed' else None
+    }
+
+async def load_case_document(db, case: Case) -> Document:
+    if case.status != 'approved':
+        raise HTTPException(status_code=404, detail='Documento não encontrado')
+    document = await latest_document(db, case)
+    if not document:
+        raise HTTPException(status_code=404, detail='Documento não encontrado')
+    if document.job_status != 'done' or not document.file_path:
+        raise HTTPException(status_code=409, detail='Documento ainda em geração, tente novamente em instantes')
+    return document
+
+async def document_response(request: Request, document: Document, filename: str):
+    # S3: redireciona para a URL pré-assinada; o arquivo não passa pela aplicação
+    if STORAGE_PRESIGNED_REDIRECT:
+        url = storage.presigned_url(document.file_path, filename)
+        if url:
+            return RedirectResponse(url=url, status_code=307)
+
+    try:
+        size = await storage.size(document.file_path)
+    except StorageError:
+        raise HTTPException(status_code=404, detail='Arquivo do documento não encontrado')
+    try:
+        byte_range = parse_range(request.headers.get('range'), size)
+    except ValueError:
+        return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+
+    start, end = byte_range or (0, size - 1)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Length': str(end - start + 1),
+        'Content-Disposition': f'inline; filename="{filename}"'
+    }
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return StreamingResponse(
+        storage.iter_range(document.file_path, start, end),
+        status_code=206 if byte_range else 200,
+        media_type='application/pdf',
+        headers=headers
+    )
+
+@app.get('/patient/view-document/{case_id}')
+async def patient_view_document(
+    request: Request,
+    case_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.user_type != 'patient':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+
+    case = await find_case(db, id=case_id, patient_id=current_user.id)
+    if not case:
+        raise HTTPException(status_code=404, detail='Caso não encontrado')
+    document = await load_case_document(db, case)
+    await db.close() # o download pode demorar; não segura a conexão
+    return await document_response(request, document, f'pedido-{case_id}.pdf')
+
+@app.get('/doctor/view-document/{case_id}')
+async def doctor_view_document(
+    request: Request,
+    case_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.user_type != 'doctor':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+
+    case = await find_case(db, id=case_id, doctor_id=current_user.id)
+    if not case:
+        raise HTTPException(status_code=404, detail='Caso não encontrado')
+    document = await load_case_document(db, case)
+    await db.close()
+    return await document_response(request, document, f'pedido-{case_id}.pdf')
+
+@app.get('/documents/public-key')
+async def document_public_key():
+    # Chave pública para verificar a assinatura Ed25519 dos PDFs
+    return Response(public_key_pem(), media_type='application/x-pem-file')
+
+
+# ---------- API JSON (listagens paginadas) ----------
+
+@app.get('/api/patient/cases')
+async def api_patient_cases(
+    request: Request,
+    cursor: str = None,
+    limit: int = None,
+    status: str = None,
+    request_type: str = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if current_user.user_type != 'patient':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+
+    validator = await patient_cases_validator(db, request, current_user)
+    if validator.matches(request):
+        return validator.not_modified()
+
+    page = await patient_cases_page(db, current_user, cursor, limit, status, request_type)
+    return validator.apply(JSONResponse(
+        {'items': [case_to_dict(c) for c in page.items], 'next_cursor': page.next_cursor}
+    ))
+
+@app.get('/api/doctor/cases')
+async def api_doctor_cases(
+    request: Request,
+    scope: str = 'pending', # 'pending' ou 'reviewed'
+    cursor: str = None,
+    limit: int = None,
+    status: str = None,
+    request_type: str = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if current_user.user_type != 'doctor':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+    if scope not in ('pending', 'reviewed'):
+        raise HTTPException(status_code=400, detail='Escopo inválido')
+
+    validator = await doctor_cases_validator(db, request, current_user)
+    if validator.matches(request):
+        return validator.not_modified()
+
+    if scope == 'pending':
+        page = await pending_cases_page(db, current_user, cursor, limit, request_type)
+    else:
+        page = await reviewed_cases_page(db, current_user, cursor, limit, status, request_type)
+    return validator.apply(JSONResponse(
+        {'items': [case_to_dict(c, with_patient=True) for c in page.items], 'next_cursor': page.next_cursor}
+    ))
+
+@app.post('/api/doctor/queue/claim')
+async def api_claim_cases(
+    batch: int = 1,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.user_type != 'doctor':
+        raise HTTPException(status_code=403, detail='Acesso negado')
+
+    cases = await claim_next_cases(db, current_user.id, batch)
+    await publish_case_event(db, 'case.claimed', [c.id for c in cases])
+    return {
+        'items': [
+            dict(case_to_dict(c), lease_expires_at=c.lease_expires_at.isoformat())
+            for c in cases
+        ]
+    }
@@ -0,0 +1,281 @@
+"""Métricas da aplicação no formato texto do Prometheus (GET /metrics).
+
+Registro próprio, sem dependências: contadores, gauges e histogramas com labels,
+protegidos por lock (eventos do SQLAlchemy podem vir de threads). Os valores são
+por processo; com vários workers do uvicorn cada um expõe os seus e o Prometheus
+agrega pelos labels de instância.
+
+- `MetricsMiddleware` (ASGI): latência por rota (o path do template, ex.
+  /doctor/review-case/{case_id}, para não explodir a cardinalidade), requisições
+  em andamento e, por requisição, quantidade e tempo de SQL.
+- `instrument_engine`: eventos before/after_cursor_execute do engine.
+- Mercado Pago e templates são medidos em app/payments.py e `InstrumentedTemplates`.
+- Log de requisições lentas (SLOW_REQUEST_SECONDS > 0) com a lista de queries.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from fastapi.templating import Jinja2Templates
+from sqlalchemy import event
+from starlette.routing import Match
+
+from .config import SLOW_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# Conexões longas (SSE): entram no gauge de em andamento, não no histograma de latência
+LONG_LIVED_ROUTES = {'/doctor/events'}
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = list(self._values.items())
+        lines.extend(self._render_samples(items))
+        return '\n'.join(lines)
+
+    def _render_samples(self, items):
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def render_metrics() -> str:
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# ---------- Métricas ----------
+
+http_requests = Counter('http_requests_total', 'Requisições HTTP concluídas.', ('method', 'route', 'status'))
+http_duration = Histogram('http_request_duration_seconds', 'Latência das requisições HTTP.', ('method', 'route'))
+http_in_progress = Gauge('http_requests_in_progress', 'Requisições HTTP em andamento.', ('method', 'route'))
+http_sql_queries = Histogram(
+    'http_request_sql_queries', 'Quantidade de instruções SQL por requisição.', ('route',), COUNT_BUCKETS
+)
+http_sql_seconds = Histogram('http_request_sql_seconds', 'Tempo total de SQL por requisição.', ('route',))
+sql_duration = Histogram('db_query_duration_seconds', 'Duração de cada instrução SQL.', ('operation',))
+mercadopago_duration = Histogram(
+    'mercadopago_request_duration_seconds', 'Chamadas à API do Mercado Pago (cada tentativa).',
+    ('method', 'endpoint', 'status')
+)
+template_duration = Histogram('template_render_seconds', 'Renderização dos templates Jinja2.', ('template',))
+rate_limited = Counter('rate_limited_total', 'Requisições recusadas (429) por regra de limite.', ('rule',))
+load_shed = Counter('load_shed_total', 'Requisições descartadas (503) por sobrecarga.', ('limiter', 'reason'))
+archived_cases = Counter('archived_cases_total', 'Casos encerrados movidos para cases_archive.')
+replica_healthy = Gauge('db_replica_healthy', 'Réplica de leitura em rotação (1) ou fora (0).', ('replica',))
+replica_lag = Gauge('db_replica_lag_seconds', 'Atraso de replicação medido na última verificação.', ('replica',))
+read_routing = Counter('db_read_routing_total', 'Sessões de leitura por destino.', ('target',))
+notifications_sent = Counter('notifications_total', 'Avisos processados (outbox) por canal e resultado.', ('channel', 'result'))
+notification_duration = Histogram('notification_send_seconds', 'Envio de cada aviso ao provedor.', ('channel',))
+
+
+# ---------- SQL ----------
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_seconds', 'statements')
+
+    def __init__(self, keep_statements: bool):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = [] if keep_statements else None
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    sql_duration.observe(elapsed, operation=operation)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        if stats.statements is not None:
+            stats.statements.append((round(elapsed * 1000, 2), statement[:500]))
+
+
+def instrument_engine(engine):
+    """Registra os eventos de SQL num engine (para AsyncEngine, passe `.sync_engine`).
+
+    Aceita também a classe `Engine`: aí vale para todos, inclusive os criados depois.
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# ---------- Templates ----------
+
+class InstrumentedTemplates(Jinja2Templates):
+    def TemplateResponse(self, name: str, *args, **kwargs):
+        # O Starlette renderiza o template ao construir a resposta
+        start = time.perf_counter()
+        try:
+            return super().TemplateResponse(name, *args, **kwargs)
+        finally:
+            template_duration.observe(time.perf_counter() - start, template=name)
+
+
+# ---------- Middleware ----------
+
+class MetricsMiddleware:
+    def __init__(self, app, slow_request_seconds: float = SLOW_REQUEST_SECONDS):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    @staticmethod
+    def _route_label(scope) -> str:
+        # Resolve a rota antes de chamar a app, para o gauge de em andamento já ter o label
+        partial = None
+        for route in scope['app'].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or '<unmatched>'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        method = scope['method']
+        route = self._route_label(scope)
+        stats = RequestStats(keep_statements=self.slow_request_seconds > 0)
+        token = _request_stats.set(stats)
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        http_in_progress.inc(method=method, route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            http_in_progress.dec(method=method, route=route)
+            http_requests.inc(method=method, route=route, status=status['code'])
+            if route not in LONG_LIVED_ROUTES:
+                http_duration.observe(elapsed, method=method, route=route)
+                http_sql_queries.observe(stats.queries, route=route)
+                http_sql_seconds.observe(stats.sql_seconds, route=route)
+                if self.slow_request_seconds > 0 and elapsed >= self.slow_request_seconds:
+                    logger.warning('Requisição lenta: %s', json.dumps({
+                        'method': method,
+                        'path': scope.get('path'),
+                        'route': route,
+                        'status': status['code'],
+                        'seconds': round(elapsed, 4),
+                        'sql_queries': stats.queries,
+                        'sql_seconds': round(stats.sql_seconds, 4),
+                        'statements': stats.statements,
+                    }, ensure_ascii=False))
@@ -0,0 +1,453 @@
+"""Avisos (e-mail/SMS) aos pacientes quando o caso é pago, aprovado ou rejeitado.
+
+Outbox transacional: quem muda o status do caso chama `enqueue_case_notification`
+antes do commit, e o aviso vira uma linha em `notifications` na mesma transação
+(um INSERT, sem rede). Se a transação não vingar, o aviso também não existe; se
+vingar, ele será entregue mesmo que o processo caia logo depois. A requisição
+nunca espera o provedor.
+
+`NotificationDispatcher` (pool de tarefas, igual ao de app/webhooks.py) reserva
+lotes de avisos prontos, busca os contatos dos destinatários numa consulta só e
+envia em paralelo, limitado por canal (EMAIL_CONCURRENCY / SMS_CONCURRENCY).
+- Falha temporária: nova tentativa com backoff exponencial (NOTIFICATION_RETRY_BACKOFF,
+  dobrando) até NOTIFICATION_MAX_ATTEMPTS; recusa definitiva do provedor vai direto
+  para 'failed'. Usuário sem e-mail/telefone: 'skipped'.
+- Deduplicação: `dedupe_key` (evento:caso:canal) é única na tabela, então repetir a
+  transição não gera outro aviso; ela também vai ao provedor (Idempotency-Key no
+  SMS, Message-ID no e-mail) para um reenvio após queda do worker não duplicar.
+
+Desligado por padrão: NOTIFICATION_CHANNELS vazio não grava avisos nem sobe o
+dispatcher. Provedores plugáveis (EMAIL_BACKEND / SMS_BACKEND): 'smtp' (padrão)
+mantém um pool de conexões SMTP e 'http' (padrão) posta num gateway de SMS com um
+httpx.AsyncClient compartilhado (keep-alive). 'fake' não entrega nada, só guarda
+as últimas mensagens em memória, e precisa ser escolhido explicitamente (dev/testes).
+"""
+import asyncio
+import json
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import load_only
+
+from .config import (
+    NOTIFICATION_CHANNELS, NOTIFICATION_WORKERS, NOTIFICATION_BATCH_SIZE, NOTIFICATION_POLL_INTERVAL,
+    NOTIFICATION_MAX_ATTEMPTS, NOTIFICATION_RETRY_BACKOFF,
+    EMAIL_BACKEND, EMAIL_CONCURRENCY, EMAIL_FROM, SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD,
+    SMTP_STARTTLS, SMTP_TIMEOUT, SMS_BACKEND, SMS_CONCURRENCY, SMS_API_URL, SMS_API_TOKEN, SMS_TIMEOUT,
+)
+from .database import Notification, User, open_session
+from .drafts import REQUEST_LABELS
+from .jobqueue import claim_rows, retry_delay
+from .metrics import notification_duration, notifications_sent
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Avisos "processing" há mais tempo que isso voltam para a fila (worker morreu)
+PROCESSING_TIMEOUT = timedelta(minutes=5)
+
+CHANNEL_CONCURRENCY = {'email': EMAIL_CONCURRENCY, 'sms': SMS_CONCURRENCY}
+
+
+# ---------- Outbox ----------
+
+async def enqueue_case_notification(db, event: str, case_id: int, user_id: int, **payload):
+    """Grava o aviso de `event` (um por canal) na transação corrente. Não faz commit."""
+    now = datetime.utcnow()
+    rows = [
+        dict(
+            dedupe_key=f'{event}:{case_id}:{channel}', event=event, channel=channel, case_id=case_id,
+            user_id=user_id, payload=json.dumps(payload, ensure_ascii=False), status='pending', attempts=0,
+            created_at=now, next_attempt_at=now,
+        )
+        for channel in NOTIFICATION_CHANNELS
+    ]
+    if not rows:
+        return
+    table = Notification.__table__
+    dialect = db.bind.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        await db.execute(insert(table).values(rows).on_conflict_do_nothing(index_elements=['dedupe_key']))
+        return
+    existing = set((await db.scalars(
+        select(table.c.dedupe_key).where(table.c.dedupe_key.in_([row['dedupe_key'] for row in rows]))
+    )).all())
+    rows = [row for row in rows if row['dedupe_key'] not in existing]
+    if rows:
+        await db.execute(table.insert().values(rows))
+
+
+# ---------- Mensagens ----------
+
+@dataclass
+class Message:
+    channel: str
+    to: str
+    subject: str
+    body: str
+    key: str  # dedupe_key do aviso
+
+
+MESSAGES = {
+    'case.paid': (
+        'Pagamento confirmado',
+        'Olá, {name}! Recebemos o pagamento do seu pedido #{case_id} ({label}). '
+        'Em breve um(a) médico(a) vai analisá-lo.',
+    ),
+    'case.approved': (
+        'Pedido aprovado',
+        'Olá, {name}! Seu pedido #{case_id} ({label}) foi aprovado. '
+        'O documento assinado fica disponível no seu painel.',
+    ),
+    'case.rejected': (
+        'Pedido não aprovado',
+        'Olá, {name}. Seu pedido #{case_id} ({label}) não foi aprovado. Motivo: {reason}',
+    ),
+}
+
+
+def render(notification: Notification, user: Optional[User]) -> Optional[Message]:
+    """Monta a mensagem; None se o usuário não tem contato para o canal."""
+    address = None
+    if user is not None:
+        address = user.email if notification.channel == 'email' else user.phone
+    if not address:
+        return None
+    payload = json.loads(notification.payload or '{}')
+    request_type = payload.get('request_type') or ''
+    subject, template = MESSAGES[notification.event]
+    body = template.format(
+        name=(user.full_name or '').split(' ')[0] or 'paciente',
+        case_id=notification.case_id,
+        label=REQUEST_LABELS.get(request_type, request_type),
+        reason=payload.get('rejection_reason') or 'não informado',
+    )
+    return Message(notification.channel, address, subject, body, notification.dedupe_key)
+
+
+# ---------- Provedores ----------
+
+class DeliveryError(Exception):
+    """Falha temporária: o aviso volta para a fila."""
+
+
+class PermanentDeliveryError(DeliveryError):
+    """O provedor recusou a mensagem (destinatário inválido etc.): não adianta tentar de novo."""
+
+
+class FakeSender:
+    """Não envia nada: guarda as últimas `keep` mensagens em `sent` (dev e testes)."""
+
+    def __init__(self, channel: str, keep: int = 1000):
+        self.channel = channel
+        self.sent: Deque[Message] = deque(maxlen=keep)
+
+    async def send(self, message: Message):
+        self.sent.append(message)
+        logger.debug('Aviso (%s) para %s: %s', self.channel, message.to, message.body)
+
+    async def aclose(self):
+        pass
+
+
+class SMTPEmailSender:
+    """SMTP via smtplib (em threads), reaproveitando até `pool_size` conexões entre envios."""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, user: str = SMTP_USER,
+                 password: str = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS, sender: str = EMAIL_FROM,
+                 timeout: float = SMTP_TIMEOUT, pool_size: int = EMAIL_CONCURRENCY):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: List[smtplib.SMTP] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.user:
+            conn.login(self.user, self.password)
+        return conn
+
+    def _build(self, message: Message) -> EmailMessage:
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message.to
+        email['Subject'] = message.subject
+        # Mesmo aviso, mesmo Message-ID: o servidor/cliente descarta a cópia de um reenvio
+        domain = self.sender.rpartition('@')[2] or 'localhost'
+        email['Message-ID'] = f'<{message.key.replace(":", ".")}@{domain}>'
+        email.set_content(message.body)
+        return email
+
+    def _send_sync(self, message: Message):
+        email = self._build(message)
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        for attempt in range(2):
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect()
+            try:
+                conn.send_message(email)
+                break
+            except smtplib.SMTPServerDisconnected:
+                conn = None
+                if not reused or attempt:
+                    raise
+                # Conexão ociosa derrubada pelo servidor: abre outra e tenta de novo
+            except smtplib.SMTPRecipientsRefused as e:
+                self._release(conn)
+                raise PermanentDeliveryError(f'Destinatário recusado: {e.recipients}')
+            except smtplib.SMTPResponseException as e:
+                self._close(conn)
+                if 500 <= e.smtp_code < 600:
+                    raise PermanentDeliveryError(f'SMTP {e.smtp_code}: {e.smtp_error!r}')
+                raise
+            except Exception:
+                self._close(conn)
+                raise
+        self._release(conn)
+
+    def _release(self, conn: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn: smtplib.SMTP):
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    async def send(self, message: Message):
+        await asyncio.to_thread(self._send_sync, message)
+
+    async def aclose(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            await asyncio.to_thread(self._close, conn)
+
+
+class HttpSmsSender:
+    """Gateway de SMS por HTTP: POST {to, message} com Bearer token. O httpx só é importado no uso."""
+
+    RETRY_STATUS = {408, 429}
+
+    def __init__(self, url: str = SMS_API_URL, token: str = SMS_API_TOKEN, timeout: float = SMS_TIMEOUT,
+                 max_connections: int = SMS_CONCURRENCY, transport: Optional['httpx.AsyncBaseTransport'] = None):
+        if not url:
+            raise RuntimeError('SMS_BACKEND=http precisa de SMS_API_URL')
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.transport = transport
+        self._client: Optional['httpx.AsyncClient'] = None
+
+    def _get_client(self) -> 'httpx.AsyncClient':
+        if self._client is None or self._client.is_closed:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def send(self, message: Message):
+        response = await self._get_client().post(
+            self.url,
+            json={'to': message.to, 'message': message.body},
+            headers={'Authorization': f'Bearer {self.token}', 'Idempotency-Key': message.key},
+        )
+        if response.status_code < 400:
+            return
+        error = f'Gateway de SMS: {response.status_code} - {response.text[:200]}'
+        if response.status_code < 500 and response.status_code not in self.RETRY_STATUS:
+            raise PermanentDeliveryError(error)
+        raise DeliveryError(error)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def get_senders() -> Dict[str, object]:
+    senders = {}
+    for channel in NOTIFICATION_CHANNELS:
+        if channel == 'email':
+            if EMAIL_BACKEND == 'smtp':
+                senders[channel] = SMTPEmailSender()
+            elif EMAIL_BACKEND == 'fake':
+                senders[channel] = FakeSender(channel)
+            else:
+                raise RuntimeError(f'EMAIL_BACKEND desconhecido: {EMAIL_BACKEND}')
+        elif channel == 'sms':
+            if SMS_BACKEND == 'http':
+                senders[channel] = HttpSmsSender()
+            elif SMS_BACKEND == 'fake':
+                senders[channel] = FakeSender(channel)
+            else:
+                raise RuntimeError(f'SMS_BACKEND desconhecido: {SMS_BACKEND}')
+        else:
+            raise RuntimeError(f'Canal de aviso desconhecido em NOTIFICATION_CHANNELS: {channel}')
+    return senders
+
+
+# ---------- Despacho ----------
+
+async def claim_notifications(db, limit: int) -> List[Notification]:
+    now = datetime.utcnow()
+    ready = or_(
+        (Notification.status == 'pending') & (Notification.next_attempt_at <= now),
+        (Notification.status == 'processing') & (Notification.locked_at < now - PROCESSING_TIMEOUT),
+    )
+    return await claim_rows(db, Notification, ready, {'status': 'processing', 'locked_at': now}, limit)
+
+
+class NotificationDispatcher:
+    """Pool de tarefas asyncio que drenam `notifications` em lotes."""
+
+    def __init__(self, senders: Dict[str, object], workers: int = NOTIFICATION_WORKERS,
+                 batch_size: int = NOTIFICATION_BATCH_SIZE, poll_interval: float = NOTIFICATION_POLL_INTERVAL,
+                 max_attempts: int = NOTIFICATION_MAX_ATTEMPTS):
+        self.senders = senders
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+
+    def start(self):
+        if self._tasks or self.workers <= 0 or not self.senders:
+            return
+        self._wakeup = asyncio.Event()
+        self._limits = {}
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for sender in self.senders.values():
+            await sender.aclose()
+
+    def notify(self):
+        """Acorda os workers logo após o commit que gravou avisos, sem esperar o poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _limit(self, channel: str) -> asyncio.Semaphore:
+        # Compartilhado entre os workers: o limite é por canal no processo, não por lote
+        if channel not in self._limits:
+            self._limits[channel] = asyncio.Semaphore(max(1, CHANNEL_CONCURRENCY.get(channel, 1)))
+        return self._limits[channel]
+
+    async def deliver(self, message: Message):
+        async with self._limit(message.channel):
+            start = time.perf_counter()
+            try:
+                await self.senders[message.channel].send(message)
+            finally:
+                notification_duration.observe(time.perf_counter() - start, channel=message.channel)
+
+    async def process_batch(self, db, notifications: List[Notification]) -> Dict[str, int]:
+        """Envia um lote já reservado e grava o resultado numa transação; devolve contadores."""
+        user_ids = {notification.user_id for notification in notifications}
+        users = {
+            user.id: user for user in (await db.scalars(
+                select(User).where(User.id.in_(user_ids))
+                .options(load_only(User.id, User.full_name, User.email, User.phone))
+            )).all()
+        }
+        messages = [render(notification, users.get(notification.user_id)) for notification in notifications]
+        results = await asyncio.gather(
+            *(self.deliver(message) for message in messages if message is not None),
+            return_exceptions=True,
+        )
+        results = iter(results)
+
+        now = datetime.utcnow()
+        stats = {'sent': 0, 'skipped': 0, 'retry': 0, 'failed': 0}
+        for notification, message in zip(notifications, messages):
+            if message is None:
+                result = 'skipped'
+                notification.status = 'skipped'
+            else:
+                error = next(results)
+                if error is None:
+                    result = 'sent'
+                    notification.status = 'sent'
+                    notification.sent_at = now
+                else:
+                    notification.attempts = (notification.attempts or 0) + 1
+                    notification.last_error = repr(error)
+                    if isinstance(error, PermanentDeliveryError) or notification.attempts >= self.max_attempts:
+                        result = 'failed'
+                        notification.status = 'failed'
+                        logger.warning('Aviso %s falhou de vez: %r', notification.dedupe_key, error)
+                    else:
+                        result = 'retry'
+                        notification.status = 'pending'
+                        notification.next_attempt_at = now + retry_delay(notification.attempts, NOTIFICATION_RETRY_BACKOFF)
+            notification.locked_at = None
+            stats[result] += 1
+            notifications_sent.inc(channel=notification.channel, result=result)
+        await db.commit()
+        return stats
+
+    async def drain(self) -> int:
+        """Envia os avisos prontos até a fila esvaziar (usado nos workers e em testes/scripts)."""
+        processed = 0
+        while True:
+            async with open_session() as db:
+                batch = await claim_notifications(db, self.batch_size)
+                if not batch:
+                    return processed
+                await self.process_batch(db, batch)
+                processed += len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Erro enviando avisos')
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+notification_dispatcher = NotificationDispatcher(get_senders())
@@ -0,0 +1,101 @@
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, select
+
+from .config import CASE_PAGE_SIZE, CASE_PAGE_SIZE_MAX
+from .database import Case, CaseArchive
+
+
+@dataclass
+class Page:
+    items: List[Union[Case, CaseArchive]]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(sort_value: datetime, case_id: int) -> str:
+    raw = f'{sort_value.isoformat()}|{case_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, case_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(sort_value), int(case_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail='Cursor de paginação inválido')
+
+
+def page_size(limit: Optional[int]) -> int:
+    if not limit:
+        return CASE_PAGE_SIZE
+    return max(1, min(limit, CASE_PAGE_SIZE_MAX))
+
+
+def filter_cases(stmt, status: Optional[str] = None, request_type: Optional[str] = None, model=Case):
+    if status:
+        stmt = stmt.where(model.status == status)
+    if request_type:
+        stmt = stmt.where(model.request_type == request_type)
+    return stmt
+
+
+def _keyset(stmt, model, sort_column, descending: bool, cursor: Optional[str], size: int):
+    sort_column = getattr(model, sort_column.key)
+    if cursor:
+        sort_value, case_id = decode_cursor(cursor)
+        if descending:
+            stmt = stmt.where(or_(sort_column < sort_value, and_(sort_column == sort_value, model.id < case_id)))
+        else:
+            stmt = stmt.where(or_(sort_column > sort_value, and_(sort_column == sort_value, model.id > case_id)))
+
+    if descending:
+        stmt = stmt.order_by(sort_column.desc(), model.id.desc())
+    else:
+        stmt = stmt.order_by(sort_column.asc(), model.id.asc())
+    return stmt.limit(size + 1)
+
+
+async def newest_archived(db, archived, sort_column) -> datetime:
+    """MAX(sort_column) da consulta no arquivo (pelos índices de paciente/médico); datetime.min se vazia.
+
+    Não dá para confiar só em `archive_horizon()`: se ARCHIVE_AFTER_DAYS aumentar
+    depois de um arquivamento (ou `archive_closed_cases` rodar com outro corte), há
+    casos arquivados acima do horizonte atual.
+    """
+    newest = await db.scalar(
+        select(func.max(getattr(CaseArchive, sort_column.key))).where(archived.whereclause)
+    )
+    return newest or datetime.min
+
+
+async def paginate_cases(db, stmt, sort_column, descending: bool = True,
+                         cursor: Optional[str] = None, limit: Optional[int] = None, archived=None) -> Page:
+    """Paginação por keyset em (sort_column, id).
+
+    Em vez de OFFSET, continua a partir do último item da página anterior, então o
+    custo de cada página é o mesmo, não importa quão longo seja o histórico.
+
+    `archived` é a mesma consulta sobre CaseArchive (só para ordem decrescente por
+    created_at/updated_at). Ela só roda quando a página desce até o caso arquivado
+    mais recente da consulta; aí as duas listas são intercaladas pelo mesmo
+    (sort_column, id).
+    """
+    size = page_size(limit)
+    items = list((await db.scalars(_keyset(stmt, Case, sort_column, descending, cursor, size))).unique().all())
+    if archived is not None and descending and (
+        len(items) <= size or getattr(items[-1], sort_column.key) <= await newest_archived(db, archived, sort_column)
+    ):
+        items += (await db.scalars(_keyset(archived, CaseArchive, sort_column, descending, cursor, size))).unique().all()
+        items.sort(key=lambda case: (getattr(case, sort_column.key), case.id), reverse=True)
+        items = items[:size + 1]
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), last.id)
+    return Page(items=list(items), next_cursor=next_cursor)
@@ -0,0 +1,275 @@
+"""Cliente assíncrono do Mercado Pago, compartilhado por todas as rotas de pagamento.
+
+- pool de conexões persistente (keep-alive) via httpx.AsyncClient
+- timeouts configuráveis (MP_CONNECT_TIMEOUT / MP_READ_TIMEOUT)
+- novas tentativas com backoff exponencial e jitter em falhas de rede, 429 e 5xx;
+  POST só é repetido com X-Idempotency-Key (create_preference sempre manda uma),
+  para uma resposta perdida não virar preferência duplicada
+- circuit breaker: depois de MP_BREAKER_FAILURES falhas seguidas, falha rápido
+  por MP_BREAKER_RESET_SECONDS em vez de prender a requisição esperando o MP;
+  depois disso uma única chamada de teste decide se fecha ou reabre
+- cada tentativa entra no histograma mercadopago_request_duration_seconds (/metrics)
+- o httpx só é importado na primeira chamada (não pesa no cold start)
+"""
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Tuple
+
+from .config import (
+    MERCADOPAGO_ACCESS_TOKEN, MERCADOPAGO_API_URL, APP_BASE_URL, MERCADOPAGO_WEBHOOK_SECRET,
+    MP_CONNECT_TIMEOUT, MP_READ_TIMEOUT, MP_MAX_CONNECTIONS, MP_MAX_RETRIES,
+    MP_RETRY_BACKOFF, MP_BREAKER_FAILURES, MP_BREAKER_RESET_SECONDS, CHECKOUT_CONCURRENCY, CHECKOUT_MAX_WAITING,
+    CHECKOUT_TTL_MINUTES,
+)
+from .metrics import mercadopago_duration
+from .ratelimit import ConcurrencyLimit
+
+if TYPE_CHECKING:
+    import httpx
+
+CASE_PRICE = 50.0  # Valor fixo por enquanto
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE'}
+
+
+class MercadoPagoError(Exception):
+    def __init__(self, detail: str, status_code: Optional[int] = None):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class CircuitOpenError(MercadoPagoError):
+    pass
+
+
+class CircuitBreaker:
+    """Disjuntor simples: fechado -> aberto após N falhas -> meio-aberto após o reset."""
+
+    def __init__(self, max_failures: int, reset_seconds: float):
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'open':
+            return False
+        # Meio-aberto deixa passar uma tentativa (as concorrentes falham rápido); se
+        # ela falhar, reabre. Sem resposta em reset_seconds (ex.: cancelada), libera outra.
+        now = time.monotonic()
+        if self.probe_started_at is not None and now - self.probe_started_at < self.reset_seconds:
+            return False
+        self.probe_started_at = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures or self.state == 'half_open':
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+
+
+class MercadoPagoClient:
+    def __init__(self, base_url: str = MERCADOPAGO_API_URL, access_token: str = MERCADOPAGO_ACCESS_TOKEN,
+                 transport: Optional['httpx.AsyncBaseTransport'] = None):
+        self.base_url = base_url
+        self.access_token = access_token
+        self.transport = transport
+        self.breaker = CircuitBreaker(MP_BREAKER_FAILURES, MP_BREAKER_RESET_SECONDS)
+        self._client: Optional['httpx.AsyncClient'] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.access_token)
+
+    def _get_client(self) -> 'httpx.AsyncClient':
+        if self._client is None or self._client.is_closed:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(MP_READ_TIMEOUT, connect=MP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=MP_MAX_CONNECTIONS, max_keepalive_connections=MP_MAX_CONNECTIONS),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, path: str, json: Optional[dict] = None,
+                      headers: Optional[dict] = None, endpoint: Optional[str] = None) -> 'httpx.Response':
+        """`endpoint` é o label da métrica (path sem ids); por padrão, o próprio path."""
+        import httpx
+
+        if not self.breaker.allow():
+            raise CircuitOpenError('Mercado Pago indisponível no momento, tente novamente em instantes.', 503)
+
+        request_headers = {'Authorization': f'Bearer {self.access_token}'}
+        request_headers.update(headers or {})
+        client = self._get_client()
+        # Sem chave de idempotência, repetir um POST após timeout/5xx pode criar o recurso duas vezes
+        retries = MP_MAX_RETRIES if method in IDEMPOTENT_METHODS or 'X-Idempotency-Key' in request_headers else 0
+
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=json, headers=request_headers)
+            except httpx.TransportError as e:
+                mercadopago_duration.observe(
+                    time.perf_counter() - start, method=method, endpoint=endpoint or path, status='error'
+                )
+                error = MercadoPagoError(f'Falha de comunicação com o Mercado Pago: {e!r}')
+            else:
+                mercadopago_duration.observe(
+                    time.perf_counter() - start, method=method, endpoint=endpoint or path,
+                    status=response.status_code
+                )
+                if response.status_code not in RETRY_STATUS:
+                    self.breaker.record_success()
+                    return response
+                error = MercadoPagoError(
+                    f'Erro do Mercado Pago: {response.status_code} - {response.text}', response.status_code
+                )
+
+            self.breaker.record_failure()
+            if attempt == retries or not self.breaker.allow():
+                raise error
+            # Backoff exponencial com "full jitter"
+            await asyncio.sleep(random.uniform(0, MP_RETRY_BACKOFF * (2 ** attempt)))
+
+    async def create_preference(self, preference_data: dict, idempotency_key: Optional[str] = None) -> dict:
+        """Sem `idempotency_key`, gera uma por chamada: as novas tentativas desta chamada não duplicam."""
+        headers = {'X-Idempotency-Key': idempotency_key or f'preference-{uuid.uuid4().hex}'}
+        response = await self.request('POST', '/checkout/preferences', json=preference_data, headers=headers)
+        if response.status_code != 201:
+            raise MercadoPagoError(
+                f'Erro do Mercado Pago: {response.status_code} - {response.text}', response.status_code
+            )
+        data = response.json()
+        if not data.get('init_point'):
+            raise MercadoPagoError(f'init_point não encontrado. Resposta: {data}')
+        return data
+
+    async def get_payment(self, payment_id: str) -> dict:
+        response = await self.request('GET', f'/v1/payments/{payment_id}', endpoint='/v1/payments/{id}')
+        if response.status_code != 200:
+            raise MercadoPagoError(
+                f'Erro do Mercado Pago: {response.status_code} - {response.text}', response.status_code
+            )
+        return response.json()
+
+
+class SingleFlight:
+    """Junta chamadas concorrentes com a mesma chave numa única execução.
+
+    Ex.: dois cliques em "Pagar com PIX" no mesmo caso viram uma só chamada ao MP.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable]):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: se um dos clientes desistir, a chamada continua para os outros
+        return await asyncio.shield(future)
+
+
+# Cliques dentro da mesma janela geram a mesma preferência (mesma chave e mesmo payload)
+CHECKOUT_KEY_WINDOW = timedelta(minutes=5)
+
+
+def checkout_attempt(case_id: int, case_created_at: datetime, now: datetime,
+                     ttl_minutes: int = CHECKOUT_TTL_MINUTES) -> Tuple[str, datetime]:
+    """Chave de idempotência e validade da preferência de um caso.
+
+    As duas só dependem do caso e da janela de CHECKOUT_KEY_WINDOW em que `now`
+    cai, então cliques repetidos, em qualquer worker, mandam ao MP a mesma chave
+    com o mesmo payload. O `created_at` entra na chave porque o id sozinho se
+    repete depois de um reset (o SQLite recomeça a contagem) e o MP devolveria a
+    preferência do caso antigo.
+    """
+    window = (now - datetime(1970, 1, 1)) // CHECKOUT_KEY_WINDOW
+    window_end = datetime(1970, 1, 1) + (window + 1) * CHECKOUT_KEY_WINDOW
+    key = f'checkout-{case_id}-{case_created_at:%Y%m%d%H%M%S%f}-{window}'
+    return key, window_end + timedelta(minutes=ttl_minutes)
+
+
+def format_mp_datetime(value: datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%S.000+00:00')
+
+
+def build_preference(title: str, payer_email: str, return_path: str = '/',
+                     external_reference: Optional[str] = None, amount: float = CASE_PRICE,
+                     expires_at: Optional[datetime] = None) -> dict:
+    """Monta a preferência de checkout PIX (cartões excluídos).
+
+    `return_path` pode conter `{status}`, substituído por success/failure/pending.
+    """
+    back_urls = {
+        status: APP_BASE_URL + return_path.format(status=status)
+        for status in ('success', 'failure', 'pending')
+    }
+    preference = {
+        'items': [
+            {
+                'title': title,
+                'quantity': 1,
+                'unit_price': amount,
+                'currency_id': 'BRL'
+            }
+        ],
+        'payer': {
+            'email': payer_email
+        },
+        'payment_methods': {
+            'excluded_payment_types': [
+                {'id': 'credit_card'},
+                {'id': 'debit_card'}
+            ]
+        },
+        'back_urls': back_urls,
+        'auto_return': 'approved'
+    }
+    if external_reference is not None:
+        preference['external_reference'] = external_reference
+    if MERCADOPAGO_WEBHOOK_SECRET:
+        # Confirmação do pagamento chega pelo webhook (ver app/webhooks.py)
+        preference['notification_url'] = APP_BASE_URL + '/webhooks/mercadopago'
+    if expires_at is not None:
+        preference['expires'] = True
+        preference['expiration_date_to'] = format_mp_datetime(expires_at)
+    return preference
+
+
+mercadopago_client = MercadoPagoClient()
+checkout_flight = SingleFlight()
+# Chamadas simultâneas ao MP na geração do PIX; além disso (e da fila), 503 na hora
+checkout_slots = ConcurrencyLimit('checkout', CHECKOUT_CONCURRENCY, CHECKOUT_MAX_WAITING)
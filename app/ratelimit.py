@@ -0,0 +1,270 @@
+"""Limite de requisições (token bucket) e descarte de carga.
+
+Token bucket: cada regra ("20/minute") vira um balde com capacidade 20 que
+recarrega 20 fichas por minuto; cada requisição gasta uma. As rotas caras
+(/login, /register, geração do PIX) têm regras por IP, por usuário e pela rota
+inteira. Sem ficha: 429 com Retry-After.
+
+Onde ficam os baldes (RATE_LIMIT_BACKEND):
+- 'memory' (padrão): por processo; com N workers o limite efetivo é N vezes maior.
+- 'postgres': tabela rate_limit_buckets, atualizada num único UPSERT atômico
+  com o relógio do banco; vale para todos os workers/instâncias.
+Outro armazenamento só precisa implementar `take(key, rate, burst, cost)`.
+
+Descarte de carga: `ConcurrencyLimit` limita quantas execuções de um trecho
+caro (bcrypt, chamada ao MP) rodam ao mesmo tempo e quantas esperam na fila;
+passando disso, ou esperando mais que o timeout, responde 503 na hora em vez
+de acumular latência. `LoadShedMiddleware` faz o mesmo para todas as rotas.
+"""
+import asyncio
+import json
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .cache import TTLCache
+from .config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_BACKEND, RATE_LIMIT_MAX_KEYS, TRUSTED_PROXY_HOPS,
+    RATE_LIMIT_LOGIN_IP, RATE_LIMIT_LOGIN_USER, RATE_LIMIT_LOGIN_ROUTE,
+    RATE_LIMIT_REGISTER_IP, RATE_LIMIT_REGISTER_ROUTE,
+    RATE_LIMIT_PIX_IP, RATE_LIMIT_PIX_USER, RATE_LIMIT_PIX_ROUTE,
+    MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT_SECONDS,
+)
+from .database import RateLimitBucket, open_session
+from .metrics import LONG_LIVED_ROUTES, rate_limited, load_shed
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+# ---------- Regras ----------
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    rate: float   # fichas por segundo
+    burst: float  # capacidade do balde
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> Optional['Rule']:
+        """'20/minute' -> até 20 de uma vez, recarregando 20 por minuto. Vazio desliga."""
+        if not spec:
+            return None
+        count, _, period = spec.partition('/')
+        if period not in PERIODS or not count.strip().isdigit() or int(count) <= 0:
+            raise ValueError(f'Regra de limite inválida para {name}: {spec!r} (use "N/second|minute|hour|day")')
+        return cls(name, int(count) / PERIODS[period], float(count))
+
+
+ROUTE_RULES: Dict[str, Dict[str, Optional[Rule]]] = {
+    'login': {
+        'ip': Rule.parse('login:ip', RATE_LIMIT_LOGIN_IP),
+        'user': Rule.parse('login:user', RATE_LIMIT_LOGIN_USER),
+        'route': Rule.parse('login:route', RATE_LIMIT_LOGIN_ROUTE),
+    },
+    'register': {
+        'ip': Rule.parse('register:ip', RATE_LIMIT_REGISTER_IP),
+        'route': Rule.parse('register:route', RATE_LIMIT_REGISTER_ROUTE),
+    },
+    'pix': {
+        'ip': Rule.parse('pix:ip', RATE_LIMIT_PIX_IP),
+        'user': Rule.parse('pix:user', RATE_LIMIT_PIX_USER),
+        'route': Rule.parse('pix:route', RATE_LIMIT_PIX_ROUTE),
+    },
+}
+
+
+def client_ip(request: Request) -> str:
+    """IP do cliente; atrás de TRUSTED_PROXY_HOPS proxies, vem do X-Forwarded-For.
+
+    Cada proxy acrescenta à direita o endereço de quem o chamou, então só as
+    últimas TRUSTED_PROXY_HOPS entradas são confiáveis (as anteriores o cliente forja).
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [part.strip() for part in request.headers.get('x-forwarded-for', '').split(',') if part.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else 'unknown'
+
+
+# ---------- Armazenamento dos baldes ----------
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        # Balde ausente (expirado ou despejado pelo LRU) equivale a balde cheio
+        self._buckets = TTLCache(maxsize=max_keys)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Gasta `cost` fichas. Devolve 0 se conseguiu, senão quantos segundos esperar."""
+        now = time.time()
+        tokens, updated = self._buckets.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < cost:
+            return (cost - tokens) / rate
+        tokens -= cost
+        self._buckets.set(key, (tokens, now), expires_at=now + (burst - tokens) / rate)
+        return 0.0
+
+
+class PostgresBucketStore:
+    """Baldes na tabela rate_limit_buckets, compartilhados entre processos."""
+
+    PRUNE_EVERY = 1000  # a cada N chamadas apaga baldes parados há mais de um dia
+
+    def __init__(self):
+        self._calls = 0
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        table = RateLimitBucket.__table__
+        now = func.extract('epoch', func.now())
+        refilled = func.least(burst, table.c.tokens + (now - table.c.updated_at) * rate)
+        stmt = (
+            pg_insert(table).values(key=key, tokens=burst - cost, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={'tokens': refilled - cost, 'updated_at': now},
+                where=refilled >= cost,
+            )
+            .returning(table.c.tokens)
+        )
+        async with open_session() as db:
+            taken = (await db.execute(stmt)).first()
+            retry_after = 0.0
+            if taken is None:
+                # A linha existe e não tem fichas: nada foi alterado
+                tokens = await db.scalar(select(refilled).where(table.c.key == key))
+                retry_after = (cost - (tokens or 0)) / rate
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                await db.execute(delete(table).where(table.c.updated_at < now - 86400))
+            await db.commit()
+        return retry_after
+
+
+def get_bucket_store():
+    if RATE_LIMIT_BACKEND == 'postgres':
+        return PostgresBucketStore()
+    if RATE_LIMIT_BACKEND == 'memory':
+        return MemoryBucketStore()
+    raise RuntimeError(f'RATE_LIMIT_BACKEND desconhecido: {RATE_LIMIT_BACKEND}')
+
+
+class RateLimiter:
+    def __init__(self, store, rules: Dict[str, Dict[str, Optional[Rule]]] = ROUTE_RULES,
+                 enabled: bool = RATE_LIMIT_ENABLED):
+        self.store = store
+        self.rules = rules
+        self.enabled = enabled
+
+    async def check(self, request: Request, route: str, user: Optional[str] = None):
+        """Gasta uma ficha de cada regra da rota (IP, usuário, rota); sem ficha, 429."""
+        if not self.enabled:
+            return
+        identities = {'ip': client_ip(request), 'user': user, 'route': '*'}
+        for scope, rule in self.rules[route].items():
+            identity = identities[scope]
+            if rule is None or identity is None:
+                continue
+            retry_after = await self.store.take(f'{rule.name}:{identity}', rule.rate, rule.burst)
+            if retry_after > 0:
+                rate_limited.inc(rule=rule.name)
+                raise HTTPException(
+                    status_code=429,
+                    detail='Muitas tentativas. Aguarde um pouco e tente novamente.',
+                    headers={'Retry-After': str(max(1, math.ceil(retry_after)))},
+                )
+
+
+rate_limiter = RateLimiter(get_bucket_store())
+
+
+# ---------- Descarte de carga ----------
+
+class Overloaded(Exception):
+    pass
+
+
+class ConcurrencyLimit:
+    """Até `limit` execuções simultâneas e `max_waiting` na fila; o resto é recusado na hora."""
+
+    def __init__(self, name: str, limit: int, max_waiting: int, timeout: float = QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def acquire(self):
+        if self.limit <= 0:
+            return
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            load_shed.inc(limiter=self.name, reason='queue_full')
+            raise Overloaded(self.name)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            load_shed.inc(limiter=self.name, reason='timeout')
+            raise Overloaded(self.name)
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        if self.limit > 0:
+            self._semaphore.release()
+
+    async def __aenter__(self):
+        try:
+            await self.acquire()
+        except Overloaded:
+            raise HTTPException(
+                status_code=503,
+                detail='Serviço sobrecarregado. Tente novamente em instantes.',
+                headers={'Retry-After': '1'},
+            )
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class LoadShedMiddleware:
+    """Limite global de requisições em andamento por processo (MAX_CONCURRENT_REQUESTS; 0 desliga).
+
+    /metrics, /static e conexões longas (SSE) ficam de fora.
+    """
+
+    EXEMPT_PREFIXES = ('/metrics', '/static/')
+
+    def __init__(self, app, limit: int = MAX_CONCURRENT_REQUESTS, max_waiting: int = MAX_QUEUED_REQUESTS,
+                 timeout: float = QUEUE_TIMEOUT_SECONDS):
+        self.app = app
+        self.slots = ConcurrencyLimit('requests', limit, max_waiting, timeout)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '')
+        if (
+            scope['type'] != 'http' or self.slots.limit <= 0
+            or path.startswith(self.EXEMPT_PREFIXES) or path in LONG_LIVED_ROUTES
+        ):
+            return await self.app(scope, receive, send)
+        try:
+            await self.slots.acquire()
+        except Overloaded:
+            body = json.dumps({'detail': 'Serviço sobrecarregado. Tente novamente em instantes.'}).encode()
+            await send({
+                'type': 'http.response.start', 'status': 503,
+                'headers': [(b'content-type', b'application/json'), (b'retry-after', b'1'),
+                            (b'content-length', str(len(body)).encode())],
+            })
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.slots.release()
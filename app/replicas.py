@@ -0,0 +1,214 @@
+"""Réplicas de leitura: dashboards e listagens leem de réplicas, escritas vão para o primário.
+
+- DATABASE_REPLICA_URLS (separadas por vírgula) e DATABASE_REPLICA_WEIGHTS: cada
+  sessão de leitura sorteia uma réplica saudável com probabilidade proporcional
+  ao peso. Sem réplicas (ou nenhuma saudável), tudo vai para o primário.
+- Saúde: `ReplicaHealthChecker` roda SELECT 1 (e, no Postgres, mede o atraso de
+  replicação) a cada REPLICA_HEALTH_INTERVAL segundos. Réplica que não responde
+  em REPLICA_HEALTH_TIMEOUT ou está mais de REPLICA_MAX_LAG_SECONDS atrasada sai
+  da rotação até a próxima verificação boa. Erro de conexão numa requisição
+  também a tira na hora.
+- Leitura das próprias escritas: quando a sessão do primário faz commit numa
+  requisição, a resposta leva o cookie `db_primary` (READ_YOUR_WRITES_SECONDS).
+  Enquanto ele existir, as leituras daquele navegador ficam no primário; por
+  exemplo, o redirect de /patient/new-case para a página de pagamento.
+
+Rotas só de leitura usam `Depends(get_read_db)`; as demais continuam com `get_db`.
+"""
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import InterfaceError, OperationalError
+from starlette.requests import Request
+
+from .config import (
+    DATABASE_REPLICA_URLS, DATABASE_REPLICA_WEIGHTS, REPLICA_HEALTH_INTERVAL, REPLICA_HEALTH_TIMEOUT,
+    REPLICA_MAX_LAG_SECONDS, READ_YOUR_WRITES_SECONDS,
+)
+from .database import USE_ASYNC_DB, make_engine, open_session, track_commits
+from .metrics import read_routing, replica_healthy, replica_lag
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'db_primary'
+
+# Atraso de replicação em segundos (0 se a réplica já aplicou tudo o que recebeu)
+PG_LAG_SQL = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+@dataclass
+class Replica:
+    name: str  # URL sem a senha (rótulo das métricas e logs)
+    engine: object
+    weight: int
+    healthy: bool = True
+    lag: Optional[float] = None
+
+
+class ReplicaPool:
+    def __init__(self, urls: List[str] = DATABASE_REPLICA_URLS, weights: List[int] = DATABASE_REPLICA_WEIGHTS,
+                 max_lag: float = REPLICA_MAX_LAG_SECONDS, timeout: float = REPLICA_HEALTH_TIMEOUT):
+        if weights and len(weights) != len(urls):
+            raise RuntimeError('DATABASE_REPLICA_WEIGHTS precisa de um peso por URL de DATABASE_REPLICA_URLS')
+        self.urls = urls
+        self.weights = weights or [1] * len(urls)
+        self.max_lag = max_lag
+        self.timeout = timeout
+        self.replicas: List[Replica] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    def init(self):
+        """Cria os engines das réplicas (idempotente; o pool só conecta no primeiro uso)."""
+        if self.replicas or not self.urls:
+            return
+        for url, weight in zip(self.urls, self.weights):
+            name = make_url(url).render_as_string(hide_password=True)
+            self.replicas.append(Replica(name, make_engine(url), weight))
+            replica_healthy.set(1, replica=name)
+
+    def choose(self) -> Optional[Replica]:
+        self.init()
+        healthy = [replica for replica in self.replicas if replica.healthy and replica.weight > 0]
+        if not healthy:
+            return None
+        return random.choices(healthy, weights=[replica.weight for replica in healthy])[0]
+
+    def mark_down(self, replica: Replica, reason):
+        if replica.healthy:
+            logger.warning('Réplica %s fora da rotação: %s', replica.name, reason)
+        replica.healthy = False
+        replica_healthy.set(0, replica=replica.name)
+
+    async def _measure_lag(self, replica: Replica) -> float:
+        query = PG_LAG_SQL if replica.engine.dialect.name == 'postgresql' else text('SELECT 0')
+        if USE_ASYNC_DB:
+            async with replica.engine.connect() as conn:
+                return float((await conn.execute(query)).scalar() or 0)
+
+        def measure():
+            with replica.engine.connect() as conn:
+                return float(conn.execute(query).scalar() or 0)
+        return await asyncio.to_thread(measure)
+
+    async def check_one(self, replica: Replica):
+        try:
+            lag = await asyncio.wait_for(self._measure_lag(replica), self.timeout)
+        except Exception as e:
+            self.mark_down(replica, repr(e))
+            return
+        replica.lag = lag
+        replica_lag.set(lag, replica=replica.name)
+        if lag > self.max_lag:
+            self.mark_down(replica, f'atraso de {lag:.1f}s')
+            return
+        if not replica.healthy:
+            logger.info('Réplica %s de volta à rotação', replica.name)
+        replica.healthy = True
+        replica_healthy.set(1, replica=replica.name)
+
+    async def check(self):
+        self.init()
+        await asyncio.gather(*(self.check_one(replica) for replica in self.replicas))
+
+    async def dispose(self):
+        for replica in self.replicas:
+            if USE_ASYNC_DB:
+                await replica.engine.dispose()
+            else:
+                replica.engine.dispose()
+        self.replicas = []
+
+
+replica_pool = ReplicaPool()
+
+
+class ReplicaHealthChecker:
+    """Tarefa de fundo que verifica as réplicas a cada REPLICA_HEALTH_INTERVAL segundos."""
+
+    def __init__(self, pool: ReplicaPool = replica_pool, interval: float = REPLICA_HEALTH_INTERVAL):
+        self.pool = pool
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is not None or not self.pool.enabled or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.pool.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Erro verificando réplicas de leitura')
+
+
+replica_health = ReplicaHealthChecker()
+
+
+# ---------- Sessões de leitura ----------
+
+def wants_primary(request: Request) -> bool:
+    """Escreveu há menos de READ_YOUR_WRITES_SECONDS: lê do primário."""
+    return STICKY_COOKIE in request.cookies
+
+
+async def get_read_db(request: Request):
+    """Dependência das rotas só de leitura: sessão numa réplica, ou no primário se não houver."""
+    replica = None if wants_primary(request) or not replica_pool.enabled else replica_pool.choose()
+    if replica is None:
+        read_routing.inc(target='primary')
+        async with open_session() as db:
+            track_commits(db, request)
+            yield db
+        return
+    read_routing.inc(target='replica')
+    async with open_session(bind=replica.engine) as db:
+        try:
+            yield db
+        except (OperationalError, InterfaceError) as e:
+            # Conexão recusada/caída: fora da rotação já, sem esperar a próxima verificação
+            replica_pool.mark_down(replica, repr(e))
+            raise
+
+
+class ReadYourWritesMiddleware:
+    """Resposta de requisição que fez commit no primário leva o cookie que fixa as leituras lá."""
+
+    def __init__(self, app, seconds: int = READ_YOUR_WRITES_SECONDS, pool: ReplicaPool = replica_pool):
+        self.app = app
+        self.cookie = (
+            f'{STICKY_COOKIE}=1; Max-Age={seconds}; Path=/; HttpOnly; SameSite=Lax'.encode()
+        )
+        self.pool = pool
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.pool.enabled:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start' and scope.get('state', {}).get('db_committed'):
+                message['headers'] = list(message.get('headers', [])) + [(b'set-cookie', self.cookie)]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,433 @@
+"""Estatísticas dos casos para o painel de operações, mantidas incrementalmente.
+
+Em vez de varrer `cases` a cada consulta, cada transição de status grava deltas
+em tabelas de agregados, na mesma transação da transição:
+
+- case_status_counts: casos em cada status por (dia de criação, status, tipo, médico).
+  Uma transição move 1 de um status para o outro.
+- case_daily_stats: eventos por (dia do evento, tipo, médico): criados, pagos,
+  receita (CASE_PRICE por pagamento), revisados, aprovados, rejeitados e a soma
+  do tempo pagamento → revisão.
+- case_review_time_buckets: histograma desse tempo por dia da revisão; a mediana
+  sai do histograma (aproximada dentro da faixa).
+
+`/api/stats` só lê os agregados, então o custo depende do intervalo de dias
+pedido, não do número de casos. Dias em UTC (os timestamps são datetime.utcnow).
+
+`StatsReconciler` recalcula periodicamente os últimos STATS_RECONCILE_DAYS dias a
+partir de `cases` (e `cases_archive`) e substitui os agregados, corrigindo qualquer deriva (escritas
+fora do app, migração de dados). Para preencher o histórico depois da migração:
+`python -m app.stats reconcile --all`.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .archive import all_cases
+from .config import STATS_RECONCILE_INTERVAL, STATS_RECONCILE_DAYS, STATS_MAX_RANGE_DAYS
+from .database import CaseDailyStats, CaseReviewTimeBucket, CaseStatusCount, User, open_session
+from .payments import CASE_PRICE
+
+logger = logging.getLogger(__name__)
+
+NO_DOCTOR = 0
+
+# Limites superiores das faixas do histograma (segundos); a última pega o resto
+REVIEW_TIME_BUCKETS = (
+    60, 5 * 60, 15 * 60, 30 * 60, 3600, 2 * 3600, 4 * 3600, 8 * 3600, 12 * 3600,
+    86400, 2 * 86400, 3 * 86400, 7 * 86400, 2 ** 31 - 1,
+)
+
+DAILY_FIELDS = (
+    'created', 'paid', 'revenue_cents', 'reviewed', 'approved', 'rejected', 'review_timed', 'review_seconds',
+)
+
+# Chave do pg_try_advisory_xact_lock: só uma instância reconcilia por vez
+RECONCILE_LOCK_ID = 0x5747415453  # "STATS"
+
+PRICE_CENTS = round(CASE_PRICE * 100)
+
+
+def review_bucket(seconds: float) -> int:
+    return REVIEW_TIME_BUCKETS[min(bisect.bisect_left(REVIEW_TIME_BUCKETS, seconds), len(REVIEW_TIME_BUCKETS) - 1)]
+
+
+def _as_date(value) -> date:
+    # func.date() devolve date no Postgres e texto no SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+# ---------- Deltas incrementais ----------
+
+class StatsDelta:
+    """Acumula os deltas de uma transação e grava tudo com poucos UPSERTs em `apply`.
+
+    Não faz commit: vai junto com a transição de status que o originou.
+    """
+
+    def __init__(self):
+        self.status_counts: Counter = Counter()                 # (dia, status, tipo, médico) -> delta
+        self.daily: Dict[Tuple, Counter] = defaultdict(Counter)  # (dia, tipo, médico) -> campo -> delta
+        self.buckets: Counter = Counter()                        # (dia, faixa) -> delta
+
+    def created(self, request_type: str, created_at: datetime, count: int = 1) -> 'StatsDelta':
+        self.status_counts[(created_at.date(), 'pending_payment', request_type, NO_DOCTOR)] += count
+        self.daily[(created_at.date(), request_type, NO_DOCTOR)]['created'] += count
+        return self
+
+    def paid(self, request_type: str, created_at: datetime, paid_at: datetime, count: int = 1) -> 'StatsDelta':
+        """pending_payment -> pending_review."""
+        self.status_counts[(created_at.date(), 'pending_payment', request_type, NO_DOCTOR)] -= count
+        self.status_counts[(created_at.date(), 'pending_review', request_type, NO_DOCTOR)] += count
+        daily = self.daily[(paid_at.date(), request_type, NO_DOCTOR)]
+        daily['paid'] += count
+        daily['revenue_cents'] += count * PRICE_CENTS
+        return self
+
+    def reviewed(self, request_type: str, created_at: datetime, paid_at: Optional[datetime],
+                 reviewed_at: datetime, doctor_id: int, status: str) -> 'StatsDelta':
+        """pending_review -> approved/rejected."""
+        self.status_counts[(created_at.date(), 'pending_review', request_type, NO_DOCTOR)] -= 1
+        self.status_counts[(created_at.date(), status, request_type, doctor_id)] += 1
+        daily = self.daily[(reviewed_at.date(), request_type, doctor_id)]
+        daily['reviewed'] += 1
+        daily[status] += 1
+        if paid_at is not None:
+            seconds = max(0.0, (reviewed_at - paid_at).total_seconds())
+            daily['review_timed'] += 1
+            daily['review_seconds'] += seconds
+            self.buckets[(reviewed_at.date(), review_bucket(seconds))] += 1
+        return self
+
+    async def apply(self, db):
+        status_rows = [
+            {'day': day, 'status': status, 'request_type': request_type, 'doctor_id': doctor_id, 'cases': delta}
+            for (day, status, request_type, doctor_id), delta in sorted(self.status_counts.items()) if delta
+        ]
+        daily_rows = [
+            {'day': day, 'request_type': request_type, 'doctor_id': doctor_id,
+             **{field: fields.get(field, 0) for field in DAILY_FIELDS}}
+            for (day, request_type, doctor_id), fields in sorted(self.daily.items())
+        ]
+        bucket_rows = [
+            {'day': day, 'bucket': bucket, 'cases': delta}
+            for (day, bucket), delta in sorted(self.buckets.items()) if delta
+        ]
+        # Ordem fixa das chaves: duas transações somando nas mesmas linhas não se travam mutuamente
+        await _add(db, CaseStatusCount, status_rows, ('cases',))
+        await _add(db, CaseDailyStats, daily_rows, DAILY_FIELDS)
+        await _add(db, CaseReviewTimeBucket, bucket_rows, ('cases',))
+
+
+async def _add(db, model, rows, fields):
+    """UPSERT somando `fields` às linhas existentes (INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x)."""
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key.columns]
+    dialect = db.bind.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={field: table.c[field] + stmt.excluded[field] for field in fields},
+        )
+        await db.execute(stmt)
+        return
+    for row in rows:
+        result = await db.execute(
+            update(table).where(*(table.c[key] == row[key] for key in keys))
+            .values({field: table.c[field] + row[field] for field in fields})
+        )
+        if result.rowcount == 0:
+            await db.execute(table.insert().values(row))
+
+
+# ---------- Reconciliação ----------
+
+async def _try_lock(db) -> bool:
+    if db.bind.dialect.name != 'postgresql':
+        return True
+    return bool(await db.scalar(select(func.pg_try_advisory_xact_lock(RECONCILE_LOCK_ID))))
+
+
+async def reconcile(db, since: Optional[date] = None, page_size: int = 5000) -> Optional[dict]:
+    """Recalcula os agregados a partir de `since` (None: tudo) e faz commit.
+
+    Devolve None se outra instância já está reconciliando. Casos anteriores às
+    colunas paid_at/reviewed_at usam created_at/updated_at como dia do evento e
+    ficam fora do tempo de revisão.
+    """
+    if not await _try_lock(db):
+        await db.rollback()
+        return None
+    start = datetime.combine(since, time.min) if since else None
+    # Inclui os casos já arquivados (app/archive.py)
+    cases = all_cases(
+        'id', 'status', 'request_type', 'doctor_id', 'payment_status',
+        'created_at', 'updated_at', 'paid_at', 'reviewed_at',
+    )
+
+    def window(column):
+        return column >= start if start is not None else column.isnot(None)
+
+    status_rows = (await db.execute(
+        select(func.date(cases.c.created_at), cases.c.status, cases.c.request_type,
+               func.coalesce(cases.c.doctor_id, NO_DOCTOR), func.count())
+        .where(window(cases.c.created_at))
+        .group_by(func.date(cases.c.created_at), cases.c.status, cases.c.request_type,
+                  func.coalesce(cases.c.doctor_id, NO_DOCTOR))
+    )).all()
+
+    daily: Dict[Tuple, Counter] = defaultdict(Counter)
+    for day, request_type, total in (await db.execute(
+        select(func.date(cases.c.created_at), cases.c.request_type, func.count())
+        .where(window(cases.c.created_at))
+        .group_by(func.date(cases.c.created_at), cases.c.request_type)
+    )).all():
+        daily[(_as_date(day), request_type, NO_DOCTOR)]['created'] += total
+
+    paid_at = func.coalesce(cases.c.paid_at, cases.c.created_at)
+    for day, request_type, total in (await db.execute(
+        select(func.date(paid_at), cases.c.request_type, func.count())
+        .where(window(paid_at), or_(cases.c.paid_at.isnot(None), cases.c.payment_status.in_(('paid', 'success'))))
+        .group_by(func.date(paid_at), cases.c.request_type)
+    )).all():
+        fields = daily[(_as_date(day), request_type, NO_DOCTOR)]
+        fields['paid'] += total
+        fields['revenue_cents'] += total * PRICE_CENTS
+
+    # Revisões caso a caso (o tempo de revisão é calculado aqui, igual ao incremental)
+    reviews = StatsDelta()
+    reviewed_at = func.coalesce(cases.c.reviewed_at, cases.c.updated_at)
+    last_id = 0
+    while True:
+        page = (await db.execute(
+            select(cases.c.id, cases.c.request_type, cases.c.created_at, cases.c.paid_at, reviewed_at, cases.c.doctor_id, cases.c.status)
+            .where(cases.c.status.in_(('approved', 'rejected')), window(reviewed_at), cases.c.id > last_id)
+            .order_by(cases.c.id).limit(page_size)
+        )).all()
+        for case_id, request_type, created_at, paid, reviewed, doctor_id, status in page:
+            reviews.reviewed(request_type, created_at, paid, reviewed, doctor_id or NO_DOCTOR, status)
+        if len(page) < page_size:
+            break
+        last_id = page[-1][0]
+    for key, fields in reviews.daily.items():
+        daily[key].update(fields)
+
+    for model in (CaseStatusCount, CaseDailyStats, CaseReviewTimeBucket):
+        stmt = delete(model)
+        if since is not None:
+            stmt = stmt.where(model.day >= since)
+        await db.execute(stmt)
+    if status_rows:
+        await db.execute(CaseStatusCount.__table__.insert(), [
+            {'day': _as_date(day), 'status': status, 'request_type': request_type,
+             'doctor_id': doctor_id, 'cases': total}
+            for day, status, request_type, doctor_id, total in status_rows
+        ])
+    if daily:
+        await db.execute(CaseDailyStats.__table__.insert(), [
+            {'day': day, 'request_type': request_type, 'doctor_id': doctor_id,
+             **{field: fields.get(field, 0) for field in DAILY_FIELDS}}
+            for (day, request_type, doctor_id), fields in daily.items()
+        ])
+    if reviews.buckets:
+        await db.execute(CaseReviewTimeBucket.__table__.insert(), [
+            {'day': day, 'bucket': bucket, 'cases': total} for (day, bucket), total in reviews.buckets.items()
+        ])
+    await db.commit()
+    return {'since': since.isoformat() if since else None, 'status_rows': len(status_rows),
+            'daily_rows': len(daily), 'bucket_rows': len(reviews.buckets)}
+
+
+async def reset_stats(db):
+    """Apaga os agregados (junto com um reset dos casos). Não faz commit."""
+    for model in (CaseStatusCount, CaseDailyStats, CaseReviewTimeBucket):
+        await db.execute(delete(model))
+
+
+class StatsReconciler:
+    """Tarefa de fundo que reconcilia os últimos dias a cada STATS_RECONCILE_INTERVAL segundos."""
+
+    def __init__(self, interval: float = STATS_RECONCILE_INTERVAL, days: int = STATS_RECONCILE_DAYS):
+        self.interval = interval
+        self.days = days
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is not None or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> Optional[dict]:
+        async with open_session() as db:
+            return await reconcile(db, datetime.utcnow().date() - timedelta(days=max(0, self.days - 1)))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Erro reconciliando estatísticas dos casos')
+
+
+stats_reconciler = StatsReconciler()
+
+
+# ---------- Leitura ----------
+
+def _quantile(buckets: Dict[int, int], q: float) -> Optional[float]:
+    """Quantil aproximado do histograma: interpolação linear dentro da faixa."""
+    total = sum(buckets.values())
+    if total <= 0:
+        return None
+    target = q * total
+    cumulative = 0
+    lower = 0
+    for upper in REVIEW_TIME_BUCKETS:
+        count = buckets.get(upper, 0)
+        if count > 0 and cumulative + count >= target:
+            if upper == REVIEW_TIME_BUCKETS[-1]:
+                return float(lower)  # faixa aberta: só se sabe que passou do limite anterior
+            return lower + (upper - lower) * (target - cumulative) / count
+        cumulative += count
+        lower = upper
+    return float(lower)
+
+
+async def case_stats(db, start: date, end: date) -> dict:
+    """Resumo do intervalo [start, end] lido só das tabelas de agregados.
+
+    Contagens por status contam os casos criados no intervalo; os demais números,
+    os eventos (criação, pagamento, revisão) que aconteceram nele.
+    """
+    by_status: Counter = Counter()
+    by_request_type: Dict[str, Counter] = defaultdict(Counter)
+    for status, request_type, total in (await db.execute(
+        select(CaseStatusCount.status, CaseStatusCount.request_type, func.sum(CaseStatusCount.cases))
+        .where(CaseStatusCount.day.between(start, end))
+        .group_by(CaseStatusCount.status, CaseStatusCount.request_type)
+    )).all():
+        if total:
+            by_status[status] += total
+            by_request_type[request_type][status] += total
+
+    sums = [func.coalesce(func.sum(getattr(CaseDailyStats, field)), 0) for field in DAILY_FIELDS]
+    daily = []
+    totals: Counter = Counter()
+    for day, *values in (await db.execute(
+        select(CaseDailyStats.day, *sums)
+        .where(CaseDailyStats.day.between(start, end))
+        .group_by(CaseDailyStats.day).order_by(CaseDailyStats.day)
+    )).all():
+        fields = dict(zip(DAILY_FIELDS, values))
+        totals.update(fields)
+        daily.append({
+            'day': _as_date(day).isoformat(),
+            'created': fields['created'],
+            'paid': fields['paid'],
+            'revenue': fields['revenue_cents'] / 100,
+            'reviewed': fields['reviewed'],
+            'approved': fields['approved'],
+            'rejected': fields['rejected'],
+        })
+
+    doctors = []
+    for doctor_id, full_name, *values in (await db.execute(
+        select(CaseDailyStats.doctor_id, User.full_name, *sums)
+        .outerjoin(User, User.id == CaseDailyStats.doctor_id)
+        .where(CaseDailyStats.day.between(start, end), CaseDailyStats.doctor_id != NO_DOCTOR)
+        .group_by(CaseDailyStats.doctor_id, User.full_name)
+        .order_by(CaseDailyStats.doctor_id)
+    )).all():
+        fields = dict(zip(DAILY_FIELDS, values))
+        doctors.append({
+            'doctor_id': doctor_id,
+            'name': full_name,
+            'reviewed': fields['reviewed'],
+            'approved': fields['approved'],
+            'rejected': fields['rejected'],
+            'mean_review_seconds': (
+                round(fields['review_seconds'] / fields['review_timed'], 1) if fields['review_timed'] else None
+            ),
+        })
+
+    buckets = dict((await db.execute(
+        select(CaseReviewTimeBucket.bucket, func.sum(CaseReviewTimeBucket.cases))
+        .where(CaseReviewTimeBucket.day.between(start, end))
+        .group_by(CaseReviewTimeBucket.bucket)
+    )).all())
+    median = _quantile(buckets, 0.5)
+    p90 = _quantile(buckets, 0.9)
+
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'cases_by_status': dict(by_status),
+        'cases_by_request_type': {key: dict(value) for key, value in sorted(by_request_type.items())},
+        'created': totals['created'],
+        'paid': totals['paid'],
+        'revenue': totals['revenue_cents'] / 100,
+        'reviewed': totals['reviewed'],
+        'approved': totals['approved'],
+        'rejected': totals['rejected'],
+        'review_time': {
+            'timed_reviews': totals['review_timed'],
+            'median_seconds': round(median, 1) if median is not None else None,
+            'p90_seconds': round(p90, 1) if p90 is not None else None,
+            'mean_seconds': (
+                round(totals['review_seconds'] / totals['review_timed'], 1) if totals['review_timed'] else None
+            ),
+        },
+        'by_doctor': doctors,
+        'daily': daily,
+    }
+
+
+def stats_range(days: int, end: Optional[date] = None) -> Tuple[date, date]:
+    end = end or datetime.utcnow().date()
+    days = max(1, min(days, STATS_MAX_RANGE_DAYS))
+    return end - timedelta(days=days - 1), end
+
+
+# ---------- Linha de comando ----------
+
+async def _reconcile_command(days: Optional[int]) -> Optional[dict]:
+    async with open_session() as db:
+        since = None if days is None else datetime.utcnow().date() - timedelta(days=max(0, days - 1))
+        return await reconcile(db, since)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estatísticas dos casos')
+    sub = parser.add_subparsers(dest='command', required=True)
+    command = sub.add_parser('reconcile', help='recalcula os agregados a partir da tabela cases')
+    scope = command.add_mutually_exclusive_group()
+    scope.add_argument('--all', action='store_true', help='todo o histórico')
+    scope.add_argument('--days', type=int, default=STATS_RECONCILE_DAYS)
+    args = parser.parse_args()
+    result = asyncio.run(_reconcile_command(None if args.all else args.days))
+    print(json.dumps(result, ensure_ascii=False) if result else 'Outra instância já está reconciliando')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Armazenamento dos documentos gerados: disco local ou S3.
+
+Nenhum driver carrega o arquivo inteiro em memória: o upload vai do disco em
+partes (multipart no S3) e o download é lido em blocos de STORAGE_CHUNK_SIZE,
+com suporte a intervalos (Range). No S3, a rota pode simplesmente redirecionar
+para uma URL pré-assinada, e o arquivo nem passa pelo servidor da aplicação.
+"""
+import os
+import shutil
+from typing import AsyncIterator, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import (
+    STORAGE_BACKEND, DOCUMENT_DIR, S3_BUCKET, S3_PREFIX, S3_REGION, S3_ENDPOINT_URL,
+    STORAGE_CHUNK_SIZE, STORAGE_PRESIGN_SECONDS,
+)
+
+
+class StorageError(Exception):
+    pass
+
+
+class LocalStorage:
+    name = 'local'
+
+    def __init__(self, root: str = DOCUMENT_DIR, chunk_size: int = STORAGE_CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise StorageError(f'Chave inválida: {key}')
+        return path
+
+    def _save(self, key: str, source_path: str):
+        dest = self.path(key)
+        if os.path.abspath(source_path) == dest:
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(source_path, 'rb') as src, open(dest + '.tmp', 'wb') as out:
+            shutil.copyfileobj(src, out, self.chunk_size)
+        os.replace(dest + '.tmp', dest)
+
+    async def save_file(self, key: str, source_path: str):
+        await run_in_threadpool(self._save, key, source_path)
+
+    async def size(self, key: str) -> int:
+        try:
+            return await run_in_threadpool(os.path.getsize, self.path(key))
+        except FileNotFoundError:
+            raise StorageError(f'Arquivo não encontrado: {key}')
+
+    async def iter_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Lê os bytes [start, end] (inclusive) em blocos."""
+        f = await run_in_threadpool(open, self.path(key), 'rb')
+        try:
+            await run_in_threadpool(f.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await run_in_threadpool(f.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(f.close)
+
+    def presigned_url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        return None  # Disco local: o arquivo sempre passa pela aplicação
+
+
+class S3Storage:
+    name = 's3'
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, region: str = S3_REGION,
+                 endpoint_url: Optional[str] = S3_ENDPOINT_URL, chunk_size: int = STORAGE_CHUNK_SIZE):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.chunk_size = chunk_size
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3  # só carrega o SDK quando o S3 é realmente usado
+            self._client = boto3.client('s3', region_name=self.region, endpoint_url=self.endpoint_url)
+        return self._client
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _save(self, key: str, source_path: str):
+        from boto3.s3.transfer import TransferConfig
+        # upload_file lê o arquivo do disco em partes (multipart acima de 8 MB)
+        config = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024)
+        self.client.upload_file(
+            source_path, self.bucket, self.object_key(key),
+            ExtraArgs={'ContentType': 'application/pdf'}, Config=config,
+        )
+
+    async def save_file(self, key: str, source_path: str):
+        await run_in_threadpool(self._save, key, source_path)
+
+    async def size(self, key: str) -> int:
+        from botocore.exceptions import ClientError
+        try:
+            head = await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            raise StorageError(f'Arquivo não encontrado: {key} ({e})')
+        return head['ContentLength']
+
+    async def iter_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        obj = await run_in_threadpool(
+            self.client.get_object, Bucket=self.bucket, Key=self.object_key(key), Range=f'bytes={start}-{end}'
+        )
+        body = obj['Body']
+        chunks = body.iter_chunks(self.chunk_size)
+        try:
+            while True:
+                chunk = await run_in_threadpool(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def presigned_url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        params = {'Bucket': self.bucket, 'Key': self.object_key(key), 'ResponseContentType': 'application/pdf'}
+        if filename:
+            params['ResponseContentDisposition'] = f'inline; filename="{filename}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=STORAGE_PRESIGN_SECONDS)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Interpreta um header Range de um único intervalo ("bytes=a-b", "bytes=a-", "bytes=-n").
+
+    Retorna None para pedir o arquivo inteiro; levanta ValueError se o intervalo for inválido.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    if first == '':
+        if not last:
+            raise ValueError(header)
+        length = int(last)
+        start, end = max(0, size - length), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def get_storage():
+    if STORAGE_BACKEND == 's3':
+        return S3Storage()
+    return LocalStorage()
+
+
+storage = get_storage()
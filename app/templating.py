@@ -0,0 +1,111 @@
+"""Camada de templates: Jinja2 com cache de bytecode, cache de fragmentos e CSS estático.
+
+- Bytecode: os templates compilados ficam em TEMPLATE_BYTECODE_CACHE_DIR e são
+  reaproveitados no próximo processo (cold start e cada worker do uvicorn).
+  Com TEMPLATE_AUTO_RELOAD=false o Jinja nem confere o mtime dos arquivos.
+- Fragmentos: `{{ fragment('partials/x.html', case, ...) }}` renderiza a linha do
+  caso uma vez e guarda o HTML, com chave (template, case.id, case.updated_at,
+  extras). Qualquer alteração no caso muda updated_at e, portanto, a chave.
+- Estáticos: `static_url('app.css')` devolve /static/app.<hash>.css; a URL muda
+  quando o conteúdo muda, então a resposta pode ser cacheada por um ano.
+"""
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .cache import TTLCache
+from .config import TEMPLATE_BYTECODE_CACHE_DIR, TEMPLATE_AUTO_RELOAD, FRAGMENT_CACHE_MAX_ENTRIES
+from .metrics import InstrumentedTemplates
+
+TEMPLATE_DIR = 'app/templates'
+STATIC_DIR = 'app/static'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+# ---------- Arquivos estáticos ----------
+
+class StaticAssets:
+    """Serve os arquivos de STATIC_DIR a partir da memória, com nome versionado pelo conteúdo."""
+
+    def __init__(self, directory: str = STATIC_DIR):
+        self.directory = directory
+        self._files: Dict[str, Tuple[str, bytes, str]] = {}  # nome -> (hash, conteúdo, content-type)
+
+    def _load(self, name: str) -> Optional[Tuple[str, bytes, str]]:
+        entry = self._files.get(name)
+        if entry is None:
+            path = os.path.join(self.directory, name)
+            if '/' in name or name.startswith('.') or not os.path.isfile(path):
+                return None
+            with open(path, 'rb') as f:
+                content = f.read()
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            entry = self._files[name] = (hashlib.sha256(content).hexdigest()[:12], content, content_type)
+        return entry
+
+    def url(self, name: str) -> str:
+        entry = self._load(name)
+        if entry is None:
+            raise ValueError(f'Arquivo estático não encontrado: {name}')
+        stem, ext = os.path.splitext(name)
+        return f'/static/{stem}.{entry[0]}{ext}'
+
+    def response(self, request: Request, filename: str) -> Response:
+        # app.<hash>.css -> app.css; sem hash (ou hash antigo) o cache é curto
+        stem, ext = os.path.splitext(filename)
+        base, _, digest = stem.rpartition('.')
+        name = f'{base}{ext}' if base else filename
+        entry = self._load(name)
+        if entry is None:
+            return Response(status_code=404)
+        current, content, content_type = entry
+        etag = f'"{current}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': IMMUTABLE if digest == current else 'no-cache',
+        }
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content, media_type=content_type, headers=headers)
+
+
+static_assets = StaticAssets()
+
+
+# ---------- Templates ----------
+
+def _bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    if not TEMPLATE_BYTECODE_CACHE_DIR:
+        return None
+    os.makedirs(TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+    return FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR)
+
+
+templates = InstrumentedTemplates(
+    directory=TEMPLATE_DIR,
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+)
+
+fragment_cache = TTLCache(FRAGMENT_CACHE_MAX_ENTRIES)
+
+
+def fragment(template_name: str, case, **extra) -> Markup:
+    """Linha de caso renderizada e cacheada por (template, case.id, case.updated_at, extras)."""
+    key = (template_name, case.id, case.updated_at, tuple(sorted(extra.items())))
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(templates.get_template(template_name).render(case=case, **extra))
+        fragment_cache.set(key, html)
+    return html
+
+
+templates.env.globals['fragment'] = fragment
+templates.env.globals['static_url'] = static_assets.url
@@ -0,0 +1,225 @@
+"""Webhook de pagamentos do Mercado Pago.
+
+A rota só valida a assinatura, grava a notificação em `payment_notifications`
+e responde 200. O processamento fica com `PaymentNotificationWorker`: tarefas em
+background que pegam lotes da fila, consultam cada pagamento uma única vez
+(notificações repetidas do mesmo pagamento são agrupadas) e aplicam o resultado
+em `Case.payment_status`/`status` numa única transação por lote (as estatísticas
+de app/stats.py e os avisos de pagamento de app/notifications.py vão na mesma transação).
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_, update
+
+from .config import (
+    MERCADOPAGO_WEBHOOK_SECRET, MERCADOPAGO_WEBHOOK_TOLERANCE, PAYMENT_WORKERS, PAYMENT_BATCH_SIZE,
+    PAYMENT_POLL_INTERVAL, PAYMENT_MAX_ATTEMPTS, PAYMENT_RETRY_BACKOFF,
+)
+from .database import Case, PaymentNotification, open_session
+from .drafts import draft_prefetcher
+from .events import publish_case_event
+from .jobqueue import claim_rows, retry_delay
+from .notifications import enqueue_case_notification, notification_dispatcher
+from .payments import mercadopago_client
+from .stats import StatsDelta
+
+logger = logging.getLogger(__name__)
+
+# Notificações "processing" há mais tempo que isso voltam para a fila (worker morreu)
+PROCESSING_TIMEOUT = timedelta(minutes=5)
+
+# status do pagamento no MP -> payment_status do caso
+MP_STATUS_MAP = {
+    'approved': 'paid',
+    'authorized': 'pending',
+    'in_process': 'pending',
+    'pending': 'pending',
+    'rejected': 'failed',
+    'cancelled': 'failed',
+    'refunded': 'failed',
+    'charged_back': 'failed',
+}
+
+
+def verify_signature(x_signature: Optional[str], x_request_id: Optional[str], data_id: Optional[str],
+                     secret: str = MERCADOPAGO_WEBHOOK_SECRET, tolerance: int = MERCADOPAGO_WEBHOOK_TOLERANCE,
+                     now: Optional[float] = None) -> bool:
+    """Valida o header x-signature ("ts=...,v1=...") conforme a documentação do MP.
+
+    O `ts` assinado também precisa estar a no máximo `tolerance` segundos do
+    relógio local; sem isso uma notificação capturada poderia ser reenviada para sempre.
+    """
+    if not (secret and x_signature and data_id):
+        return False
+    parts = dict(
+        item.split('=', 1) for item in x_signature.split(',') if '=' in item
+    )
+    ts, received = parts.get('ts', '').strip(), parts.get('v1', '').strip()
+    if not ts.isdigit() or not received:
+        return False
+    if tolerance > 0:
+        sent_at = int(ts) / 1000 if len(ts) > 11 else int(ts)  # o MP manda em ms; aceita também segundos
+        if abs((time.time() if now is None else now) - sent_at) > tolerance:
+            return False
+    manifest = f'id:{data_id.lower()};request-id:{x_request_id or ""};ts:{ts};'
+    expected = hmac.new(secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, received)
+
+
+async def claim_notifications(db, limit: int) -> List[PaymentNotification]:
+    now = datetime.utcnow()
+    ready = or_(
+        (PaymentNotification.status == 'pending')
+        & or_(PaymentNotification.next_attempt_at.is_(None), PaymentNotification.next_attempt_at <= now),
+        (PaymentNotification.status == 'processing') & (PaymentNotification.locked_at < now - PROCESSING_TIMEOUT),
+    )
+    return await claim_rows(db, PaymentNotification, ready, {'status': 'processing', 'locked_at': now}, limit)
+
+
+async def apply_payment(db, payment: dict) -> Optional[int]:
+    """Aplica o status de um pagamento ao caso (external_reference).
+
+    Retorna o id do caso se ele foi atualizado (None se não existe ou já saiu de pending_payment).
+    """
+    reference = payment.get('external_reference')
+    if not reference or not str(reference).isdigit():
+        return None
+    case_id = int(reference)
+    payment_status = MP_STATUS_MAP.get(payment.get('status'), 'pending')
+    values = dict(payment_status=payment_status, version=Case.version + 1)
+    if payment_status == 'paid':
+        # Só avança casos ainda aguardando pagamento (notificações fora de ordem não regridem o caso)
+        now = datetime.utcnow()
+        row = (await db.execute(
+            update(Case).where(Case.id == case_id, Case.status == 'pending_payment')
+            .values(status='pending_review', paid_at=now, **values)
+            .returning(Case.request_type, Case.created_at, Case.patient_id)
+            .execution_options(synchronize_session=False)
+        )).first()
+        if row is None:
+            return None
+        await StatsDelta().paid(row.request_type, row.created_at, now).apply(db)
+        await enqueue_case_notification(db, 'case.paid', case_id, row.patient_id, request_type=row.request_type)
+        return case_id
+    result = await db.execute(
+        update(Case).where(Case.id == case_id, Case.status == 'pending_payment')
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return case_id if result.rowcount == 1 else None
+
+
+async def process_batch(db, notifications: List[PaymentNotification]) -> Dict[str, int]:
+    """Processa um lote já reservado; devolve contadores (pagamentos, casos, erros)."""
+    by_payment: Dict[str, List[PaymentNotification]] = defaultdict(list)
+    ignored = []
+    for notification in notifications:
+        if notification.topic == 'payment':
+            by_payment[notification.resource_id].append(notification)
+        else:
+            ignored.append(notification)
+
+    # Consulta cada pagamento uma vez só, em paralelo
+    payment_ids = list(by_payment)
+    results = await asyncio.gather(
+        *(mercadopago_client.get_payment(payment_id) for payment_id in payment_ids),
+        return_exceptions=True,
+    )
+
+    now = datetime.utcnow()
+    stats = {'payments': 0, 'cases': 0, 'errors': 0}
+    paid_case_ids = []
+    for payment_id, result in zip(payment_ids, results):
+        group = by_payment[payment_id]
+        if isinstance(result, Exception):
+            stats['errors'] += 1
+            for notification in group:
+                notification.attempts = (notification.attempts or 0) + 1
+                notification.last_error = repr(result)
+                notification.status = 'failed' if notification.attempts >= PAYMENT_MAX_ATTEMPTS else 'pending'
+                # MP fora do ar (ou disjuntor aberto): espera antes de tentar de novo
+                notification.next_attempt_at = now + retry_delay(notification.attempts, PAYMENT_RETRY_BACKOFF)
+            continue
+        stats['payments'] += 1
+        case_id = await apply_payment(db, result)
+        if case_id is not None:
+            stats['cases'] += 1
+            if MP_STATUS_MAP.get(result.get('status')) == 'paid':
+                paid_case_ids.append(case_id)
+        for notification in group:
+            notification.status = 'done'
+            notification.processed_at = now
+    for notification in ignored:
+        notification.status = 'done'
+        notification.processed_at = now
+
+    await db.commit()
+    if paid_case_ids:
+        draft_prefetcher.notify()  # casos novos em pending_review: prepara os rascunhos
+        notification_dispatcher.notify()
+        await publish_case_event(db, 'case.paid', paid_case_ids)
+    return stats
+
+
+class PaymentNotificationWorker:
+    """Pool de tarefas asyncio que drenam `payment_notifications` em lotes."""
+
+    def __init__(self, workers: int = PAYMENT_WORKERS, batch_size: int = PAYMENT_BATCH_SIZE,
+                 poll_interval: float = PAYMENT_POLL_INTERVAL):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Acorda os workers assim que chega uma notificação, sem esperar o poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def drain(self) -> int:
+        """Processa a fila até esvaziar (usado nos workers e em testes/scripts)."""
+        processed = 0
+        while True:
+            async with open_session() as db:
+                batch = await claim_notifications(db, self.batch_size)
+                if not batch:
+                    return processed
+                await process_batch(db, batch)
+                processed += len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Erro processando notificações de pagamento')
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+payment_worker = PaymentNotificationWorker()
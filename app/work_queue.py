@@ -0,0 +1,139 @@
+"""Fila de revisão dos médicos: reserva (claim) atômica de casos pending_review.
+
+Cada reserva vale por CASE_LEASE_SECONDS. Se o médico não concluir a revisão
+nesse prazo, o caso volta automaticamente para a fila (a reserva vencida deixa
+de contar em `claimable()`), sem precisar de job de limpeza.
+
+No Postgres a reserva usa SELECT ... FOR UPDATE SKIP LOCKED, então vários
+médicos puxam casos diferentes sem esperar uns pelos outros. Nos demais bancos
+(SQLite local) usa UPDATE condicional na coluna `version` (controle otimista).
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, or_, select, update
+
+from .config import CASE_LEASE_SECONDS, CASE_CLAIM_BATCH_MAX
+from .database import Case
+from .notifications import enqueue_case_notification
+from .stats import StatsDelta
+
+
+def lease_deadline(now: datetime) -> datetime:
+    return now + timedelta(seconds=CASE_LEASE_SECONDS)
+
+
+def claimable(now: datetime, doctor_id: Optional[int] = None):
+    """Casos que podem ser reservados: pendentes e sem reserva válida (ou já do próprio médico)."""
+    free = or_(Case.claimed_by_id.is_(None), Case.lease_expires_at < now)
+    if doctor_id is not None:
+        free = or_(free, Case.claimed_by_id == doctor_id)
+    return and_(Case.status == 'pending_review', free)
+
+
+async def claim_next_cases(db, doctor_id: int, batch: int = 1) -> List[Case]:
+    """Reserva até `batch` casos, os mais antigos primeiro."""
+    batch = max(1, min(batch, CASE_CLAIM_BATCH_MAX))
+    now = datetime.utcnow()
+    if db.bind.dialect.name == 'postgresql':
+        ids = await _claim_skip_locked(db, doctor_id, batch, now)
+    else:
+        ids = await _claim_optimistic(db, doctor_id, batch, now)
+    await db.commit()
+    if not ids:
+        return []
+    return list((await db.scalars(
+        select(Case).where(Case.id.in_(ids)).order_by(Case.created_at, Case.id)
+        .execution_options(populate_existing=True)
+    )).all())
+
+
+async def _claim_skip_locked(db, doctor_id, batch, now) -> List[int]:
+    rows = (await db.execute(
+        select(Case.id).where(claimable(now))
+        .order_by(Case.created_at, Case.id).limit(batch)
+        .with_for_update(skip_locked=True)
+    )).all()
+    ids = [row.id for row in rows]
+    if ids:
+        await db.execute(
+            update(Case).where(Case.id.in_(ids))
+            .values(claimed_by_id=doctor_id, lease_expires_at=lease_deadline(now), version=Case.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+    return ids
+
+
+async def _claim_optimistic(db, doctor_id, batch, now) -> List[int]:
+    # Busca alguns candidatos a mais: outro médico pode ganhar a corrida por parte deles
+    candidates = (await db.execute(
+        select(Case.id, Case.version).where(claimable(now))
+        .order_by(Case.created_at, Case.id).limit(batch * 3)
+    )).all()
+    ids = []
+    for case_id, version in candidates:
+        result = await db.execute(
+            update(Case).where(Case.id == case_id, Case.version == version, claimable(now))
+            .values(claimed_by_id=doctor_id, lease_expires_at=lease_deadline(now), version=Case.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            ids.append(case_id)
+            if len(ids) == batch:
+                break
+    return ids
+
+
+async def claim_case(db, doctor_id: int, case_id: int) -> bool:
+    """Reserva (ou renova a reserva de) um caso específico. False se outro médico o detém."""
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(Case).where(Case.id == case_id, claimable(now, doctor_id))
+        .values(claimed_by_id=doctor_id, lease_expires_at=lease_deadline(now), version=Case.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def release_case(db, doctor_id: int, case_id: int) -> bool:
+    """Devolve à fila um caso reservado pelo médico."""
+    result = await db.execute(
+        update(Case).where(Case.id == case_id, Case.claimed_by_id == doctor_id, Case.status == 'pending_review')
+        .values(claimed_by_id=None, lease_expires_at=None, version=Case.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def complete_review(db, doctor_id: int, case_id: int, status: str,
+                          rejection_reason: Optional[str] = None) -> bool:
+    """Conclui a revisão numa única instrução condicional.
+
+    Só passa se o caso ainda estiver pending_review e não houver reserva válida de
+    outro médico, o que impede duas revisões do mesmo caso. Registra a revisão nas
+    estatísticas (app/stats.py) e o aviso ao paciente (app/notifications.py) na
+    mesma transação.
+    """
+    now = datetime.utcnow()
+    values = dict(
+        status=status, doctor_id=doctor_id, updated_at=now, reviewed_at=now,
+        claimed_by_id=None, lease_expires_at=None, version=Case.version + 1,
+    )
+    if status == 'rejected':
+        values['rejection_reason'] = rejection_reason
+    row = (await db.execute(
+        update(Case).where(Case.id == case_id, claimable(now, doctor_id))
+        .values(**values)
+        .returning(Case.request_type, Case.created_at, Case.paid_at, Case.patient_id)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if row is None:
+        return False
+    await StatsDelta().reviewed(row.request_type, row.created_at, row.paid_at, now, doctor_id, status).apply(db)
+    await enqueue_case_notification(
+        db, f'case.{status}', case_id, row.patient_id,
+        request_type=row.request_type, rejection_reason=values.get('rejection_reason'),
+    )
+    return True
@@ -0,0 +1,111 @@
+"""Servidor falso do Mercado Pago para testes e benchmarks locais.
+
+Uso:
+    uvicorn benchmarks.fake_mercadopago:app --port 8090
+    MERCADOPAGO_API_URL=http://127.0.0.1:8090 MERCADOPAGO_ACCESS_TOKEN=fake uvicorn app.main:app
+
+Também pode ser usado em processo, sem rede:
+    MercadoPagoClient(base_url='http://fake-mp', access_token='fake',
+                      transport=httpx.ASGITransport(app=fake_mercadopago.app))
+
+Variáveis de ambiente:
+    FAKE_MP_LATENCY_MS   latência artificial por chamada (padrão 0)
+    FAKE_MP_ERROR_RATE   fração de respostas 503, para exercitar retry/circuit breaker (padrão 0)
+    FAKE_MP_WEBHOOK_URL  se definido, /fake/pay envia a notificação assinada para essa URL
+    FAKE_MP_WEBHOOK_SECRET  segredo usado na assinatura (o MERCADOPAGO_WEBHOOK_SECRET do app)
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import os
+import random
+import time
+import uuid
+
+import httpx
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = float(os.getenv('FAKE_MP_LATENCY_MS', '0'))
+ERROR_RATE = float(os.getenv('FAKE_MP_ERROR_RATE', '0'))
+WEBHOOK_URL = os.getenv('FAKE_MP_WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('FAKE_MP_WEBHOOK_SECRET', '')
+
+app = FastAPI(title='Fake Mercado Pago')
+app.state.preferences = {}
+app.state.payments = {}
+app.state.idempotency = {}
+app.state.calls = 0
+_payment_ids = itertools.count(1000)
+
+
+async def _simulate():
+    app.state.calls += 1
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        raise HTTPException(status_code=503, detail='fake outage')
+
+
+@app.post('/checkout/preferences')
+async def create_preference(request: Request, authorization: str = Header(None),
+                            x_idempotency_key: str = Header(None)):
+    await _simulate()
+    if not authorization or not authorization.startswith('Bearer '):
+        raise HTTPException(status_code=401, detail='unauthorized')
+    if x_idempotency_key in app.state.idempotency:
+        return JSONResponse(app.state.preferences[app.state.idempotency[x_idempotency_key]], status_code=201)
+    body = await request.json()
+    preference_id = f'pref-{uuid.uuid4().hex[:12]}'
+    preference = dict(body, id=preference_id, init_point=f'http://fake-mp/checkout/{preference_id}')
+    app.state.preferences[preference_id] = preference
+    if x_idempotency_key:
+        app.state.idempotency[x_idempotency_key] = preference_id
+    return JSONResponse(preference, status_code=201)
+
+
+@app.post('/fake/pay/{preference_id}')
+async def pay_preference(preference_id: str, status: str = 'approved'):
+    """Simula o pagamento de uma preferência (não existe na API real)."""
+    preference = app.state.preferences.get(preference_id)
+    if preference is None:
+        raise HTTPException(status_code=404, detail='preference not found')
+    payment_id = str(next(_payment_ids))
+    app.state.payments[payment_id] = {
+        'id': int(payment_id),
+        'status': status,
+        'external_reference': preference.get('external_reference'),
+        'preference_id': preference_id,
+    }
+    if WEBHOOK_URL:
+        await send_webhook(WEBHOOK_URL, payment_id, WEBHOOK_SECRET)
+    return app.state.payments[payment_id]
+
+
+def signed_webhook(payment_id: str, secret: str):
+    """Query string, headers e corpo de uma notificação assinada como o MP faz."""
+    request_id = uuid.uuid4().hex
+    ts = str(int(time.time()))
+    manifest = f'id:{payment_id};request-id:{request_id};ts:{ts};'
+    signature = hmac.new(secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+    params = {'data.id': payment_id, 'type': 'payment'}
+    headers = {'x-signature': f'ts={ts},v1={signature}', 'x-request-id': request_id}
+    body = {'action': 'payment.updated', 'type': 'payment', 'data': {'id': payment_id}}
+    return params, headers, body
+
+
+async def send_webhook(url: str, payment_id: str, secret: str):
+    params, headers, body = signed_webhook(payment_id, secret)
+    async with httpx.AsyncClient() as client:
+        await client.post(url, params=params, headers=headers, json=body)
+
+
+@app.get('/v1/payments/{payment_id}')
+async def get_payment(payment_id: str):
+    await _simulate()
+    payment = app.state.payments.get(payment_id)
+    if payment is None:
+        raise HTTPException(status_code=404, detail='payment not found')
+    return payment
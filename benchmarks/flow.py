@@ -0,0 +1,324 @@
+"""Carga e latência do fluxo completo paciente → médico, com resultado em JSON.
+
+Uso:
+    python -m benchmarks.flow --flows 200 --concurrency 20
+    python -m benchmarks.flow --mode uvicorn --workers 4 --flows 500 --concurrency 50
+    DATABASE_URL=postgresql://... python -m benchmarks.flow --mode uvicorn --workers 4
+
+Cada fluxo: cadastro → login → novo caso → gerar PIX (Mercado Pago falso,
+benchmarks/fake_mercadopago.py) → retorno do checkout (status) → médico abre e
+aprova o caso. Antes da medição o banco recebe --patients/--doctors/--cases de
+carga, para as listagens e índices trabalharem com um volume realista.
+
+- inprocess: app ASGI no mesmo processo (httpx.ASGITransport), sem rede.
+- uvicorn: sobe o MP falso e o app com --workers N em portas locais. Com vários
+  workers prefira Postgres; SQLite serializa as escritas.
+
+Saída: vazão total e, por rota, contagem, erros, req/s e p50/p95/p99/max em ms.
+Com --output o JSON também é gravado em arquivo (comparar entre commits).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+PASSWORD = 'senha-bench'
+STATUSES = ['pending_payment', 'pending_review', 'approved', 'rejected']
+
+_user_ids = itertools.count(1)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------- Carga inicial ----------
+
+def seed(n_patients, n_doctors, n_cases):
+    """Cria usuários e casos direto no banco (um hash de senha só, inserts em lote)."""
+    from sqlalchemy import select
+    from app.auth import get_password_hash
+    from app.database import SessionLocal, User, Case, init_db
+
+    init_db()
+    hashed = get_password_hash(PASSWORD)
+    with SessionLocal() as session:
+        session.execute(User.__table__.insert(), [
+            {'email': f'doctor{i}@seed', 'hashed_password': hashed, 'full_name': f'Médico {i}',
+             'user_type': 'doctor', 'crm': str(100000 + i), 'crm_uf': 'SP'}
+            for i in range(n_doctors)
+        ])
+        session.execute(User.__table__.insert(), [
+            {'email': f'patient{i}@seed', 'hashed_password': hashed, 'full_name': f'Paciente {i}',
+             'user_type': 'patient'}
+            for i in range(n_patients)
+        ])
+        session.flush()
+        doctor_ids = session.scalars(select(User.id).where(User.user_type == 'doctor')).all()
+        patient_ids = session.scalars(select(User.id).where(User.user_type == 'patient')).all()
+
+        start = datetime.utcnow() - timedelta(days=365)
+        for offset in range(0, n_cases, 1000):
+            rows = []
+            for i in range(offset, min(offset + 1000, n_cases)):
+                status = STATUSES[i % 4]
+                ts = start + timedelta(minutes=i)
+                rows.append({
+                    'patient_id': patient_ids[i % len(patient_ids)],
+                    'doctor_id': doctor_ids[i % len(doctor_ids)] if status in ('approved', 'rejected') else None,
+                    'request_type': 'receita' if i % 3 else 'relatorio',
+                    'status': status,
+                    'payment_status': 'paid' if status != 'pending_payment' else 'pending',
+                    'created_at': ts,
+                    'updated_at': ts,
+                    'version': 1,
+                })
+            session.execute(Case.__table__.insert(), rows)
+        session.commit()
+
+
+# ---------- Fluxo ----------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, name, send, expected):
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except Exception:
+            self.errors[name] += 1
+            raise
+        self.latencies[name].append((time.perf_counter() - start) * 1000)
+        if response.status_code not in expected:
+            self.errors[name] += 1
+            raise RuntimeError(f'{name}: HTTP {response.status_code}')
+        return response
+
+    def report(self, elapsed):
+        routes = {}
+        for name, values in self.latencies.items():
+            routes[name] = {
+                'count': len(values),
+                'errors': self.errors.get(name, 0),
+                'rps': round(len(values) / elapsed, 1),
+                'p50_ms': round(_percentile(values, 50), 2),
+                'p95_ms': round(_percentile(values, 95), 2),
+                'p99_ms': round(_percentile(values, 99), 2),
+                'max_ms': round(max(values), 2),
+            }
+        return routes
+
+
+def _session_cookie(response):
+    # Cookie enviado manualmente: um único cliente (pool de conexões) atende todos os fluxos
+    return {'cookie': response.headers['set-cookie'].split(';', 1)[0]}
+
+
+async def login(client, recorder, email, name):
+    response = await recorder.call(name, lambda: client.post(
+        '/login', data={'email': email, 'password': PASSWORD}
+    ), {303})
+    return _session_cookie(response)
+
+
+async def run_flow(client, recorder, number, doctor_cookies):
+    # email e CPF são únicos no banco
+    unique = f'{os.getpid() % 1000:03d}{next(_user_ids):08d}'
+    email = f'flow{unique}@bench'
+    await recorder.call('POST /register', lambda: client.post('/register', data={
+        'email': email, 'password': PASSWORD, 'full_name': f'Fluxo {number}',
+        'user_type': 'patient', 'cpf': unique, 'phone': '0',
+    }), {303})
+    patient = await login(client, recorder, email, 'POST /login')
+
+    response = await recorder.call('POST /patient/new-case', lambda: client.post(
+        '/patient/new-case', data={'request_type': 'receita' if number % 2 else 'relatorio'}, headers=patient
+    ), {303})
+    case_id = response.headers['location'].rstrip('/').rsplit('/', 1)[1]
+
+    await recorder.call('POST /patient/pay-case/{id}/generate-pix', lambda: client.post(
+        f'/patient/pay-case/{case_id}/generate-pix', headers=patient
+    ), {200})
+    await recorder.call('GET /patient/case/{id}/status', lambda: client.get(
+        f'/patient/case/{case_id}/status', params={'payment_status': 'success'}, headers=patient
+    ), {200})
+
+    doctor = doctor_cookies[number % len(doctor_cookies)]
+    await recorder.call('GET /doctor/review-case/{id}', lambda: client.get(
+        f'/doctor/review-case/{case_id}', headers=doctor
+    ), {200})
+    await recorder.call('POST /doctor/review-case/{id}', lambda: client.post(
+        f'/doctor/review-case/{case_id}', data={'action': 'approve'}, headers=doctor
+    ), {303})
+
+
+async def drive(client, args):
+    recorder = Recorder()
+    doctor_cookies = [
+        await login(client, Recorder(), f'doctor{i}@seed', 'POST /login') for i in range(args.doctors)
+    ]
+    # Aquecimento (conexões, caches, imports tardios) fora da medição
+    for i in range(min(args.warmup, args.flows)):
+        await run_flow(client, Recorder(), -1 - i, doctor_cookies)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failures = []
+
+    async def one(number):
+        async with semaphore:
+            try:
+                await run_flow(client, recorder, number, doctor_cookies)
+            except Exception as e:
+                failures.append(repr(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.flows)))
+    elapsed = time.perf_counter() - start
+    return recorder, elapsed, failures
+
+
+async def run_inprocess(args):
+    import httpx
+    from benchmarks import fake_mercadopago
+    from app.main import app
+    from app.payments import mercadopago_client
+
+    # O app usa o mesmo cliente de produção, só que apontando para o MP falso em processo
+    mercadopago_client.__init__(
+        base_url='http://fake-mp', access_token='fake',
+        transport=httpx.ASGITransport(app=fake_mercadopago.app),
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        return await drive(client, args)
+
+
+def _wait_ready(url, process, timeout=30):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Processo terminou ao subir: {url}')
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Timeout esperando {url}')
+
+
+async def run_uvicorn(args):
+    import httpx
+
+    mp_port, app_port = _free_port(), _free_port()
+    env = dict(os.environ, MERCADOPAGO_API_URL=f'http://127.0.0.1:{mp_port}', MERCADOPAGO_ACCESS_TOKEN='fake')
+    env.pop('MERCADOPAGO_WEBHOOK_SECRET', None)  # o retorno do checkout confirma o pagamento
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'benchmarks.fake_mercadopago:app', '--port', str(mp_port),
+             '--log-level', 'warning'], env=env,
+        ),
+        subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(app_port),
+             '--workers', str(args.workers), '--log-level', 'warning'], env=env,
+        ),
+    ]
+    try:
+        _wait_ready(f'http://127.0.0.1:{mp_port}/docs', processes[0])
+        _wait_ready(f'http://127.0.0.1:{app_port}/login', processes[1])
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{app_port}', limits=limits, timeout=60) as client:
+            return await drive(client, args)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['inprocess', 'uvicorn'], default='inprocess')
+    parser.add_argument('--workers', type=int, default=2, help='workers do uvicorn (modo uvicorn)')
+    parser.add_argument('--flows', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--doctors', type=int, default=10)
+    parser.add_argument('--cases', type=int, default=10000)
+    parser.add_argument('--bcrypt-rounds', type=int, help='sobrescreve BCRYPT_ROUNDS (padrão: o do app)')
+    parser.add_argument('--output', help='também grava o JSON neste arquivo')
+    args = parser.parse_args()
+    args.doctors = max(1, args.doctors)
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(workdir, "bench.db")}')
+    os.environ.setdefault('DOCUMENT_DIR', os.path.join(workdir, 'documents'))
+    # A carga sai toda do mesmo IP: os limites por IP (app/ratelimit.py) barrariam o teste
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    if args.bcrypt_rounds:
+        os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+
+    seed_start = time.perf_counter()
+    seed(args.patients, args.doctors, args.cases)
+    seed_elapsed = time.perf_counter() - seed_start
+
+    runner = run_uvicorn if args.mode == 'uvicorn' else run_inprocess
+    recorder, elapsed, failures = asyncio.run(runner(args))
+
+    result = {
+        'commit': _git_commit(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        'mode': args.mode,
+        'workers': args.workers if args.mode == 'uvicorn' else 1,
+        'database': os.environ['DATABASE_URL'].split('://', 1)[0],
+        'seed': {'patients': args.patients, 'doctors': args.doctors, 'cases': args.cases,
+                 'elapsed_s': round(seed_elapsed, 2)},
+        'flows': args.flows,
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'flows_per_s': round((args.flows - len(failures)) / elapsed, 2),
+        'failed_flows': len(failures),
+        'failures_sample': failures[:5],
+        'routes': recorder.report(elapsed),
+    }
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
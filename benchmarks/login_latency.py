@@ -0,0 +1,80 @@
+"""Latência de rotas não relacionadas enquanto logins (bcrypt) estão em andamento.
+
+Uso:
+    python -m benchmarks.login_latency --logins 40 --probes 200
+
+Sobe o app em processo (ASGI, sem rede) sobre um SQLite temporário, dispara
+logins concorrentes e, ao mesmo tempo, mede a latência de GET /login (rota que
+não faz hash). Com o bcrypt fora do event loop o p99 das sondas deve ficar na
+casa de poucos milissegundos em vez de somar o tempo dos hashes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def _run(args):
+    import httpx
+    from app.main import app
+    from app.database import init_db
+
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        await client.post('/register', data={
+            'email': 'bench@example.com', 'password': 'senha-bench', 'full_name': 'Bench',
+            'user_type': 'patient', 'cpf': '00000000000', 'phone': '0',
+        })
+
+        async def login():
+            await client.post('/login', data={'email': 'bench@example.com', 'password': 'senha-bench'})
+
+        probe_latencies = []
+
+        async def probes():
+            for _ in range(args.probes):
+                start = time.perf_counter()
+                await client.get('/login')
+                probe_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(probes(), *(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'logins': args.logins,
+        'probes': len(probe_latencies),
+        'elapsed_s': round(elapsed, 3),
+        'probe_p50_ms': round(_percentile(probe_latencies, 50), 2),
+        'probe_p99_ms': round(_percentile(probe_latencies, 99), 2),
+        'probe_max_ms': round(max(probe_latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--probes', type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{db_path}')
+    # A carga sai toda do mesmo IP: os limites por IP (app/ratelimit.py) barrariam o teste
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Vazão da geração de documentos (render + gravação + assinatura), em PDFs/s.
+
+Uso:
+    python -m benchmarks.pdf_throughput --documents 500 --processes 1 2 4
+
+Usa a mesma função `render_and_sign` e o mesmo tipo de pool (ProcessPoolExecutor
+com a chave carregada no initializer) que o DocumentWorker, sem banco de dados.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _fields(i):
+    return {
+        'case_id': i,
+        'request_type': 'receita',
+        'title': 'Renovação de Receita',
+        'patient_name': f'Paciente {i}',
+        'patient_cpf': '000.000.000-00',
+        'doctor_name': 'Dra. Benchmark',
+        'doctor_crm': '123456',
+        'doctor_crm_uf': 'SP',
+        'text': 'Texto de teste. ' * 40,
+        'date': '17/10/2026',
+    }
+
+
+def run(documents, processes, output_dir, key_pem):
+    from app.documents import render_and_sign, _init_render_process
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_render_process, initargs=(key_pem,)) as pool:
+        # Aquece o pool (fork + import) fora da medição
+        list(pool.map(render_and_sign, [_fields(0)] * processes, [os.path.join(output_dir, 'warm.pdf')] * processes))
+        start = time.perf_counter()
+        futures = [
+            pool.submit(render_and_sign, _fields(i), os.path.join(output_dir, f'case-{i}.pdf'))
+            for i in range(documents)
+        ]
+        sizes = [f.result()['size'] for f in futures]
+        elapsed = time.perf_counter() - start
+    return {
+        'processes': processes,
+        'documents': documents,
+        'elapsed_s': round(elapsed, 3),
+        'pdfs_per_s': round(documents / elapsed, 1),
+        'pdfs_per_s_per_process': round(documents / elapsed / processes, 1),
+        'avg_pdf_bytes': sum(sizes) // len(sizes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=500)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(output_dir, "bench.db")}')
+    os.environ.setdefault('DOCUMENT_DIR', output_dir)
+    from app.documents import load_signing_key_pem
+
+    key_pem = load_signing_key_pem()
+    results = [run(args.documents, n, output_dir, key_pem) for n in args.processes]
+    print(json.dumps({'cpu_count': os.cpu_count(), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Regressão de planos de consulta das listagens de casos.
+
+Uso:
+    python -m benchmarks.query_plans --cases 5000
+    DATABASE_URL=postgresql://... python -m benchmarks.query_plans
+
+Popula um banco (SQLite temporário por padrão) com usuários e casos, chama as
+rotas reais de listagem (dashboards e API JSON), captura cada SELECT em `cases`
+(e `cases_archive`) e roda EXPLAIN sobre ele. Sai com código 1 se alguma
+consulta fizer varredura completa da tabela ou ordenar sem índice.
+
+No SQLite a mesma checagem roda na suíte de testes (tests/test_query_plans.py);
+este script fica para conferir os planos num Postgres de verdade.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# SQLite: "SCAN cases" sem índice ou ordenação em B-tree temporária
+# Postgres: "Seq Scan on cases"
+FULL_SCAN_PATTERNS = [
+    re.compile(r'^SCAN (cases|cases_archive)\b(?! USING)'),
+    re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+    re.compile(r'Seq Scan on cases'),
+]
+CASES_SELECT = re.compile(r'\bFROM (cases|cases_archive)\b')
+
+ROUTES = [
+    ('patient', '/patient/dashboard'),
+    ('patient', '/patient/dashboard?status=approved'),
+    ('patient', '/api/patient/cases?limit=50'),
+    ('doctor', '/doctor/dashboard'),
+    ('doctor', '/doctor/dashboard?request_type=receita&status=approved'),
+    ('doctor', '/api/doctor/cases?scope=pending'),
+    ('doctor', '/api/doctor/cases?scope=reviewed'),
+]
+
+
+def seed(session, n_cases, n_patients):
+    from app.auth import get_password_hash
+    from app.database import User, Case
+
+    hashed = get_password_hash('senha')
+    doctor = User(email='doctor@bench', hashed_password=hashed, full_name='Médico', user_type='doctor')
+    patients = [
+        User(email=f'p{i}@bench', hashed_password=hashed, full_name=f'Paciente {i}', user_type='patient')
+        for i in range(n_patients)
+    ]
+    session.add(doctor)
+    session.add_all(patients)
+    session.flush()
+
+    statuses = ['pending_payment', 'pending_review', 'approved', 'rejected']
+    start = datetime.utcnow() - timedelta(days=365)
+    rows = []
+    for i in range(n_cases):
+        status = statuses[i % 4]
+        ts = start + timedelta(minutes=i)
+        rows.append({
+            'patient_id': patients[i % n_patients].id,
+            'doctor_id': doctor.id if status in ('approved', 'rejected') else None,
+            'request_type': 'receita' if i % 3 else 'relatorio',
+            'status': status,
+            'created_at': ts,
+            'updated_at': ts,
+        })
+    session.execute(Case.__table__.insert(), rows)
+    session.commit()
+    return doctor.email, patients[0].email
+
+
+def explain(connection, statement, parameters):
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).fetchall()
+    return [row[0] for row in rows]
+
+
+def is_cases_select(statement: str) -> bool:
+    return statement.lstrip().upper().startswith('SELECT') and bool(CASES_SELECT.search(statement))
+
+
+def full_scans(plan):
+    return [line for line in plan if any(p.search(line) for p in FULL_SCAN_PATTERNS)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', type=int, default=5000)
+    parser.add_argument('--patients', type=int, default=50)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'plans.db')
+    # Captura pelo engine síncrono: os parâmetros ficam no formato do driver usado no EXPLAIN
+    os.environ['DB_ASYNC'] = 'false'
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.auth import create_access_token
+    from app.database import Base, SessionLocal, init_engines
+    from app.main import app
+
+    engine = init_engines()
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as session:
+        doctor_email, patient_email = seed(session, args.cases, args.patients)
+    with engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if is_cases_select(statement):
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    client = TestClient(app)
+    tokens = {
+        'doctor': create_access_token({'sub': doctor_email}),
+        'patient': create_access_token({'sub': patient_email}),
+    }
+
+    report = []
+    failed = False
+    for role, url in ROUTES:
+        captured.clear()
+        client.cookies.set('access_token', f'Bearer {tokens[role]}')
+        response = client.get(url)
+        if response.status_code != 200:
+            raise SystemExit(f'{url}: HTTP {response.status_code}')
+        for statement, parameters in list(captured):
+            with engine.connect() as connection:
+                plan = explain(connection, statement, parameters)
+            bad = full_scans(plan)
+            failed = failed or bool(bad)
+            report.append({'route': url, 'plan': plan, 'full_scan': bool(bad)})
+    event.remove(engine, 'before_cursor_execute', capture)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if failed:
+        print('FALHA: consulta de listagem sem índice', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
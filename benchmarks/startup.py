@@ -0,0 +1,174 @@
+"""Tempo de subida da aplicação: import de app.main e tempo até a primeira resposta.
+
+Uso:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --max-import-ms 800 --max-first-response-ms 2000
+    DATABASE_URL=postgresql://... python -m benchmarks.startup --output startup.json
+
+- import: `import app.main` num interpretador novo (wall clock dentro do processo),
+  repetido --runs vezes; a primeira rodada também roda com `-X importtime` e lista
+  os pacotes que mais pesam.
+- primeira resposta: sobe o uvicorn e mede, a partir do spawn, o primeiro 200 em
+  GET /login (inclui o lifespan: engines e aquecimento do pool) e a primeira
+  resposta que consulta o banco (POST /login com usuário inexistente).
+
+Com --max-import-ms / --max-first-response-ms o processo sai com código 1 se a
+mediana passar do limite (para rodar no CI e pegar regressões de cold start).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.flow import _free_port, _git_commit
+
+IMPORT_SNIPPET = (
+    'import time; start = time.perf_counter(); import app.main; '
+    'print(round((time.perf_counter() - start) * 1000, 2))'
+)
+
+
+def _summary(values):
+    return {
+        'median_ms': round(statistics.median(values), 2),
+        'min_ms': round(min(values), 2),
+        'max_ms': round(max(values), 2),
+        'runs': [round(v, 2) for v in values],
+    }
+
+
+# ---------- Import ----------
+
+def _parse_importtime(stderr: str, top: int):
+    """Módulos de primeiro nível (importados direto pelo app) com o tempo acumulado."""
+    heaviest = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth <= 1 and name != 'app.main':
+            heaviest[name] = max(heaviest.get(name, 0), int(cumulative) / 1000)
+    ranked = sorted(heaviest.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{'module': name, 'ms': round(ms, 1)} for name, ms in ranked]
+
+
+def measure_import(runs: int, env: dict):
+    timings = []
+    profile = None
+    for i in range(runs):
+        command = [sys.executable]
+        if i == 0:
+            command += ['-X', 'importtime']
+        completed = subprocess.run(
+            command + ['-c', IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True
+        )
+        if i == 0:
+            profile = _parse_importtime(completed.stderr, top=10)
+        else:
+            # -X importtime infla o tempo; a primeira rodada fica fora da mediana
+            timings.append(float(completed.stdout.strip().splitlines()[-1]))
+    return timings, profile
+
+
+# ---------- Primeira resposta ----------
+
+def _poll(url, process, data=None, timeout=30.0):
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'uvicorn saiu com código {process.returncode}')
+        try:
+            if data is None:
+                response = httpx.get(url, timeout=1.0)
+            else:
+                response = httpx.post(url, data=data, timeout=5.0, follow_redirects=False)
+            if response.status_code < 400:
+                return response
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f'Sem resposta de {url} em {timeout}s')
+
+
+def measure_first_response(env: dict):
+    port = _free_port()
+    base = f'http://127.0.0.1:{port}'
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+        env=env,
+    )
+    try:
+        _poll(f'{base}/login', process)
+        first = (time.perf_counter() - start) * 1000
+        _poll(f'{base}/login', process, data={'email': 'ninguem@startup', 'password': 'x'})
+        first_db = (time.perf_counter() - start) * 1000
+    finally:
+        process.terminate()
+        process.wait()
+    return first, first_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, help='falha se a mediana do import passar disso')
+    parser.add_argument('--max-first-response-ms', type=float, help='falha se a mediana da 1ª resposta passar disso')
+    parser.add_argument('--output', help='também grava o JSON neste arquivo')
+    args = parser.parse_args()
+    args.runs = max(1, args.runs)
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(workdir, "startup.db")}')
+    os.environ.setdefault('DOCUMENT_DIR', os.path.join(workdir, 'documents'))
+    env = dict(os.environ)
+
+    # Esquema criado aqui, fora do processo medido
+    subprocess.run([sys.executable, '-c', 'from app.database import init_db; init_db()'], env=env, check=True)
+
+    import_timings, profile = measure_import(args.runs + 1, env)
+    first, first_db = [], []
+    for _ in range(args.runs):
+        login_ms, db_ms = measure_first_response(env)
+        first.append(login_ms)
+        first_db.append(db_ms)
+
+    result = {
+        'commit': _git_commit(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'database': os.environ['DATABASE_URL'].split('://', 1)[0],
+        'import_app_main': _summary(import_timings),
+        'import_heaviest': profile,
+        'first_response': _summary(first),
+        'first_db_response': _summary(first_db),
+    }
+    failures = []
+    if args.max_import_ms and result['import_app_main']['median_ms'] > args.max_import_ms:
+        failures.append(f"import {result['import_app_main']['median_ms']} ms > {args.max_import_ms} ms")
+    if args.max_first_response_ms and result['first_response']['median_ms'] > args.max_first_response_ms:
+        failures.append(
+            f"primeira resposta {result['first_response']['median_ms']} ms > {args.max_first_response_ms} ms"
+        )
+    result['failures'] = failures
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Esquema inicial (users, cases, documents), como criado pelo /setup-db.
+
+Bancos que já existem devem ser marcados com `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=True),
+        sa.Column('full_name', sa.String(), nullable=True),
+        sa.Column('user_type', sa.String(), nullable=True),
+        sa.Column('cpf', sa.String(), nullable=True),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('crm', sa.String(), nullable=True),
+        sa.Column('crm_uf', sa.String(), nullable=True),
+        sa.UniqueConstraint('cpf'),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'cases',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('patient_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('request_type', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('payment_status', sa.String(), nullable=True),
+        sa.Column('payment_id', sa.String(), nullable=True),
+        sa.Column('rejection_reason', sa.Text(), nullable=True),
+    )
+    op.create_index('ix_cases_id', 'cases', ['id'])
+
+    op.create_table(
+        'documents',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('case_id', sa.Integer(), sa.ForeignKey('cases.id'), nullable=True),
+        sa.Column('file_path', sa.String(), nullable=True),
+        sa.Column('signed_by_doctor', sa.Boolean(), nullable=True),
+        sa.Column('signed_at', sa.DateTime(), nullable=True),
+        sa.Column('generated_text', sa.Text(), nullable=True),
+    )
+    op.create_index('ix_documents_id', 'documents', ['id'])
+
+
+def downgrade():
+    op.drop_table('documents')
+    op.drop_table('cases')
+    op.drop_table('users')
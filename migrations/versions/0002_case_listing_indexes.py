@@ -0,0 +1,39 @@
+"""Índices compostos das listagens de casos.
+
+Cobrem filtro + ordenação + id (keyset) das três consultas quentes:
+fila pending_review por created_at, casos do paciente por created_at e
+casos revisados pelo médico por updated_at.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_cases_status_created_at', ['status', 'created_at', 'id']),
+    ('ix_cases_patient_created_at', ['patient_id', 'created_at', 'id']),
+    ('ix_cases_doctor_updated_at', ['doctor_id', 'updated_at', 'id']),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # CONCURRENTLY não trava escritas em cases, mas não roda dentro de transação
+        with op.get_context().autocommit_block():
+            for name, columns in INDEXES:
+                op.create_index(name, 'cases', columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, columns in INDEXES:
+            op.create_index(name, 'cases', columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='cases')
@@ -0,0 +1,30 @@
+"""Reserva (claim/lease) de casos pelos médicos e coluna de versão.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cases') as batch:
+        batch.add_column(sa.Column('claimed_by_id', sa.Integer(), nullable=True))
+        batch.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+        batch.create_foreign_key('fk_cases_claimed_by_id_users', 'users', ['claimed_by_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('cases') as batch:
+        batch.drop_constraint('fk_cases_claimed_by_id_users', type_='foreignkey')
+        batch.drop_column('version')
+        batch.drop_column('lease_expires_at')
+        batch.drop_column('claimed_by_id')
@@ -0,0 +1,26 @@
+"""Checkout (init_point) e validade da preferência do MP guardados no caso.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cases') as batch:
+        batch.add_column(sa.Column('payment_init_point', sa.String(), nullable=True))
+        batch.add_column(sa.Column('payment_expires_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('cases') as batch:
+        batch.drop_column('payment_expires_at')
+        batch.drop_column('payment_init_point')
@@ -0,0 +1,37 @@
+"""Fila durável de notificações (webhooks) do Mercado Pago.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'payment_notifications',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('topic', sa.String(), nullable=True),
+        sa.Column('resource_id', sa.String(), nullable=True),
+        sa.Column('request_id', sa.String(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_payment_notifications_id', 'payment_notifications', ['id'])
+    op.create_index('ix_payment_notifications_status_id', 'payment_notifications', ['status', 'id'])
+
+
+def downgrade():
+    op.drop_table('payment_notifications')
@@ -0,0 +1,38 @@
+"""Acompanhamento da geração de documentos (fila de jobs) e assinatura.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('documents') as batch:
+        batch.add_column(sa.Column('signature', sa.Text(), nullable=True))
+        batch.add_column(sa.Column('job_status', sa.String(), nullable=True))
+        batch.add_column(sa.Column('job_error', sa.Text(), nullable=True))
+        batch.add_column(sa.Column('attempts', sa.Integer(), nullable=True))
+        batch.add_column(sa.Column('queued_at', sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column('locked_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_documents_case_id', 'documents', ['case_id'])
+    op.create_index('ix_documents_job_status_id', 'documents', ['job_status', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_documents_job_status_id', table_name='documents')
+    op.drop_index('ix_documents_case_id', table_name='documents')
+    with op.batch_alter_table('documents') as batch:
+        batch.drop_column('locked_at')
+        batch.drop_column('queued_at')
+        batch.drop_column('attempts')
+        batch.drop_column('job_error')
+        batch.drop_column('job_status')
+        batch.drop_column('signature')
@@ -0,0 +1,28 @@
+"""Cache (endereçado por conteúdo) dos rascunhos gerados pela IA.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'draft_cache',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('model', sa.String(), nullable=True),
+        sa.Column('text', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('draft_cache')
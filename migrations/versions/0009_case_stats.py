@@ -0,0 +1,61 @@
+"""Agregados incrementais dos casos (app/stats.py) e datas de pagamento/revisão.
+
+Depois de aplicar, preencha os agregados com o histórico:
+`python -m app.stats reconcile --all`.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cases') as batch:
+        batch.add_column(sa.Column('paid_at', sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column('reviewed_at', sa.DateTime(), nullable=True))
+
+    op.create_table(
+        'case_status_counts',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('status', sa.String(), primary_key=True),
+        sa.Column('request_type', sa.String(), primary_key=True),
+        sa.Column('doctor_id', sa.Integer(), primary_key=True),
+        sa.Column('cases', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'case_daily_stats',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('request_type', sa.String(), primary_key=True),
+        sa.Column('doctor_id', sa.Integer(), primary_key=True),
+        sa.Column('created', sa.Integer(), nullable=False),
+        sa.Column('paid', sa.Integer(), nullable=False),
+        sa.Column('revenue_cents', sa.Integer(), nullable=False),
+        sa.Column('reviewed', sa.Integer(), nullable=False),
+        sa.Column('approved', sa.Integer(), nullable=False),
+        sa.Column('rejected', sa.Integer(), nullable=False),
+        sa.Column('review_timed', sa.Integer(), nullable=False),
+        sa.Column('review_seconds', sa.Float(), nullable=False),
+    )
+    op.create_table(
+        'case_review_time_buckets',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('bucket', sa.Integer(), primary_key=True),
+        sa.Column('cases', sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('case_review_time_buckets')
+    op.drop_table('case_daily_stats')
+    op.drop_table('case_status_counts')
+    with op.batch_alter_table('cases') as batch:
+        batch.drop_column('reviewed_at')
+        batch.drop_column('paid_at')
@@ -0,0 +1,66 @@
+"""Tabelas de arquivo (hot/cold) dos casos encerrados e seus documentos (app/archive.py).
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'cases_archive',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('patient_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('doctor_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('request_type', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('payment_status', sa.String(), nullable=True),
+        sa.Column('payment_id', sa.String(), nullable=True),
+        sa.Column('payment_init_point', sa.String(), nullable=True),
+        sa.Column('payment_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('rejection_reason', sa.Text(), nullable=True),
+        sa.Column('claimed_by_id', sa.Integer(), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('paid_at', sa.DateTime(), nullable=True),
+        sa.Column('reviewed_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_cases_archive_patient_created_at', 'cases_archive', ['patient_id', 'created_at', 'id'])
+    op.create_index('ix_cases_archive_doctor_updated_at', 'cases_archive', ['doctor_id', 'updated_at', 'id'])
+
+    op.create_table(
+        'documents_archive',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('case_id', sa.Integer(), sa.ForeignKey('cases_archive.id'), nullable=True),
+        sa.Column('file_path', sa.String(), nullable=True),
+        sa.Column('signed_by_doctor', sa.Boolean(), nullable=True),
+        sa.Column('signed_at', sa.DateTime(), nullable=True),
+        sa.Column('generated_text', sa.Text(), nullable=True),
+        sa.Column('signature', sa.Text(), nullable=True),
+        sa.Column('job_status', sa.String(), nullable=True),
+        sa.Column('job_error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('queued_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_documents_archive_case_id', 'documents_archive', ['case_id'])
+
+
+def downgrade():
+    op.drop_index('ix_documents_archive_case_id', table_name='documents_archive')
+    op.drop_table('documents_archive')
+    op.drop_index('ix_cases_archive_doctor_updated_at', table_name='cases_archive')
+    op.drop_index('ix_cases_archive_patient_created_at', table_name='cases_archive')
+    op.drop_table('cases_archive')
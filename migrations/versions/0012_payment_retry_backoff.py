@@ -0,0 +1,22 @@
+"""Espera entre as novas tentativas das notificações de pagamento.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('payment_notifications', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('payment_notifications', 'next_attempt_at')
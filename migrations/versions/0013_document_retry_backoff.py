@@ -0,0 +1,24 @@
+"""Espera entre as novas tentativas dos jobs de documento (também no arquivo).
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('documents', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+    op.add_column('documents_archive', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('documents_archive', 'next_attempt_at')
+    op.drop_column('documents', 'next_attempt_at')
@@ -0,0 +1,75 @@
+"""Ambiente dos testes: SQLite descartável, sessão síncrona e sem workers de fundo.
+
+O app lê a configuração no import, então as variáveis são definidas aqui,
+antes de qualquer `import app...`.
+"""
+import os
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix='app-medico-tests-')
+
+os.environ.update({
+    'DATABASE_URL': f'sqlite:///{TEST_DIR}/test.db',
+    'DB_ASYNC': 'false',
+    'DB_WARMUP_CONNECTIONS': '0',
+    'BCRYPT_ROUNDS': '4',
+    'RATE_LIMIT_ENABLED': 'false',
+    'MERCADOPAGO_WEBHOOK_SECRET': '',
+    'DOCUMENT_DIR': os.path.join(TEST_DIR, 'documents'),
+    'DOCUMENT_WORKERS': '0',
+    'DRAFT_PREFETCH_BATCH': '0',
+    'STATS_RECONCILE_INTERVAL': '0',
+    'ARCHIVE_INTERVAL': '0',
+    # Avisos com os provedores falsos (escolhidos explicitamente); os testes drenam a fila à mão
+    'NOTIFICATION_CHANNELS': 'email,sms',
+    'EMAIL_BACKEND': 'fake',
+    'SMS_BACKEND': 'fake',
+    'NOTIFICATION_WORKERS': '0',
+    'MP_RETRY_BACKOFF': '0',
+})
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.auth import token_cache, user_cache  # noqa: E402
+from app.database import Base, init_db, init_engines  # noqa: E402
+from app.main import app  # noqa: E402
+from app.templating import fragment_cache  # noqa: E402
+
+
+def reset_db():
+    """Banco vazio e caches em memória limpos."""
+    Base.metadata.drop_all(bind=init_engines())
+    init_db()
+    for cache in (token_cache, user_cache, fragment_cache):
+        cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_db():
+    reset_db()
+    yield
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def register_and_login(client, email: str, user_type: str = 'patient', **extra):
+    """Cadastra e autentica `client` (cookie de sessão) como o usuário `email`."""
+    n = abs(hash(email)) % 10 ** 11
+    form = dict(email=email, password='senha', full_name=email.split('@')[0].title(),
+                user_type=user_type, cpf=str(n), phone=f'+55{n}')
+    if user_type == 'doctor':
+        form.update(crm=str(n % 100000), crm_uf='SP')
+    form.update(extra)
+    assert client.post('/register', data=form, follow_redirects=False).status_code == 303
+    client.cookies.clear()
+    assert client.post('/login', data=dict(email=email, password='senha'), follow_redirects=False).status_code == 303
@@ -0,0 +1,69 @@
+"""Arquivo (hot/cold): listagens intercalam os casos arquivados na ordem certa e as buscas caem no arquivo."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.archive import archive_closed_cases, find_case, latest_document
+from app.database import Case, CaseArchive, Document, DocumentArchive, User, open_session
+from app.main import patient_cases_page
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed(cases=12):
+    """Casos de hora em hora; os pares encerrados (arquivam), os ímpares aguardando pagamento (ficam)."""
+    base = datetime.utcnow() - timedelta(days=1)
+    async with open_session() as db:
+        patient = User(email='ana@x.com', full_name='Ana Souza', user_type='patient')
+        db.add(patient)
+        await db.flush()
+        for i in range(1, cases + 1):
+            created_at = base + timedelta(hours=i)
+            db.add(Case(
+                patient_id=patient.id, request_type='receita', created_at=created_at,
+                updated_at=created_at + timedelta(minutes=1),
+                status='approved' if i % 2 == 0 else 'pending_payment',
+            ))
+        await db.flush()
+        db.add(Document(case_id=2, job_status='done', file_path='2.pdf'))
+        await db.commit()
+        return User(id=patient.id)  # a sessão fecha; as listagens só usam o id
+
+
+async def list_all(patient, limit):
+    ids, cursor = [], None
+    async with open_session() as db:
+        while True:
+            page = await patient_cases_page(db, patient, cursor, limit)
+            ids += [case.id for case in page.items]
+            cursor = page.next_cursor
+            if cursor is None:
+                return ids
+
+
+async def test_archived_cases_keep_their_place_across_pages():
+    patient = await seed()
+    # Corte bem mais novo que o horizonte (como se ARCHIVE_AFTER_DAYS tivesse aumentado depois)
+    assert await archive_closed_cases(cutoff=datetime.utcnow(), batch_size=4) == 6
+
+    async with open_session() as db:
+        assert await db.scalar(select(func.count()).select_from(CaseArchive)) == 6
+        assert await db.scalar(select(func.count()).select_from(Case)) == 6
+    for limit in (1, 4, 5, 20):
+        assert await list_all(patient, limit) == list(range(12, 0, -1))
+
+
+async def test_find_case_and_latest_document_fall_back_to_the_archive():
+    patient = await seed(cases=3)
+    await archive_closed_cases(cutoff=datetime.utcnow())
+
+    async with open_session() as db:
+        archived = await find_case(db, id=2, patient_id=patient.id)
+        assert isinstance(archived, CaseArchive) and archived.status == 'approved'
+        assert isinstance(await find_case(db, id=3), Case)
+        assert await find_case(db, id=2, patient_id=patient.id + 1) is None
+
+        document = await latest_document(db, archived)
+        assert isinstance(document, DocumentArchive) and document.file_path == '2.pdf'
+        assert await db.scalar(select(func.count()).select_from(Document)) == 0
@@ -0,0 +1,38 @@
+"""Exportação em lote: CSV sem fórmulas vindas de campos preenchidos pelo paciente."""
+import csv
+import io
+import json
+
+import pytest
+
+from app.bulk import EXPORTS, export_rows
+from app.database import User, open_session
+
+pytestmark = pytest.mark.anyio
+
+
+async def export(name, fmt):
+    columns, query = EXPORTS[name]
+    return b''.join([chunk async for chunk in export_rows(query(), columns, fmt)]).decode()
+
+
+async def test_csv_export_neutralizes_formulas():
+    async with open_session() as db:
+        db.add_all([
+            User(email='ana@x.com', full_name='=HYPERLINK("http://x","clique")', user_type='patient',
+                 phone='+5511999990000', cpf='-1+1'),
+            User(email='rui@x.com', full_name='@SUM(A1)', user_type='patient'),
+            User(email='bia@x.com', full_name='Bia', user_type='patient', cpf='123'),
+        ])
+        await db.commit()
+
+    rows = list(csv.DictReader(io.StringIO(await export('users', 'csv'))))
+    assert [(r['full_name'], r['phone'], r['cpf']) for r in rows] == [
+        ('\'=HYPERLINK("http://x","clique")', "'+5511999990000", "'-1+1"),
+        ("'@SUM(A1)", '', ''),
+        ('Bia', '', '123'),
+    ]
+
+    # JSONL não passa por planilha: sai como está
+    first = json.loads((await export('users', 'jsonl')).splitlines()[0])
+    assert first['full_name'] == '=HYPERLINK("http://x","clique")'
@@ -0,0 +1,36 @@
+"""Fila de documentos: um job sem caso falha na hora, sem travar o resto do lote em 'rendering'."""
+import pytest
+from sqlalchemy import select
+
+from app.database import Case, Document, User, open_session
+from app.documents import DocumentWorker
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_document_of_missing_case_fails_without_blocking_the_batch():
+    async with open_session() as db:
+        patient = User(email='ana@x.com', full_name='Ana Souza', user_type='patient', cpf='123')
+        doctor = User(email='dr@x.com', full_name='Dr. Rui', user_type='doctor', crm='1234', crm_uf='SP')
+        db.add_all([patient, doctor])
+        await db.flush()
+        case = Case(patient_id=patient.id, doctor_id=doctor.id, request_type='receita', status='approved')
+        db.add(case)
+        await db.flush()
+        db.add_all([
+            Document(case_id=999, job_status='queued'),  # caso apagado por um reset
+            Document(case_id=case.id, job_status='queued'),
+        ])
+        await db.commit()
+
+    worker = DocumentWorker(processes=2)
+    try:
+        assert await worker.drain() == 2
+    finally:
+        await worker.stop()
+
+    async with open_session() as db:
+        documents = (await db.scalars(select(Document).order_by(Document.id))).all()
+    assert [(d.job_status, d.attempts) for d in documents] == [('failed', 1), ('done', 0)]
+    assert 'não encontrado' in documents[0].job_error
+    assert documents[1].signature
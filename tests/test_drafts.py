@@ -0,0 +1,134 @@
+"""Rascunhos: cache (memória e draft_cache) evita chamar o modelo de novo; a pré-geração grava o Document 'draft'."""
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.database import Case, Document, DraftCache, User, open_session
+from app.archive import latest_document
+from app.drafts import (
+    DraftPrefetcher, DraftService, StubDraftModel, build_prompt, cases_without_draft, prefetch_drafts,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingModel(StubDraftModel):
+    def __init__(self):
+        self.prompts = []
+
+    async def generate(self, prompts, limiter=None):
+        self.prompts.extend(prompts)
+        return await super().generate(prompts, limiter)
+
+
+async def test_concurrent_and_repeated_prompts_hit_the_model_once():
+    model = CountingModel()
+    service = DraftService(model, batch_wait_ms=5)
+    prompt = build_prompt('receita', 'Ana')
+
+    first, second = await asyncio.gather(service.generate(prompt), service.generate(prompt))
+    assert first == second
+    assert await service.generate(prompt) == first  # LRU
+    assert model.prompts == [prompt]
+    assert service.cache.stats()['hits'] >= 1
+
+
+async def test_draft_cache_table_is_shared_between_services():
+    prompt = build_prompt('relatorio', 'Ana')
+    writer = DraftService(CountingModel())
+    text = await writer.generate(prompt)
+    async with open_session() as db:
+        await writer.store(db, {writer.key_for(prompt): text})
+        await db.commit()
+        assert await db.scalar(select(DraftCache.text)) == text
+
+    # Outro processo (LRU vazio): acha na tabela, sem chamar o modelo
+    model = CountingModel()
+    reader = DraftService(model)
+    async with open_session() as db:
+        assert await reader.lookup(db, [reader.key_for(prompt)]) == {reader.key_for(prompt): text}
+    assert model.prompts == []
+
+
+async def test_prefetch_creates_one_draft_document_per_paid_case():
+    async with open_session() as db:
+        patient = User(email='ana@x.com', full_name='Ana Souza', user_type='patient')
+        db.add(patient)
+        await db.flush()
+        db.add_all([
+            Case(patient_id=patient.id, request_type='receita', status='pending_review'),
+            Case(patient_id=patient.id, request_type='relatorio', status='pending_review'),
+            Case(patient_id=patient.id, request_type='receita', status='pending_payment'),  # ainda não pago
+        ])
+        await db.commit()
+
+    prefetcher = DraftPrefetcher(batch_size=10)
+    assert await prefetcher.drain() == 2
+    assert await prefetcher.drain() == 0  # caso com rascunho não é refeito
+
+    async with open_session() as db:
+        documents = (await db.scalars(select(Document).order_by(Document.case_id))).all()
+    assert [(d.case_id, d.job_status) for d in documents] == [(1, 'draft'), (2, 'draft')]
+    assert all(d.generated_text for d in documents)
+    assert documents[0].generated_text != documents[1].generated_text  # um texto por tipo de pedido
+
+
+class FakeCompletions:
+    """Imita `client.chat.completions` e registra quantas chamadas ficam abertas ao mesmo tempo."""
+
+    def __init__(self):
+        self.running = self.peak = 0
+
+    async def create(self, messages, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        message = type('Message', (), {'content': messages[-1]['content']})
+        return type('Response', (), {'choices': [type('Choice', (), {'message': message})]})
+
+
+async def test_concurrency_limits_model_calls_not_batches():
+    from app.drafts import OpenAIDraftModel
+
+    completions = FakeCompletions()
+    model = OpenAIDraftModel('fake')
+    model._client = type('Client', (), {'chat': type('Chat', (), {'completions': completions})})
+    service = DraftService(model, concurrency=2, batch_size=4, batch_wait_ms=1)
+
+    prompts = [build_prompt('receita', f'Paciente {i}') for i in range(16)]
+    assert await asyncio.gather(*(service.generate(prompt) for prompt in prompts)) == prompts
+    assert completions.peak == 2  # 4 lotes de 4 prompts, mas nunca mais de 2 chamadas abertas
+
+
+async def test_prefetch_does_not_draft_a_case_approved_meanwhile():
+    async with open_session() as db:
+        patient = User(email='ana@x.com', full_name='Ana Souza', user_type='patient')
+        db.add(patient)
+        await db.flush()
+        db.add_all([
+            Case(patient_id=patient.id, request_type='receita', status='pending_review'),
+            Case(patient_id=patient.id, request_type='relatorio', status='pending_review'),
+        ])
+        await db.commit()
+
+    async with open_session() as db:
+        cases = await cases_without_draft(db, 10)
+        for case in cases:
+            case.patient  # carregado antes de a outra sessão mexer nos casos
+
+        # Enquanto o modelo trabalha, o médico aprova o caso 1 e outro processo grava o rascunho do 2
+        async with open_session() as other:
+            approved = await other.scalar(select(Case).where(Case.id == 1))
+            approved.status = 'approved'
+            other.add(Document(case_id=1, job_status='queued'))
+            other.add(Document(case_id=2, job_status='draft', generated_text='texto'))
+            await other.commit()
+
+        assert await prefetch_drafts(db, cases, DraftService(CountingModel())) == 0
+
+    async with open_session() as db:
+        documents = (await db.scalars(select(Document).order_by(Document.id))).all()
+        assert [(d.case_id, d.job_status) for d in documents] == [(1, 'queued'), (2, 'draft')]
+        assert (await latest_document(db, await db.get(Case, 1))).job_status == 'queued'
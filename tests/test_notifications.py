@@ -0,0 +1,131 @@
+"""Outbox de avisos: gravado na transação do caso, deduplicado, com backoff e 'skipped' sem contato."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.database import Case, Notification, User, open_session
+from app.notifications import (
+    FakeSender, NotificationDispatcher, PermanentDeliveryError, enqueue_case_notification,
+)
+
+from .conftest import register_and_login
+
+pytestmark = pytest.mark.anyio
+
+
+class FlakySender(FakeSender):
+    """Levanta `errors` na ordem, um por envio; depois entrega normalmente."""
+
+    def __init__(self, channel, errors):
+        super().__init__(channel)
+        self.errors = list(errors)
+
+    async def send(self, message):
+        if self.errors:
+            raise self.errors.pop(0)
+        await super().send(message)
+
+
+def dispatcher(email=None, sms=None, **kwargs):
+    senders = {'email': email or FakeSender('email'), 'sms': sms or FakeSender('sms')}
+    return NotificationDispatcher(senders, workers=0, **kwargs)
+
+
+async def notifications():
+    async with open_session() as db:
+        return list((await db.scalars(select(Notification).order_by(Notification.id))).all())
+
+
+async def seed_case(phone='+5511999990000'):
+    async with open_session() as db:
+        patient = User(email='ana@x.com', full_name='Ana Souza', user_type='patient', phone=phone)
+        db.add(patient)
+        await db.flush()
+        case = Case(patient_id=patient.id, request_type='receita', status='pending_review')
+        db.add(case)
+        await db.commit()
+        return case.id, patient.id
+
+
+async def test_payment_writes_one_notification_per_channel_once(client):
+    register_and_login(client, 'ana@x.com')
+    client.post('/patient/new-case', data=dict(request_type='receita'))
+    for _ in range(2):  # recarregar o retorno do checkout não repete a transição
+        assert client.get('/patient/case/1/status?payment_status=success').status_code == 200
+
+    rows = await notifications()
+    assert [(n.dedupe_key, n.status) for n in rows] == [
+        ('case.paid:1:email', 'pending'), ('case.paid:1:sms', 'pending'),
+    ]
+
+
+async def test_enqueue_is_part_of_the_transaction_and_deduplicated():
+    case_id, patient_id = await seed_case()
+    async with open_session() as db:
+        await enqueue_case_notification(db, 'case.approved', case_id, patient_id, request_type='receita')
+        await db.rollback()
+    assert await notifications() == []
+
+    for _ in range(2):
+        async with open_session() as db:
+            await enqueue_case_notification(db, 'case.approved', case_id, patient_id, request_type='receita')
+            await db.commit()
+    assert len(await notifications()) == 2
+
+
+async def test_dispatch_sends_and_skips_channels_without_contact():
+    case_id, patient_id = await seed_case(phone=None)
+    async with open_session() as db:
+        await enqueue_case_notification(db, 'case.rejected', case_id, patient_id,
+                                        request_type='receita', rejection_reason='Falta exame')
+        await db.commit()
+
+    sender = dispatcher()
+    assert await sender.drain() == 2
+    assert {n.channel: n.status for n in await notifications()} == {'email': 'sent', 'sms': 'skipped'}
+    [message] = sender.senders['email'].sent
+    assert message.to == 'ana@x.com'
+    assert message.key == f'case.rejected:{case_id}:email'
+    assert 'Ana' in message.body and 'Falta exame' in message.body
+    assert not sender.senders['sms'].sent
+
+
+async def test_transient_failure_waits_for_backoff_then_succeeds():
+    case_id, patient_id = await seed_case()
+    async with open_session() as db:
+        await enqueue_case_notification(db, 'case.paid', case_id, patient_id, request_type='receita')
+        await db.commit()
+
+    email = FlakySender('email', [ConnectionError('smtp fora do ar')])
+    sender = dispatcher(email=email)
+    await sender.drain()
+    [failed] = [n for n in await notifications() if n.channel == 'email']
+    assert (failed.status, failed.attempts) == ('pending', 1)
+    assert failed.next_attempt_at > datetime.utcnow()
+
+    assert await sender.drain() == 0  # ainda no backoff: ninguém pega de novo
+    async with open_session() as db:
+        row = await db.get(Notification, failed.id)
+        row.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        await db.commit()
+    assert await sender.drain() == 1
+    assert [n.status for n in await notifications()] == ['sent', 'sent']
+    assert len(email.sent) == 1
+
+
+async def test_permanent_failure_and_max_attempts_give_up():
+    case_id, patient_id = await seed_case()
+    async with open_session() as db:
+        await enqueue_case_notification(db, 'case.paid', case_id, patient_id, request_type='receita')
+        await db.commit()
+
+    sender = dispatcher(
+        email=FlakySender('email', [PermanentDeliveryError('caixa inexistente')]),
+        sms=FlakySender('sms', [ConnectionError('gateway fora do ar')]),
+        max_attempts=1,
+    )
+    await sender.drain()
+    assert {n.channel: (n.status, n.attempts) for n in await notifications()} == {
+        'email': ('failed', 1), 'sms': ('failed', 1),
+    }
@@ -0,0 +1,41 @@
+"""Retorno do checkout sem webhook: a transição de pagamento é um UPDATE condicional, sem conflito de versão."""
+import pytest
+from sqlalchemy import select, update
+
+import app.main
+from app.database import Case, open_session
+
+from .conftest import register_and_login
+
+
+@pytest.fixture
+def concurrent_bump(monkeypatch):
+    """Outro processo (worker de webhook, generate-pix) mexe no caso logo depois de a rota lê-lo."""
+    find_case = app.main.find_case
+
+    async def find_then_bump(db, **filters):
+        case = await find_case(db, **filters)
+        async with open_session() as other:
+            await other.execute(update(Case).where(Case.id == case.id).values(version=Case.version + 1))
+            await other.commit()
+        return case
+
+    monkeypatch.setattr(app.main, 'find_case', find_then_bump)
+
+
+async def load_case():
+    async with open_session() as db:
+        return await db.scalar(select(Case))
+
+
+@pytest.mark.anyio
+async def test_checkout_return_survives_a_concurrent_version_bump(client, concurrent_bump):
+    register_and_login(client, 'ana@x.com')
+    client.post('/patient/new-case', data=dict(request_type='receita'))
+
+    assert client.get('/patient/case/1/status?payment_status=pending').status_code == 200
+    assert client.get('/patient/case/1/status?payment_status=success').status_code == 200
+
+    case = await load_case()
+    assert (case.status, case.payment_status) == ('pending_review', 'paid')
+    assert case.paid_at is not None
@@ -0,0 +1,145 @@
+"""Cliente do Mercado Pago contra o servidor falso (benchmarks/fake_mercadopago.py), sem rede."""
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from app.config import MP_BREAKER_FAILURES, MP_MAX_RETRIES
+from app.payments import (
+    CHECKOUT_KEY_WINDOW, CircuitOpenError, MercadoPagoClient, MercadoPagoError, build_preference, checkout_attempt,
+)
+from benchmarks import fake_mercadopago
+
+pytestmark = pytest.mark.anyio
+
+
+class FaultyTransport(httpx.AsyncBaseTransport):
+    """Na frente do MP falso: as primeiras `failures` chamadas falham.
+
+    'down' nem chega ao MP (erro de conexão); 'lost' chega e o MP processa, mas a
+    resposta vira 503 (ex.: timeout no balanceador). `gate` segura as chamadas.
+    """
+
+    def __init__(self, failures: int = 0, mode: str = 'down', gate: asyncio.Event = None):
+        self.inner = httpx.ASGITransport(app=fake_mercadopago.app)
+        self.failures = failures
+        self.mode = mode
+        self.gate = gate
+        self.requests = []
+
+    async def handle_async_request(self, request):
+        self.requests.append(request)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.failures > 0:
+            self.failures -= 1
+            if self.mode == 'down':
+                raise httpx.ConnectError('MP fora do ar', request=request)
+            await self.inner.handle_async_request(request)
+            return httpx.Response(503, request=request)
+        return await self.inner.handle_async_request(request)
+
+
+@pytest.fixture(autouse=True)
+def fresh_fake_mp():
+    for store in (fake_mercadopago.app.state.preferences, fake_mercadopago.app.state.payments,
+                  fake_mercadopago.app.state.idempotency):
+        store.clear()
+
+
+def client_with(transport) -> MercadoPagoClient:
+    return MercadoPagoClient(base_url='http://fake-mp', access_token='fake', transport=transport)
+
+
+def preference():
+    return build_preference('Receita', 'ana@x.com', external_reference='1')
+
+
+async def test_transient_failures_are_retried():
+    transport = FaultyTransport(failures=MP_MAX_RETRIES, mode='down')
+    data = await client_with(transport).create_preference(preference())
+    assert data['init_point'].startswith('http://fake-mp/checkout/')
+    assert len(transport.requests) == MP_MAX_RETRIES + 1
+
+
+async def test_retried_preference_is_created_once():
+    # O MP criou a preferência mas a resposta se perdeu: a nova tentativa leva a mesma chave
+    transport = FaultyTransport(failures=1, mode='lost')
+    data = await client_with(transport).create_preference(preference())
+    keys = {request.headers['x-idempotency-key'] for request in transport.requests}
+    assert len(transport.requests) == 2 and len(keys) == 1
+    assert list(fake_mercadopago.app.state.preferences) == [data['id']]
+
+
+async def test_same_idempotency_key_returns_same_preference():
+    mp = client_with(FaultyTransport())
+    first = await mp.create_preference(preference(), idempotency_key='checkout-1-new')
+    second = await mp.create_preference(preference(), idempotency_key='checkout-1-new')
+    assert first['id'] == second['id']
+    assert len(fake_mercadopago.app.state.preferences) == 1
+
+
+async def test_post_without_idempotency_key_is_not_retried():
+    transport = FaultyTransport(failures=1, mode='lost')
+    with pytest.raises(MercadoPagoError):
+        await client_with(transport).request('POST', '/checkout/preferences', json=preference())
+    assert len(transport.requests) == 1
+
+
+async def test_breaker_opens_then_lets_a_single_probe_through():
+    transport = FaultyTransport(failures=10 ** 6, mode='down')
+    mp = client_with(transport)
+    while mp.breaker.state == 'closed':
+        with pytest.raises(MercadoPagoError):
+            await mp.get_payment('1')
+    assert mp.breaker.failures >= MP_BREAKER_FAILURES
+
+    # Aberto: falha rápido, sem chamar o MP
+    calls = len(transport.requests)
+    with pytest.raises(CircuitOpenError):
+        await mp.get_payment('1')
+    assert len(transport.requests) == calls
+
+    # Meio-aberto com o MP de volta: uma chamada de teste; as concorrentes falham rápido
+    mp.breaker.opened_at -= mp.breaker.reset_seconds
+    transport.failures = 0
+    transport.gate = asyncio.Event()
+    fake_mercadopago.app.state.payments['1'] = {'id': 1, 'status': 'approved', 'external_reference': '7'}
+    probe = asyncio.ensure_future(mp.get_payment('1'))
+    await asyncio.sleep(0)
+    try:
+        others = await asyncio.wait_for(
+            asyncio.gather(*(mp.get_payment('1') for _ in range(5)), return_exceptions=True), timeout=2
+        )
+    finally:
+        transport.gate.set()
+    assert all(isinstance(result, CircuitOpenError) for result in others)
+    assert (await asyncio.wait_for(probe, timeout=2))['status'] == 'approved'
+    assert len(transport.requests) == calls + 1
+    assert mp.breaker.state == 'closed'
+    await mp.aclose()
+
+
+async def test_failed_probe_reopens_the_breaker():
+    mp = client_with(FaultyTransport(failures=10 ** 6, mode='down'))
+    mp.breaker.failures = MP_BREAKER_FAILURES
+    mp.breaker.opened_at = 0.0  # há muito tempo: meio-aberto
+    assert mp.breaker.state == 'half_open'
+    with pytest.raises(MercadoPagoError):
+        await mp.get_payment('1')
+    assert mp.breaker.state == 'open'
+
+
+def test_checkout_key_is_stable_per_window_and_unique_per_case():
+    created = datetime(2026, 10, 17, 9, 0, 0, 123456)
+    now = datetime(2026, 10, 17, 10, 1)
+    key, expires_at = checkout_attempt(1, created, now, ttl_minutes=60)
+
+    # Outro clique (outro worker) na mesma janela: mesma chave e mesmo payload
+    assert checkout_attempt(1, created, now + timedelta(minutes=3), ttl_minutes=60) == (key, expires_at)
+    assert expires_at == datetime(2026, 10, 17, 11, 5)
+    # Janela seguinte: preferência nova
+    assert checkout_attempt(1, created, now + CHECKOUT_KEY_WINDOW, ttl_minutes=60)[0] != key
+    # Mesmo id depois de um reset, mas outro caso
+    assert checkout_attempt(1, created + timedelta(days=2), now, ttl_minutes=60)[0] != key
@@ -0,0 +1,67 @@
+"""Listagens não fazem uma consulta por caso (N+1): o número de SELECTs não depende de quantos casos há."""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.database import Case, SessionLocal, User, init_engines
+
+from .conftest import register_and_login, reset_db
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = init_engines()
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed_cases(doctor_email: str, n: int) -> int:
+    """`n` casos na fila e `n` revisados pelo médico, cada um de um paciente diferente. Devolve um da fila."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        doctor = db.query(User).filter_by(email=doctor_email).one()
+        patients = [User(email=f'seed{i}@x.com', full_name=f'Paciente {i}', user_type='patient') for i in range(2 * n)]
+        db.add_all(patients)
+        db.flush()
+        cases = [
+            Case(patient_id=patients[i].id, request_type='receita', status='pending_review',
+                 payment_status='paid', created_at=now - timedelta(minutes=i), paid_at=now)
+            for i in range(n)
+        ] + [
+            Case(patient_id=patients[n + i].id, doctor_id=doctor.id, request_type='relatorio', status='approved',
+                 payment_status='paid', created_at=now - timedelta(days=1), updated_at=now - timedelta(minutes=i))
+            for i in range(n)
+        ]
+        db.add_all(cases)
+        db.commit()
+        return cases[0].id
+
+
+def queries_for(client, n: int):
+    register_and_login(client, 'medico@x.com', 'doctor')
+    case_id = seed_cases('medico@x.com', n)
+    client.get('/')  # aquece o cache do usuário autenticado (não o das linhas renderizadas)
+    with count_queries() as dashboard:
+        response = client.get('/doctor/dashboard')
+        assert response.status_code == 200
+        assert response.text.count('Paciente ') >= 2 * n
+    with count_queries() as review:
+        assert client.get(f'/doctor/review-case/{case_id}').status_code == 200
+    return len(dashboard), len(review)
+
+
+def test_doctor_pages_query_count_does_not_grow_with_cases(client):
+    few = queries_for(client, 2)
+    reset_db()
+    client.cookies.clear()
+    many = queries_for(client, 15)  # ainda numa página só (CASE_PAGE_SIZE=20)
+    assert few == many
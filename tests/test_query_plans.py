@@ -0,0 +1,49 @@
+"""Planos das listagens de casos: nenhum SELECT em cases/cases_archive varre a tabela ou ordena sem índice.
+
+Mesma checagem de benchmarks/query_plans.py, no SQLite dos testes (EXPLAIN QUERY PLAN).
+"""
+import pytest
+from sqlalchemy import event
+
+from app.auth import create_access_token
+from app.database import SessionLocal, init_engines
+from benchmarks.query_plans import ROUTES, explain, full_scans, is_cases_select, seed
+
+
+@pytest.fixture
+def tokens():
+    with SessionLocal() as session:
+        doctor_email, patient_email = seed(session, n_cases=2000, n_patients=20)
+    with init_engines().begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+    return {
+        'doctor': create_access_token({'sub': doctor_email}),
+        'patient': create_access_token({'sub': patient_email}),
+    }
+
+
+@pytest.fixture
+def captured():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if is_cases_select(statement):
+            statements.append((statement, parameters))
+
+    engine = init_engines()
+    event.listen(engine, 'before_cursor_execute', capture)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', capture)
+
+
+@pytest.mark.parametrize('role, url', ROUTES)
+def test_listing_queries_use_indexes(client, tokens, captured, role, url):
+    client.cookies.set('access_token', f'Bearer {tokens[role]}')
+    assert client.get(url).status_code == 200
+    assert captured, 'nenhuma consulta em cases capturada'
+
+    engine = init_engines()
+    for statement, parameters in captured:
+        with engine.connect() as connection:
+            plan = explain(connection, statement, parameters)
+        assert not full_scans(plan), f'{url}: {statement}\n' + '\n'.join(plan)
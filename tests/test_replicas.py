@@ -0,0 +1,88 @@
+"""Réplicas de leitura: listagens vão para a réplica, exceto logo após uma escrita ou sem réplica saudável."""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from app.database import Base
+from app.replicas import STICKY_COOKIE, replica_pool
+
+from .conftest import register_and_login
+
+
+@pytest.fixture
+def use_replicas(tmp_path):
+    """Aponta o pool para as URLs dadas (réplica vazia: só o esquema); restaura no fim."""
+    saved = replica_pool.urls, replica_pool.weights, replica_pool.replicas
+
+    def configure(*urls, weights=None):
+        for url in urls:
+            if 'nonexistent' not in url:
+                Base.metadata.create_all(bind=create_engine(url))
+        replica_pool.urls = list(urls)
+        replica_pool.weights = weights or [1] * len(urls)
+        replica_pool.replicas = []
+        replica_pool.init()
+        return replica_pool.replicas
+
+    yield configure
+    for replica in replica_pool.replicas:
+        replica.engine.dispose()
+    replica_pool.urls, replica_pool.weights, replica_pool.replicas = saved
+
+
+def patient_case_count(client) -> int:
+    return len(client.get('/api/patient/cases').json()['items'])
+
+
+def test_reads_go_to_replica_and_stick_to_primary_after_a_write(client, use_replicas, tmp_path):
+    use_replicas(f'sqlite:///{tmp_path}/replica.db')
+    register_and_login(client, 'ana@x.com')
+
+    response = client.post('/patient/new-case', data=dict(request_type='receita'), follow_redirects=False)
+    assert response.status_code == 303
+    cookie = response.headers['set-cookie']
+    assert f'{STICKY_COOKIE}=1' in cookie and 'Max-Age=' in cookie and 'HttpOnly' in cookie
+
+    # Dentro da janela: primário (vê o caso recém-criado, inclusive na página de pagamento)
+    assert client.get(response.headers['location']).status_code == 200
+    assert patient_case_count(client) == 1
+
+    # Sem o cookie: a réplica (vazia neste teste) responde
+    client.cookies.delete(STICKY_COOKIE)
+    assert patient_case_count(client) == 0
+    assert STICKY_COOKIE not in client.get('/api/patient/cases').headers.get('set-cookie', '')
+
+
+def test_unhealthy_replica_falls_back_to_primary(client, use_replicas, tmp_path):
+    good, broken = use_replicas(f'sqlite:///{tmp_path}/replica.db', 'sqlite:////nonexistent/dir/replica.db')
+    client.portal.call(replica_pool.check)
+    assert good.healthy and not broken.healthy
+    assert all(replica_pool.choose() is good for _ in range(50))
+
+    good.healthy = False  # nenhuma saudável: tudo no primário
+    assert replica_pool.choose() is None
+    register_and_login(client, 'ana@x.com')
+    client.post('/patient/new-case', data=dict(request_type='receita'))
+    client.cookies.delete(STICKY_COOKIE)
+    assert patient_case_count(client) == 1
+
+
+def test_connection_error_takes_replica_out_of_rotation(client, use_replicas):
+    [broken] = use_replicas('sqlite:////nonexistent/dir/replica.db')
+    register_and_login(client, 'ana@x.com')
+    client.post('/patient/new-case', data=dict(request_type='receita'))
+    client.cookies.delete(STICKY_COOKIE)
+
+    with pytest.raises(OperationalError):
+        client.get('/api/patient/cases')
+    assert not broken.healthy
+    assert patient_case_count(client) == 1  # próxima leitura já vai para o primário
+
+
+def test_weights_choose_replicas_proportionally(use_replicas, tmp_path):
+    heavy, light, off = use_replicas(
+        f'sqlite:///{tmp_path}/a.db', f'sqlite:///{tmp_path}/b.db', f'sqlite:///{tmp_path}/c.db', weights=[3, 1, 0],
+    )
+    picks = [replica_pool.choose() for _ in range(4000)]
+    assert off not in picks
+    assert 2.4 < picks.count(heavy) / picks.count(light) < 3.8
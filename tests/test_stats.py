@@ -0,0 +1,77 @@
+"""Estatísticas: os deltas incrementais batem com o recálculo completo, e a reconciliação corrige deriva."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.database import CaseDailyStats, CaseReviewTimeBucket, CaseStatusCount, open_session
+from app.stats import case_stats, reconcile
+
+from .conftest import register_and_login
+
+pytestmark = pytest.mark.anyio
+
+
+async def aggregates():
+    """Linhas das três tabelas de agregados (sem as zeradas, que o recálculo não grava)."""
+    async with open_session() as db:
+        tables = {}
+        for model in (CaseStatusCount, CaseDailyStats, CaseReviewTimeBucket):
+            columns = [column for column in model.__table__.columns]
+            rows = (await db.execute(select(*columns))).all()
+            tables[model.__tablename__] = sorted(
+                tuple(round(v, 3) if isinstance(v, float) else v for v in row)
+                for row in rows if any(row[i] for i in range(len(columns)) if not columns[i].primary_key)
+            )
+        return tables
+
+
+async def full_recompute():
+    async with open_session() as db:
+        return await reconcile(db, None)
+
+
+async def summary():
+    today = datetime.utcnow().date()
+    async with open_session() as db:
+        return await case_stats(db, today, today)
+
+
+@pytest.fixture
+def reviewed_cases(client):
+    """Três casos: um aprovado, um rejeitado e um ainda aguardando pagamento."""
+    register_and_login(client, 'ana@x.com')
+    for request_type in ('receita', 'relatorio', 'receita'):
+        client.post('/patient/new-case', data=dict(request_type=request_type))
+    for case_id in (1, 2):
+        assert client.get(f'/patient/case/{case_id}/status?payment_status=success').status_code == 200
+    register_and_login(client, 'dr@x.com', user_type='doctor')
+    client.post('/doctor/review-case/1', data=dict(action='approve'), follow_redirects=False)
+    client.post('/doctor/review-case/2', data=dict(action='reject', rejection_reason='Foto ilegível'),
+                follow_redirects=False)
+
+
+async def test_incremental_counts_match_a_full_recompute(reviewed_cases):
+    incremental = await aggregates()
+    stats = await summary()
+    assert stats['cases_by_status'] == {'approved': 1, 'rejected': 1, 'pending_payment': 1}
+    assert (stats['created'], stats['paid'], stats['revenue'], stats['reviewed']) == (3, 2, 100.0, 2)
+    assert stats['review_time']['timed_reviews'] == 2
+
+    await full_recompute()
+    assert await aggregates() == incremental
+    assert await summary() == stats
+
+
+async def test_reconcile_repairs_drift(reviewed_cases):
+    expected = await aggregates()
+    async with open_session() as db:
+        # Escritas fora do app / deltas perdidos
+        await db.execute(update(CaseStatusCount).values(cases=CaseStatusCount.cases + 5))
+        await db.execute(delete(CaseDailyStats).where(CaseDailyStats.doctor_id != 0))
+        await db.execute(delete(CaseReviewTimeBucket))
+        await db.commit()
+    assert await aggregates() != expected
+
+    await full_recompute()
+    assert await aggregates() == expected
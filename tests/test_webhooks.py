@@ -0,0 +1,34 @@
+"""Assinatura do webhook do MP: HMAC do manifesto e `ts` dentro da tolerância (sem replay)."""
+import hashlib
+import hmac
+import time
+
+from app.webhooks import verify_signature
+from benchmarks.fake_mercadopago import signed_webhook
+
+SECRET = 'segredo'
+
+
+def signature(ts, payment_id='123', request_id='req-1'):
+    manifest = f'id:{payment_id};request-id:{request_id};ts:{ts};'
+    return f'ts={ts},v1={hmac.new(SECRET.encode(), manifest.encode(), hashlib.sha256).hexdigest()}'
+
+
+def test_fresh_notification_from_mp_is_accepted():
+    params, headers, _ = signed_webhook('123', SECRET)
+    assert verify_signature(headers['x-signature'], headers['x-request-id'], params['data.id'], SECRET)
+    assert not verify_signature(headers['x-signature'], headers['x-request-id'], '124', SECRET)
+
+
+def test_replayed_notification_is_rejected_after_the_tolerance():
+    now = time.time()
+    old = signature(int(now) - 301)
+    assert not verify_signature(old, 'req-1', '123', SECRET, tolerance=300, now=now)
+    assert verify_signature(old, 'req-1', '123', SECRET, tolerance=0, now=now)  # 0 desliga a checagem
+    assert not verify_signature(signature(int(now) + 301), 'req-1', '123', SECRET, tolerance=300, now=now)
+
+
+def test_timestamp_in_milliseconds_is_accepted():
+    now = time.time()
+    assert verify_signature(signature(int(now * 1000) - 5000), 'req-1', '123', SECRET, tolerance=300, now=now)
+    assert not verify_signature(signature(int(now * 1000) - 400000), 'req-1', '123', SECRET, tolerance=300, now=now)
@@ -0,0 +1,98 @@
+"""Fila de revisão: reserva exclusiva por médico, reserva vencida volta para a fila, revisão só de quem reservou."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.database import Case, User, open_session
+from app.work_queue import claim_case, claim_next_cases, complete_review, release_case
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed(cases=1):
+    async with open_session() as db:
+        patient = User(email='ana@x.com', full_name='Ana Souza', user_type='patient')
+        doctors = [User(email=f'dr{i}@x.com', full_name=f'Dr. {i}', user_type='doctor') for i in (1, 2)]
+        db.add_all([patient, *doctors])
+        await db.flush()
+        db.add_all([
+            Case(patient_id=patient.id, request_type='receita', status='pending_review',
+                 created_at=datetime(2026, 1, 1) + timedelta(minutes=i))
+            for i in range(cases)
+        ])
+        await db.commit()
+        return [doctor.id for doctor in doctors]
+
+
+async def load_case(case_id=1):
+    async with open_session() as db:
+        return await db.scalar(select(Case).where(Case.id == case_id))
+
+
+async def test_two_doctors_cannot_claim_the_same_case():
+    first, second = await seed()
+    async with open_session() as db:
+        assert await claim_case(db, first, 1)
+        assert not await claim_case(db, second, 1)
+        assert await claim_case(db, first, 1)  # renovar a própria reserva
+    assert (await load_case()).claimed_by_id == first
+
+
+async def test_concurrent_claims_get_disjoint_cases():
+    first, second = await seed(cases=3)
+
+    async def claim(doctor_id):
+        async with open_session() as db:
+            return [case.id for case in await claim_next_cases(db, doctor_id, batch=2)]
+
+    a, b = await asyncio.gather(claim(first), claim(second))
+    assert sorted(a + b) == [1, 2, 3]
+    assert not set(a) & set(b)
+
+
+async def test_stale_version_loses_the_optimistic_claim():
+    first, second = await seed()
+    async with open_session() as db:
+        # Outro médico reserva entre a leitura dos candidatos e o UPDATE condicional
+        original = db.execute
+
+        async def execute(stmt, *args, **kwargs):
+            if getattr(stmt, 'is_update', False):
+                async with open_session() as other:
+                    assert await claim_case(other, second, 1)
+            return await original(stmt, *args, **kwargs)
+
+        db.execute = execute
+        assert await claim_next_cases(db, first) == []
+    assert (await load_case()).claimed_by_id == second
+
+
+async def test_expired_lease_goes_back_to_the_queue():
+    first, second = await seed()
+    async with open_session() as db:
+        assert await claim_case(db, first, 1)
+        await db.execute(update(Case).values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+        assert [case.id for case in await claim_next_cases(db, second)] == [1]
+        assert not await claim_case(db, first, 1)
+    assert (await load_case()).claimed_by_id == second
+
+
+async def test_only_the_lease_holder_completes_the_review():
+    first, second = await seed()
+    async with open_session() as db:
+        assert await claim_case(db, first, 1)
+        assert not await complete_review(db, second, 1, 'approved')
+        await db.rollback()
+        assert not await release_case(db, second, 1)
+
+        assert await complete_review(db, first, 1, 'rejected', 'Foto ilegível')
+        await db.commit()
+        assert not await complete_review(db, first, 1, 'approved')  # já revisado
+
+    case = await load_case()
+    assert (case.status, case.doctor_id, case.rejection_reason, case.claimed_by_id) == (
+        'rejected', first, 'Foto ilegível', None,
+    )